@@ -39,3 +39,7 @@ personal_mac_path = r"/Users/wanghuihui/QuantsProject/ss_property"
 personal_property_file = r"personal_property.txt"
 
 
+######################  本地 Parquet 缓存 留存地址  #############################
+cache_window_path = r"F:\QDatas\parquet_cache"
+cache_linux_path = r"/opt/QDatas/parquet_cache"
+cache_mac_path = r"/Users/wanghuihui/QuantsProject/parquet_cache"
@@ -1,15 +1,30 @@
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, event, bindparam
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from concurrent.futures import ThreadPoolExecutor
 import gc
 import traceback  # 用于打印详细的错误堆栈
 import pandas as pd
 import numpy as np
+import csv
+import hashlib
+import io
 import logging
+import json
+import os
+import pickle
+import tempfile
+import threading
 import time
+import uuid
+from collections import OrderedDict
+import pymysql
 
 import CommonProperties.Base_Properties as base_properties
+from CommonProperties.Table_Schema import apply_table_dtypes
 
 ###################  mysql 配置   ######################
 local_user = base_properties.local_mysql_user
@@ -23,6 +38,185 @@ origin_database = base_properties.origin_mysql_database
 origin_host = base_properties.origin_mysql_host
 
 
+###################  连接池配置   ######################
+# 进程内按 (user, host:port, database, 完整 URL) 复用 engine，避免每次调用都重新做 TCP + 认证握手
+POOL_CONFIG = {
+    'pool_size': 10,          # 常驻连接数
+    'max_overflow': 20,       # 允许临时溢出的连接数
+    'pool_recycle': 3600,     # 连接最长存活秒数，避免被服务端 wait_timeout 断开
+    'pool_pre_ping': True,    # 取连接前先 ping 一次，自动剔除失效连接
+    'pool_timeout': 30,       # 连接池耗尽时的最长等待秒数
+}
+
+_engine_registry = {}
+_pool_stats = {}
+_registry_lock = threading.Lock()
+
+
+class _StatsQueuePool(QueuePool):
+    """在 QueuePool 的基础上统计取连接时的排队等待次数和等待耗时，只用连接池的公开接口判断是否已满"""
+
+    stats = None
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        self.overflow_limit = max_overflow
+
+    def connect(self):
+        # 借出的连接数已到 pool_size + max_overflow，本次取连接只能排队等待归还
+        must_wait = (self.overflow_limit > -1
+                     and self.checkedout() >= self.size() + self.overflow_limit)
+        if not must_wait or self.stats is None:
+            return super().connect()
+
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            with _registry_lock:
+                self.stats['waits'] += 1
+                self.stats['wait_time'] += time.perf_counter() - start
+
+    def recreate(self):
+        # engine.dispose() 会重建连接池，统计字典要跟着带过去
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def configure_pool(**pool_kwargs):
+    """
+    修改连接池的默认配置，只对之后新建的 engine 生效
+    Args:
+        **pool_kwargs: pool_size / max_overflow / pool_recycle / pool_pre_ping / pool_timeout
+    """
+    unknown = set(pool_kwargs) - set(POOL_CONFIG)
+    if unknown:
+        raise ValueError(f"不支持的连接池参数: {sorted(unknown)}")
+    POOL_CONFIG.update(pool_kwargs)
+
+
+def _create_pooled_engine(key, db_url, **pool_kwargs):
+    """新建带统计的 engine，并挂上建连耗时 / 借出次数的事件监听"""
+    options = dict(POOL_CONFIG)
+    options.update(pool_kwargs)
+
+    stats = {'checkouts': 0, 'checkins': 0, 'waits': 0, 'wait_time': 0.0, 'connects': 0, 'connect_time': 0.0}
+    engine = create_engine(db_url, poolclass=_StatsQueuePool, **options)
+    engine.pool.stats = stats
+
+    @event.listens_for(engine, 'do_connect')
+    def _before_connect(dialect, conn_rec, cargs, cparams):
+        conn_rec.info['connect_start'] = time.perf_counter()
+
+    @event.listens_for(engine, 'connect')
+    def _after_connect(dbapi_connection, connection_record):
+        start = connection_record.info.pop('connect_start', None)
+        with _registry_lock:
+            stats['connects'] += 1
+            if start is not None:
+                stats['connect_time'] += time.perf_counter() - start
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _registry_lock:
+            stats['checkouts'] += 1
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        with _registry_lock:
+            stats['checkins'] += 1
+
+    _pool_stats[key] = stats
+    logging.info(f"创建 mysql 连接池: {_pool_name(key)}，配置 {options}")
+    return engine
+
+
+def _engine_key(db_url, *extra):
+    """注册表的 key：(user, host:port, database, 完整 URL, ...)，端口、驱动、密码或查询参数不同的 URL 各自建池"""
+    url = make_url(db_url)
+    if url.host and url.port is None:
+        url = url.set(port=3306)
+    return (url.username, f"{url.host}:{url.port}", url.database,
+            url.render_as_string(hide_password=False)) + extra
+
+
+def _pool_name(key):
+    # 统计里展示的名字隐藏密码
+    name = make_url(key[3]).render_as_string(hide_password=True).split('://', 1)[-1]
+    if len(key) > 4:
+        name += '+' + '+'.join(key[4:])
+    return name
+
+
+def _get_or_create_engine(key, db_url, **pool_kwargs):
+    engine = _engine_registry.get(key)
+    if engine is not None:
+        return engine
+    with _registry_lock:
+        engine = _engine_registry.get(key)
+        if engine is None:
+            engine = _create_pooled_engine(key, db_url, **pool_kwargs)
+            _engine_registry[key] = engine
+    return engine
+
+
+def get_engine(user, password, host, database='quant', local_infile=False, **pool_kwargs):
+    """
+    获取进程内共享的 engine，同一连接 URL 只建一次连接池
+    Args:
+        user:          数据库用户名
+        password:      数据库密码
+        host:          数据库主机
+        database:      数据库名称
+        local_infile:  是否开启客户端 LOAD DATA LOCAL INFILE，开启的连接单独建池
+        **pool_kwargs: 覆盖 POOL_CONFIG 的连接池参数，仅在首次创建该 engine 时生效
+    Returns:
+        engine: SQLAlchemy Engine
+    """
+    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
+    key = _engine_key(db_url)
+    if local_infile:
+        key += ('local_infile',)
+        pool_kwargs['connect_args'] = {'local_infile': True}
+    return _get_or_create_engine(key, db_url, **pool_kwargs)
+
+
+def get_engine_by_url(db_url, **pool_kwargs):
+    """
+    按连接 URL 获取共享 engine，与 get_engine 共用同一个注册表，key 含端口和完整 URL
+    """
+    return _get_or_create_engine(_engine_key(db_url), db_url, **pool_kwargs)
+
+
+def get_pool_stats():
+    """
+    返回各连接池的统计信息
+    Returns:
+        dict: {'user:***@host:port/database': {checkouts, checkins, waits, wait_time, connects, connect_time,
+                                               pool_size, checked_out, overflow}}
+    """
+    result = {}
+    with _registry_lock:
+        for key, engine in _engine_registry.items():
+            stats = dict(_pool_stats.get(key, {}))
+            stats['pool_size'] = engine.pool.size()
+            stats['checked_out'] = engine.pool.checkedout()
+            stats['overflow'] = engine.pool.overflow()
+            result[_pool_name(key)] = stats
+    return result
+
+
+def dispose_engines():
+    """
+    关闭并清空所有共享 engine（进程退出前或 fork 子进程后调用）
+    """
+    with _registry_lock:
+        for engine in _engine_registry.values():
+            engine.dispose()
+        _engine_registry.clear()
+        _pool_stats.clear()
+
 
 def check_data_written(total_rows, table_name, engine):
     """
@@ -54,35 +248,358 @@ def check_data_written(total_rows, table_name, engine):
         return False
 
 
+###################  LOAD DATA LOCAL INFILE   ######################
+# 服务端 / 客户端禁用 local infile 时返回的错误码
+_LOCAL_INFILE_DISABLED_CODES = {1148, 2068, 3948}
+# 已确认不支持 local infile 的 host，后续调用直接走 insert
+_local_infile_disabled = set()
+
+
+def _dataframe_to_csv_bytes(df):
+    """把 DataFrame 序列化成 LOAD DATA 可识别的 CSV：逗号分隔、双引号包裹、NULL 表示空值"""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(int)
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, na_rep='NULL',
+              quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+    return buffer.getvalue().encode('utf-8')
+
+
+def _execute_load_data(engine, table_name, columns, payload, mode):
+    """执行一次 LOAD DATA LOCAL INFILE，返回影响行数"""
+    load_sql_template = f"""
+    LOAD DATA LOCAL INFILE '{{filename}}' {mode.upper()} INTO TABLE {table_name}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+    LINES TERMINATED BY '\\n'
+    ({', '.join(columns)})
+    """
+
+    # CSV 写到本进程独占的临时文件，由 pymysql 按原生 LOCAL INFILE 流程读取发送，不改动 pymysql 内部函数
+    with tempfile.NamedTemporaryFile(prefix='quant_infile_', suffix='.csv', delete=False) as tmp:
+        tmp.write(payload)
+    filename = tmp.name.replace('\\', '/').replace("'", "\\'")
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(load_sql_template.format(filename=filename))
+        affected = cursor.rowcount
+        cursor.close()
+        connection.commit()
+        return affected
+    finally:
+        connection.close()
+        os.remove(tmp.name)
+
+
+def _write_by_load_data(user, password, host, database, df, table_name, mode, batch_size):
+    """
+    用 LOAD DATA LOCAL INFILE 分批写入
+    Returns:
+        int:  写入行数
+        None: 服务端 / 客户端不允许 local infile，调用方需退回普通 insert
+    """
+    if host in _local_infile_disabled:
+        return None
+
+    engine = get_engine(user, password, host, database, local_infile=True)
+    columns = df.columns.tolist()
+    total_rows = len(df)
+
+    inserted = 0
+    for i in range(0, total_rows, batch_size):
+        payload = _dataframe_to_csv_bytes(df.iloc[i:i + batch_size])
+        try:
+            inserted += _execute_load_data(engine, table_name, columns, payload, mode)
+        except (pymysql.err.OperationalError, pymysql.err.InternalError, pymysql.err.NotSupportedError) as e:
+            if i == 0 and e.args and e.args[0] in _LOCAL_INFILE_DISABLED_CODES:
+                _local_infile_disabled.add(host)
+                logging.warning(f"{host} 不允许 LOAD DATA LOCAL INFILE({e.args[0]})，退回 INSERT 写入 {table_name}")
+                return None
+            raise
+
+    return inserted
+
+
+_WRITE_MODES = {
+    'ignore': 'INSERT IGNORE INTO',   # 唯一键冲突时保留表里的旧行
+    'replace': 'REPLACE INTO',        # 唯一键冲突时先删后插，用新行整体覆盖
+    'upsert': 'INSERT INTO',          # 唯一键冲突时 ON DUPLICATE KEY UPDATE 原地更新非键字段
+}
+
+
+def _build_write_sql(mode, table_name, columns, key_cols=None):
+    """
+    生成写入语句的头尾两部分，中间拼 VALUES 行即可
+    Returns:
+        (head, tail): head 形如 'INSERT INTO t (a, b) VALUES '，tail 为 upsert 的 ON DUPLICATE KEY UPDATE 子句
+    """
+    prefix = _WRITE_MODES[mode]
+    tail = ''
+    if mode == 'upsert':
+        update_cols = [col for col in columns if col not in (key_cols or [])]
+        if update_cols:
+            tail = " ON DUPLICATE KEY UPDATE " + ", ".join([f"{col} = VALUES({col})" for col in update_cols])
+        else:
+            # 只有键字段时没有可更新的列，等价于 INSERT IGNORE
+            prefix = _WRITE_MODES['ignore']
+    head = f"{prefix} {table_name} ({', '.join(columns)}) VALUES "
+    return head, tail
+
+
+def _normalize_key_column(series, col):
+    """把键字段统一成可比较的类型：ymd 统一为日期，其他转字符串"""
+    if col == 'ymd':
+        return pd.to_datetime(series.astype(str).str.replace('-', '').str[:8], format='%Y%m%d')
+    return series.astype(str)
+
+
+def _filter_changed_rows(engine, df, table_name, key_cols, rtol=1e-5):
+    """
+    只保留表中不存在、或任一非键字段取值有变化的行
+    按 df 中出现的 ymd 把现有数据读回来比对，数值列按相对误差比较，避免 FLOAT 精度造成误判
+    """
+    if 'ymd' not in key_cols:
+        logging.warning(f"{table_name} 的唯一键不含 ymd，跳过变化比对，全部写入")
+        return df
+
+    compare_cols = [col for col in df.columns if col not in key_cols]
+    ymds = _normalize_key_column(df['ymd'], 'ymd').dt.strftime('%Y-%m-%d').unique().tolist()
+    query = text(f"SELECT {', '.join(key_cols + compare_cols)} FROM {table_name} WHERE ymd IN :ymds")
+    query = query.bindparams(bindparam('ymds', expanding=True))
+    existing = pd.read_sql(query, engine, params={'ymds': ymds})
+    if existing.empty:
+        return df
+
+    left = df[key_cols + compare_cols].copy()
+    for col in key_cols:
+        left[col] = _normalize_key_column(left[col], col)
+        existing[col] = _normalize_key_column(existing[col], col)
+
+    merged = left.merge(existing, on=key_cols, how='left', suffixes=('', '__db'), indicator=True)
+    changed = (merged['_merge'] == 'left_only').to_numpy().copy()
+    for col in compare_cols:
+        new_values = merged[col]
+        old_values = merged[f"{col}__db"]
+        both_null = (new_values.isna() & old_values.isna()).to_numpy()
+        new_numeric = pd.to_numeric(new_values, errors='coerce')
+        old_numeric = pd.to_numeric(old_values, errors='coerce')
+        if new_numeric.notna().sum() == new_values.notna().sum():
+            same = np.isclose(new_numeric.to_numpy(dtype=float), old_numeric.to_numpy(dtype=float),
+                              rtol=rtol, equal_nan=True)
+        else:
+            same = (new_values.astype(str) == old_values.astype(str)).to_numpy()
+        changed |= ~(same | both_null)
+
+    logging.info(f"{table_name} 变化比对：{len(df)} 行中 {int(changed.sum())} 行新增或有变化")
+    return df.loc[changed]
+
+
+###################  多行 VALUES 写入   ######################
+# host -> max_allowed_packet
+_max_packet_cache = {}
+# table_name -> {'rows': 累计写入行数, 'seconds': 累计耗时, 'statements': 语句数}
+_write_stats = {}
+
+
+def _get_max_allowed_packet(engine):
+    host = engine.url.host
+    if host not in _max_packet_cache:
+        with engine.connect() as conn:
+            _max_packet_cache[host] = int(conn.exec_driver_sql("SELECT @@max_allowed_packet").scalar())
+    return _max_packet_cache[host]
+
+
+def _column_to_sql_literals(series):
+    """
+    把一列转换成 SQL 字面量字符串数组，数值 / 日期列整列向量化处理，空值统一为 NULL
+    """
+    values = series.to_numpy()
+
+    if pd.api.types.is_bool_dtype(series):
+        literals = values.astype(np.int8).astype(str).astype(object)
+    elif pd.api.types.is_integer_dtype(series):
+        literals = values.astype(str).astype(object)
+    elif pd.api.types.is_float_dtype(series):
+        literals = values.astype(str).astype(object)
+        literals[~np.isfinite(values)] = 'NULL'
+        return literals
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        values = values.astype('datetime64[s]')
+        unit = 'D' if (values == values.astype('datetime64[D]')).all() else 's'
+        literals = np.char.replace(np.datetime_as_string(values, unit=unit), 'T', ' ')
+        literals = np.char.add(np.char.add("'", literals), "'").astype(object)
+        literals[np.isnat(values)] = 'NULL'
+        return literals
+    else:
+        # 字符串 / Decimal / datetime.date 等对象列交给 pymysql 转义
+        mask = pd.isna(series).to_numpy()
+        literals = np.full(len(values), 'NULL', dtype=object)
+        literals[~mask] = [pymysql.converters.escape_item(v, 'utf8mb4') for v in values[~mask]]
+        return literals
+
+    if series.hasnans:
+        literals[pd.isna(series).to_numpy()] = 'NULL'
+    return literals
+
+
+def _dataframe_to_value_rows(df):
+    """把 DataFrame 拼成 '(v1,v2,...)' 形式的行字符串数组，按列拼接，不逐行构造字典"""
+    rows = None
+    for col in df.columns:
+        literals = _column_to_sql_literals(df[col])
+        rows = literals if rows is None else rows + ',' + literals
+    return '(' + rows + ')'
+
+
+def _write_by_values(user, password, host, database, df, table_name, mode, key_cols=None,
+                     packet_ratio=0.8, backoff_factor=3.0, max_backoff=2.0, engine=None):
+    """
+    多行 INSERT ... VALUES (...),(...) 写入
+    每条语句按字节累计切分，保证不超过 max_allowed_packet * packet_ratio；
+    根据每行的实际耗时做背压：最近耗时明显高于历史最快水平时，按差值短暂休眠，让服务端缓一缓
+    Returns:
+        int: 影响行数
+    """
+    engine = engine or get_engine(user, password, host, database)
+    header, tail = _build_write_sql(mode, table_name, df.columns.tolist(), key_cols)
+    budget = int(_get_max_allowed_packet(engine) * packet_ratio) - len((header + tail).encode('utf-8'))
+
+    rows = _dataframe_to_value_rows(df)
+    # 每行字节数（+1 为行间逗号），累加后用二分查找切出每条语句的行区间
+    row_bytes = np.fromiter((len(r.encode('utf-8')) + 1 for r in rows), dtype=np.int64, count=len(rows))
+    cum_bytes = np.cumsum(row_bytes)
+
+    inserted = 0
+    statements = 0
+    ewma_cost = None
+    best_cost = None
+    write_start = time.perf_counter()
+
+    start = 0
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        while start < len(rows):
+            base = cum_bytes[start - 1] if start > 0 else 0
+            end = max(int(np.searchsorted(cum_bytes, base + budget, side='right')), start + 1)
+
+            stmt_start = time.perf_counter()
+            cursor.execute(header + ','.join(rows[start:end]) + tail)
+            connection.commit()
+            latency = time.perf_counter() - stmt_start
+
+            inserted += cursor.rowcount
+            statements += 1
+
+            # 以单行耗时衡量服务端压力
+            cost = latency / (end - start)
+            best_cost = cost if best_cost is None else min(best_cost, cost)
+            ewma_cost = cost if ewma_cost is None else 0.3 * cost + 0.7 * ewma_cost
+            if ewma_cost > best_cost * backoff_factor:
+                time.sleep(min((ewma_cost - best_cost) * (end - start), max_backoff))
+
+            start = end
+        cursor.close()
+    finally:
+        connection.close()
+
+    elapsed = time.perf_counter() - write_start
+    stats = _write_stats.setdefault(table_name, {'rows': 0, 'bytes': 0, 'seconds': 0.0, 'statements': 0})
+    stats['rows'] += len(rows)
+    stats['bytes'] += int(cum_bytes[-1]) if len(rows) else 0
+    stats['seconds'] += elapsed
+    stats['statements'] += statements
+    rate = len(rows) / elapsed if elapsed > 0 else float('inf')
+    logging.info(f"{table_name} 多行 VALUES 写入 {len(rows)} 行，{statements} 条语句，{rate:.0f} 行/秒")
+    return inserted
+
+
+def get_write_stats():
+    """
+    返回各表通过多行 VALUES 方式写入的累计统计
+    Returns:
+        dict: {table_name: {rows, bytes, seconds, statements, rows_per_sec}}
+    """
+    result = {}
+    for table_name, stats in _write_stats.items():
+        stats = dict(stats)
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        result[table_name] = stats
+    return result
+
+
 def data_from_dataframe_to_mysql(user, password, host, database='quant', df=pd.DataFrame(), table_name='', merge_on=[],
-                                 batch_size=20000):
+                                 batch_size=20000, mode='ignore', method='insert', changed_only=False):
     """
     把 dataframe 类型数据分批写入 mysql 表里面，避免锁表
+    Args:
+        merge_on:   写入前按这些字段去重
+        batch_size: 每批行数
+        mode:       'ignore'  唯一键冲突时保留旧行
+                    'replace' 唯一键冲突时用新行覆盖
+                    'upsert'  按表的唯一键 INSERT ... ON DUPLICATE KEY UPDATE，重跑某天时无需先 DELETE
+        method:     'insert'    参数化批量 INSERT
+                    'load_data' 内存中生成 CSV 走 LOAD DATA LOCAL INFILE，服务端不允许时自动退回 insert
+                    'values'    按列向量化拼接多行 VALUES，语句大小自适应 max_allowed_packet，按耗时背压
+        changed_only: 仅 upsert 模式有效，先与表中现有数据比对，只写入新增或取值有变化的行
+    Returns:
+        int: 影响行数
     """
+    if mode not in _WRITE_MODES:
+        raise ValueError(f"不支持的写入模式: {mode}")
+    if method not in ('insert', 'load_data', 'values'):
+        raise ValueError(f"不支持的写入方式: {method}")
+
     if df.empty:
         logging.info(f"DataFrame为空，跳过插入 {table_name}")
         return 0
 
     # 数据处理
-    df = df.replace({np.nan: None})
     if merge_on:
         df = df.drop_duplicates(subset=merge_on, keep='first')
 
+    key_cols = None
+    if mode == 'upsert':
+        engine = get_engine(user, password, host, database)
+        key_cols = get_unique_key(engine, table_name)
+        if not key_cols:
+            raise ValueError(f"{table_name} 没有唯一键，无法使用 upsert 模式")
+        if changed_only:
+            df = _filter_changed_rows(engine, df, table_name, key_cols)
+        if method == 'load_data':
+            # LOAD DATA 不支持 ON DUPLICATE KEY UPDATE，upsert 改走多行 VALUES
+            method = 'values'
+
     total_rows = len(df)
     if total_rows == 0:
         return 0
 
+    if method == 'load_data':
+        # LOAD DATA 单批可以更大，按 10 倍 batch_size 切分
+        inserted = _write_by_load_data(user, password, host, database, df, table_name, mode, batch_size * 10)
+        if inserted is not None:
+            logging.info(f"完成：LOAD DATA 共写入 {inserted} 条到 {table_name}")
+            return inserted
+
+    if method == 'values':
+        inserted = _write_by_values(user, password, host, database, df, table_name, mode, key_cols)
+        logging.info(f"完成：共插入 {inserted} 条到 {table_name}")
+        return inserted
+
+    df = df.replace({np.nan: None})
+
     # 分批插入
-    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
-    engine = create_engine(db_url)
+    engine = get_engine(user, password, host, database)
     columns = df.columns.tolist()
 
     # 修复1: 使用 :col_name 格式的占位符
     placeholders = ', '.join([f':{col}' for col in columns])
-    insert_sql = f"""
-    INSERT IGNORE INTO {table_name} ({', '.join(columns)})
-    VALUES ({placeholders})
-    """
+    head, tail = _build_write_sql(mode, table_name, columns, key_cols)
+    insert_sql = f"{head}({placeholders}){tail}"
 
     inserted = 0
     for i in range(0, total_rows, batch_size):
@@ -99,69 +616,186 @@ def data_from_dataframe_to_mysql(user, password, host, database='quant', df=pd.D
         if i + batch_size >= total_rows:
             logging.info(f"该批次已处理 {total_rows} 条，累计插入 {inserted} 条")
 
-    engine.dispose()
     logging.info(f"完成：共插入 {inserted} 条到 {table_name}")
     return inserted
 
 
-def data_from_mysql_to_dataframe(user, password, host, database='quant', table_name='', start_date=None, end_date=None, cols=None):
+_unique_key_cache = {}
+
+
+def get_unique_key(engine, table_name):
     """
-    从 MySQL 表中读取数据到 DataFrame，同时进行最终的数据完整性检查和日志记录
+    查询表的唯一键字段（优先主键），结果按 (host, database, table) 缓存
     Args:
-        table_name: MySQL 表名
-        database: 数据库名称
-        start_date: 起始日期
-        end_date: 结束日期
-        cols: 要选择的字段列表
-
+        engine:     查询引擎
+        table_name: 表名
     Returns:
-        df: 读取到的 DataFrame
+        list: 唯一键字段列表，表上没有唯一键时返回 []
     """
+    cache_key = (engine.url.host, engine.url.database, table_name)
+    if cache_key in _unique_key_cache:
+        return _unique_key_cache[cache_key]
 
-    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
-    engine = create_engine(db_url)
+    index_df = pd.read_sql(text(f"SHOW INDEX FROM {table_name} WHERE Non_unique = 0"), engine)
+    key_cols = []
+    if not index_df.empty:
+        # SHOW INDEX 的列名在不同版本里大小写不一致，统一转小写
+        index_df.columns = [c.lower() for c in index_df.columns]
+        key_names = index_df['key_name'].unique().tolist()
+        key_name = 'PRIMARY' if 'PRIMARY' in key_names else key_names[0]
+        key_cols = index_df[index_df['key_name'] == key_name].sort_values('seq_in_index')['column_name'].tolist()
 
-    # 构建 SELECT 语句
-    if cols:
-        selected_cols = ', '.join(cols)
-    else:
-        selected_cols = '*'
+    _unique_key_cache[cache_key] = key_cols
+    return key_cols
+
+
+def iter_mysql_to_dataframe(user, password, host, database='quant', table_name='', start_date=None, end_date=None,
+                            cols=None, chunk_size=50000, key_cols=None, server_side=False, stock_codes=None):
+    """
+    以生成器方式分块读取 MySQL 表，每次 yield 一个 DataFrame
+    默认按表的唯一键（如 (ymd, stock_code)）做 keyset 分页：每页从上一页最后一行的键值之后开始查，
+    不再用 LIMIT/OFFSET 反复扫描已跳过的行，也不会因为并发写入导致页与页之间重叠或漏行
+    Args:
+        table_name:  MySQL 表名
+        database:    数据库名称
+        start_date:  起始日期
+        end_date:    结束日期
+        cols:        要选择的字段列表
+        chunk_size:  每块行数
+        key_cols:    keyset 分页使用的有序唯一键，默认自动读取表的唯一键
+        server_side: True 时使用服务端游标(SSCursor)单次扫描，按 chunk_size 流式取回，内存占用固定
+                     表上没有唯一键时也会自动走这种方式
+        stock_codes: 只读取这些股票（stock_code IN ...，在服务端过滤），None 表示不限
+    Yields:
+        DataFrame: 数据块
+    """
+    engine = get_engine(user, password, host, database)
 
     # 构建 WHERE 条件
     where_conditions = []
+    params = {}
     if start_date:
-        where_conditions.append(f"ymd >= '{start_date}'")
+        where_conditions.append("ymd >= :start_date")
+        params['start_date'] = start_date
     if end_date:
-        where_conditions.append(f"ymd <= '{end_date}'")
-
-    where_clause = " AND ".join(where_conditions)
-
-    # 读取 MySQL 表中的记录总数
-    query_total = f"SELECT COUNT(*) FROM {table_name}"
-    if where_clause:
-        query_total += f" WHERE {where_clause}"
-    total_rows = pd.read_sql(query_total, engine).iloc[0, 0]
+        where_conditions.append("ymd <= :end_date")
+        params['end_date'] = end_date
+    if stock_codes is not None:
+        where_conditions.append("stock_code IN :stock_codes")
+        params['stock_codes'] = [str(code) for code in stock_codes]
+
+    def to_text(query):
+        query = text(query)
+        return query.bindparams(bindparam('stock_codes', expanding=True)) if stock_codes is not None else query
+
+    if key_cols is None and not server_side:
+        key_cols = get_unique_key(engine, table_name)
+    key_cols = list(key_cols or [])
+
+    # 构建 SELECT 语句，keyset 分页需要把键字段一起查出来
+    extra_cols = [c for c in key_cols if cols and c not in cols]
+    selected_cols = ', '.join(list(cols) + extra_cols) if cols else '*'
+
+    if server_side or not key_cols:
+        query = f"SELECT {selected_cols} FROM {table_name}"
+        if where_conditions:
+            query += " WHERE " + " AND ".join(where_conditions)
+
+        with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+            for chunk in pd.read_sql(to_text(query), conn, params=params, chunksize=chunk_size):
+                yield chunk
+        return
+
+    # keyset 条件: (k0 > :k0) OR (k0 = :k0 AND k1 > :k1) OR ...，展开写法能走唯一索引
+    seek_terms = []
+    for i, col in enumerate(key_cols):
+        equals = [f"{prev} = :key_{j}" for j, prev in enumerate(key_cols[:i])]
+        seek_terms.append("(" + " AND ".join(equals + [f"{col} > :key_{i}"]) + ")")
+    seek_clause = "(" + " OR ".join(seek_terms) + ")"
+    order_clause = ', '.join(key_cols)
+
+    last_key = None
+    while True:
+        conditions = list(where_conditions)
+        page_params = dict(params)
+        if last_key is not None:
+            conditions.append(seek_clause)
+            page_params.update({f"key_{i}": v for i, v in enumerate(last_key)})
+
+        query = f"SELECT {selected_cols} FROM {table_name}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {order_clause} LIMIT {chunk_size}"
+
+        chunk = pd.read_sql(to_text(query), engine, params=page_params)
+        if chunk.empty:
+            break
+
+        last_key = tuple(chunk[key_cols].iloc[-1].tolist())
+        rows = len(chunk)
+        if extra_cols:
+            chunk = chunk.drop(columns=extra_cols)
+        yield chunk
+
+        if rows < chunk_size:
+            break
+
+
+def data_from_mysql_to_dataframe(user, password, host, database='quant', table_name='', start_date=None, end_date=None, cols=None,
+                                 chunk_size=50000, server_side=False, typed=False, compact=False, use_cache=None,
+                                 stock_codes=None):
+    """
+    从 MySQL 表中读取数据到 DataFrame，分块读取由 iter_mysql_to_dataframe 完成，最后只拼接一次
+    typed=True 时按建表 SQL 注册表做无损类型转换（见 Table_Schema）：ymd 为 datetime64[ns]，小数为 float64，成交量为 int64
+    compact=True 时再把价格降为 float32、stock_code 转分类，只用于只读的大区间分析，读出后要写回库的路径不要打开
+    热点表（见 Parquet_Cache.CACHE_CONFIG）从本地 Parquet 缓存读取，只从 MySQL 增量拉取缺失或变化的交易日
+    Args:
+        table_name:  MySQL 表名
+        database:    数据库名称
+        start_date:  起始日期
+        end_date:    结束日期
+        cols:        要选择的字段列表
+        chunk_size:  每块行数
+        server_side: 是否使用服务端游标单次扫描
+        typed:       是否按注册表转换列类型，默认 False 保持驱动原始类型
+        compact:     typed 时是否降精度（float32 价格、分类 stock_code）
+        use_cache:   是否走本地缓存，None 表示按 CACHE_CONFIG 决定；未 typed 时缓存结果的 DATE 列还原为 date，小数列为 float64
+        stock_codes: 只读取这些股票，None 表示全市场
 
-    # 读取数据的批量大小
-    chunk_size = 10000
-    chunks = []
+    Returns:
+        df: 读取到的 DataFrame
+    """
+    if use_cache is not False:
+        from CommonProperties import Parquet_Cache
+        if use_cache or Parquet_Cache.is_cached_table(table_name):
+            try:
+                return Parquet_Cache.read_table(user=user, password=password, host=host, database=database,
+                                                table_name=table_name, start_date=start_date, end_date=end_date,
+                                                cols=cols, compact=compact and typed, stock_codes=stock_codes,
+                                                typed=typed)
+            except Exception as e:
+                logging.warning(f"缓存表：{table_name} 读取失败，改为直接读取 MySQL: {e}")
 
     try:
-        for offset in range(0, total_rows, chunk_size):
-            query = f"SELECT {selected_cols} FROM {table_name}"
-            if where_clause:
-                query += f" WHERE {where_clause}"
-            query += f" LIMIT {chunk_size} OFFSET {offset}"
-            chunk = pd.read_sql(query, engine)
-            chunks.append(chunk)
-
-        df = pd.concat(chunks, ignore_index=True)
-
-        # 最终的数据完整性检查
-        if df.shape[0] == total_rows:
-            logging.info(f"{host} 的 mysql表：{table_name} 数据读取成功且无遗漏，共 {total_rows} 行。")
-        else:
-            logging.warning(f"{table_name} 数据读取可能有问题，预期记录数为 {total_rows}，实际读取记录数为 {df.shape[0]}。")
+        chunks = []
+        for chunk in iter_mysql_to_dataframe(user=user,
+                                             password=password,
+                                             host=host,
+                                             database=database,
+                                             table_name=table_name,
+                                             start_date=start_date,
+                                             end_date=end_date,
+                                             cols=cols,
+                                             chunk_size=chunk_size,
+                                             server_side=server_side,
+                                             stock_codes=stock_codes):
+            # 逐块转换，峰值内存只多出一个块；分类列在拼接后统一转换，保证各块类别一致
+            chunks.append(apply_table_dtypes(chunk, table_name, categorical=False, compact=compact) if typed else chunk)
+
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        if typed:
+            df = apply_table_dtypes(df, table_name, compact=compact)
+        logging.info(f"{host} 的 mysql表：{table_name} 数据读取成功，共 {df.shape[0]} 行，分 {len(chunks)} 块。")
 
     except Exception as e:
         logging.error(f"从表：{table_name} 读取数据时发生错误: {e}")
@@ -170,9 +804,252 @@ def data_from_mysql_to_dataframe(user, password, host, database='quant', table_n
     return df
 
 
+def split_date_range(start_date, end_date, span_days=30):
+    """
+    把 [start_date, end_date] 按 span_days 个自然日切成首尾相接、互不重叠的子区间
+    Returns:
+        list: [(sub_start, sub_end), ...]，日期格式 YYYYMMDD
+    """
+    start_dt = pd.to_datetime(str(start_date))
+    end_dt = pd.to_datetime(str(end_date))
+
+    ranges = []
+    current = start_dt
+    while current <= end_dt:
+        sub_end = min(current + pd.Timedelta(days=span_days - 1), end_dt)
+        ranges.append((current.strftime('%Y%m%d'), sub_end.strftime('%Y%m%d')))
+        current = sub_end + pd.Timedelta(days=1)
+    return ranges
+
+
+def data_from_mysql_to_dataframe_parallel(user, password, host, database='quant', table_name='', start_date=None,
+                                          end_date=None, cols=None, max_workers=4, span_days=30, chunk_size=50000,
+                                          typed=True, compact=False, use_cache=None):
+    """
+    按 ymd 把日期区间切成若干子区间，用有界线程池并发读取（每个线程从共享连接池借连接），再按日期顺序拼回
+    适合 400+ 天的 K 线这类大区间读取；未给出起止日期时退回 data_from_mysql_to_dataframe
+    Args:
+        table_name:  MySQL 表名
+        database:    数据库名称
+        start_date:  起始日期
+        end_date:    结束日期
+        cols:        要选择的字段列表
+        max_workers: 并发线程数，不要超过连接池 pool_size + max_overflow
+        span_days:   每个子区间的自然日跨度
+        chunk_size:  子区间内 keyset 分页的每块行数
+        typed:       是否按注册表做无损类型转换
+        compact:     typed 时是否降精度（float32 价格、分类 stock_code），读出后要写回库的路径不要打开
+        use_cache:   是否走本地缓存，None 表示按 CACHE_CONFIG 决定；走缓存时不再并发读取 MySQL
+
+    Returns:
+        df: 读取到的 DataFrame，ymd 为 datetime64
+    """
+    from CommonProperties import Parquet_Cache
+    cached = use_cache is not False and (use_cache or Parquet_Cache.is_cached_table(table_name))
+    if not start_date or not end_date or cached:
+        return data_from_mysql_to_dataframe(user=user, password=password, host=host, database=database,
+                                            table_name=table_name, start_date=start_date, end_date=end_date,
+                                            cols=cols, chunk_size=chunk_size, typed=typed, compact=compact,
+                                            use_cache=use_cache)
+
+    ranges = split_date_range(start_date, end_date, span_days)
+
+    def read_range(date_range):
+        chunks = list(iter_mysql_to_dataframe(user=user,
+                                              password=password,
+                                              host=host,
+                                              database=database,
+                                              table_name=table_name,
+                                              start_date=date_range[0],
+                                              end_date=date_range[1],
+                                              cols=cols,
+                                              chunk_size=chunk_size))
+        if not chunks:
+            return None
+        part = pd.concat(chunks, ignore_index=True)
+        return apply_table_dtypes(part, table_name, categorical=False, compact=compact) if typed else part
+
+    try:
+        # executor.map 按提交顺序返回，拼接结果天然按日期有序
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(executor.map(read_range, ranges))
+
+        parts = [part for part in parts if part is not None and not part.empty]
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if typed:
+            df = apply_table_dtypes(df, table_name, compact=compact)
+        logging.info(f"{host} 的 mysql表：{table_name} 并发读取成功，{len(ranges)} 个子区间，{max_workers} 线程，共 {df.shape[0]} 行。")
+
+    except Exception as e:
+        logging.error(f"从表：{table_name} 并发读取数据时发生错误: {e}")
+        df = pd.DataFrame()
+
+    return df
+
+
+###################  查询结果缓存   ######################
+# 同一进程内对相同 (host, database, SQL, 参数) 的只读查询做记忆化：
+#   内存 LRU 为一级，disk_dir 非空时再落一份 pickle 作为二级（跨进程 / 跨运行复用）
+#   条目在超过 ttl 秒，或来源表的水位 (MAX(ymd), 最新一天行数) 变化时失效
+#   水位本身也缓存 watermark_ttl 秒，避免每次命中都去查一次库
+QUERY_CACHE_CONFIG = {
+    'enabled': True,
+    'max_entries': 256,
+    'ttl': 600,
+    'watermark_ttl': 30,
+    'disk_dir': None,
+}
+
+_query_cache = OrderedDict()
+_watermark_cache = {}
+_query_cache_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'invalidations': 0}
+_query_cache_lock = threading.Lock()
+
+
+def configure_query_cache(**cache_kwargs):
+    """
+    修改查询缓存配置，例如 configure_query_cache(ttl=300, disk_dir='/opt/QDatas/query_cache')
+    Args:
+        **cache_kwargs: enabled / max_entries / ttl / watermark_ttl / disk_dir
+    """
+    unknown = set(cache_kwargs) - set(QUERY_CACHE_CONFIG)
+    if unknown:
+        raise ValueError(f"不支持的查询缓存参数: {sorted(unknown)}")
+    QUERY_CACHE_CONFIG.update(cache_kwargs)
+
+
+def get_query_cache_stats():
+    """
+    查询缓存的命中统计
+    Returns:
+        dict: hits（内存命中）, disk_hits（磁盘命中）, misses, invalidations（水位变化导致的失效）, entries, hit_rate
+    """
+    with _query_cache_lock:
+        stats = dict(_query_cache_stats)
+        stats['entries'] = len(_query_cache)
+    total = stats['hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / total, 4) if total else 0.0
+    return stats
+
+
+def clear_query_cache(disk=False):
+    """清空内存中的查询缓存和水位；disk=True 时同时删除磁盘缓存文件"""
+    with _query_cache_lock:
+        _query_cache.clear()
+        _watermark_cache.clear()
+        for key in _query_cache_stats:
+            _query_cache_stats[key] = 0
+
+    disk_dir = QUERY_CACHE_CONFIG['disk_dir']
+    if disk and disk_dir and os.path.isdir(disk_dir):
+        for file_name in os.listdir(disk_dir):
+            if file_name.endswith('.pkl'):
+                os.remove(os.path.join(disk_dir, file_name))
+
+
+def get_table_watermark(engine, table_name):
+    """
+    表的水位：(MAX(ymd), MAX(ymd) 当天的行数)，走 ymd 索引，新增交易日或最新一天补数都会改变水位
+    表上没有 ymd 字段时退回 (None, COUNT(*))
+    """
+    cache_key = (engine.url.host, engine.url.database, table_name)
+    now = time.time()
+    with _query_cache_lock:
+        cached = _watermark_cache.get(cache_key)
+    if cached and now - cached[0] < QUERY_CACHE_CONFIG['watermark_ttl']:
+        return cached[1]
+
+    with engine.connect() as conn:
+        try:
+            row = conn.execute(text(f"SELECT ymd, COUNT(*) FROM {table_name} "
+                                    f"WHERE ymd = (SELECT MAX(ymd) FROM {table_name}) GROUP BY ymd")).fetchone()
+            watermark = (str(row[0]), int(row[1])) if row else (None, 0)
+        except SQLAlchemyError:
+            conn.rollback()
+            watermark = (None, int(conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()))
+
+    with _query_cache_lock:
+        _watermark_cache[cache_key] = (now, watermark)
+    return watermark
+
+
+def _query_cache_file(key):
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(QUERY_CACHE_CONFIG['disk_dir'], f"{digest}.pkl")
+
+
+def _query_cache_put(key, entry):
+    with _query_cache_lock:
+        _query_cache[key] = entry
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > QUERY_CACHE_CONFIG['max_entries']:
+            _query_cache.popitem(last=False)
+
+
+def read_sql_cached(user, password, host, database='quant', sql='', params=None, table_name=None):
+    """
+    带缓存的只读查询，返回 DataFrame 的副本（调用方修改结果不会污染缓存）
+    Args:
+        sql:        查询 SQL，参数用 :name 绑定
+        params:     绑定参数 dict
+        table_name: 查询依赖的表，给出时按该表水位判断缓存是否失效；不给时只按 ttl 失效
+    Returns:
+        df: 查询结果
+    """
+    engine = get_engine(user, password, host, database)
+    if not QUERY_CACHE_CONFIG['enabled']:
+        return pd.read_sql(text(sql), engine, params=params or {})
+
+    key = (host, database, sql, tuple(sorted((params or {}).items())))
+    watermark = get_table_watermark(engine, table_name) if table_name else None
+    now = time.time()
+
+    def is_valid(entry):
+        return now - entry[0] < QUERY_CACHE_CONFIG['ttl'] and entry[1] == watermark
+
+    with _query_cache_lock:
+        entry = _query_cache.get(key)
+        if entry is not None:
+            if is_valid(entry):
+                _query_cache.move_to_end(key)
+                _query_cache_stats['hits'] += 1
+                return entry[2].copy()
+            _query_cache.pop(key)
+            _query_cache_stats['invalidations'] += 1
+
+    disk_dir = QUERY_CACHE_CONFIG['disk_dir']
+    if disk_dir and os.path.exists(_query_cache_file(key)):
+        try:
+            with open(_query_cache_file(key), 'rb') as file:
+                entry = pickle.load(file)
+            if is_valid(entry):
+                _query_cache_put(key, entry)
+                with _query_cache_lock:
+                    _query_cache_stats['disk_hits'] += 1
+                return entry[2].copy()
+        except Exception as e:
+            logging.warning(f"    读取磁盘查询缓存失败，改为查询数据库: {e}")
+
+    df = pd.read_sql(text(sql), engine, params=params or {})
+    entry = (now, watermark, df)
+    _query_cache_put(key, entry)
+    with _query_cache_lock:
+        _query_cache_stats['misses'] += 1
+
+    if disk_dir:
+        os.makedirs(disk_dir, exist_ok=True)
+        tmp_path = f"{_query_cache_file(key)}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _query_cache_file(key))
+
+    return df.copy()
+
+
 def data_from_mysql_to_dataframe_latest(user, password, host, database='quant', table_name='', cols=None):
     """
     从 MySQL 表中读取最新一天的数据到 DataFrame，同时进行最终的数据完整性检查和日志记录
+    最新日期直接取自表水位，结果经 read_sql_cached 缓存，表未更新时重复调用不再访问数据库
     Args:
         table_name: MySQL 表名
         database: 数据库名称
@@ -182,13 +1059,11 @@ def data_from_mysql_to_dataframe_latest(user, password, host, database='quant',
         df: 读取到的 DataFrame
     """
 
-    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
-    engine = create_engine(db_url)
+    engine = get_engine(user, password, host, database)
 
     try:
         # 获取最新的 ymd 日期
-        query_latest_ymd = f"SELECT MAX(ymd) FROM {table_name}"
-        latest_ymd = pd.read_sql(query_latest_ymd, engine).iloc[0, 0]
+        latest_ymd = get_table_watermark(engine, table_name)[0]
 
         if latest_ymd is not None:
             # 构建 SELECT 语句
@@ -198,8 +1073,9 @@ def data_from_mysql_to_dataframe_latest(user, password, host, database='quant',
                 selected_cols = '*'
 
             # 查询最新一天的数据
-            query = f"SELECT {selected_cols} FROM {table_name} WHERE ymd = '{latest_ymd}'"
-            df = pd.read_sql(query, engine)
+            query = f"SELECT {selected_cols} FROM {table_name} WHERE ymd = :latest_ymd"
+            df = read_sql_cached(user, password, host, database, sql=query, params={'latest_ymd': latest_ymd},
+                                 table_name=table_name)
 
             logging.info(f"    mysql表：{table_name} 最新一天({latest_ymd})的数据读取成功，共 {df.shape[0]} 行。")
         else:
@@ -234,7 +1110,7 @@ def create_partition_if_not_exists(engine, partition_name, year, month):
 def upsert_table(user, password, host, database, source_table, target_table, columns):
     """
     使用 source_table 中的数据来更新或插入到 target_table 中（极简版）
-    核心功能：存在则更新，不存在则插入；冲突时忽略（避免中断）
+    核心功能：存在则更新，不存在则插入（INSERT ... ON DUPLICATE KEY UPDATE）
 
     :param user: 数据库用户名
     :param password: 数据库密码
@@ -244,19 +1120,17 @@ def upsert_table(user, password, host, database, source_table, target_table, col
     :param target_table: 目标表名称（字符串）
     :param columns: 需要更新或插入的列名列表（列表）
     """
-    # 1. 构建数据库连接（原代码逻辑，无charset参数，解决TypeError错误）
-    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
-    engine = create_engine(db_url)
+    # 1. 获取共享连接池
+    engine = get_engine(user, password, host, database)
 
     # 2. 构建列名、更新语句、查询语句（原代码逻辑，保持不变）
     columns_str = ", ".join(columns)
     update_str = ", ".join([f"{col} = VALUES({col})" for col in columns])
     select_str = ", ".join(columns)
 
-    # 3. 构建SQL语句（关键修改：添加IGNORE，解决唯一键冲突中断问题）
-    # 原代码：INSERT INTO {target_table} ({columns_str})
+    # 3. 构建SQL语句：唯一键冲突由 ON DUPLICATE KEY UPDATE 原地更新，不再叠加 IGNORE 吞掉其他错误
     sql = f"""
-    INSERT IGNORE INTO {target_table} ({columns_str})
+    INSERT INTO {target_table} ({columns_str})
     SELECT {select_str}
     FROM {source_table}
     ON DUPLICATE KEY UPDATE
@@ -268,8 +1142,166 @@ def upsert_table(user, password, host, database, source_table, target_table, col
         # 添加事务提交（原代码缺少，补充后修改才会生效）
         with connection.begin():
             connection.execute(text(sql))
-    # 可选：关闭引擎（非必须，但养成好习惯）
-    engine.dispose()
+
+
+def _table_columns(engine, table_name):
+    """读取表的字段列表（不取数据）"""
+    with engine.connect() as conn:
+        return list(conn.execute(text(f"SELECT * FROM {table_name} LIMIT 0")).keys())
+
+
+def _day_checksums(engine, table_name, columns, has_ymd=True, start_date=None, end_date=None):
+    """
+    按 ymd 统计每天的行数和内容校验和：BIT_XOR(CRC32(整行拼接))，与行的物理顺序无关
+    NULL 先替换成 \\N，避免 CONCAT_WS 跳过 NULL 把 NULL 和空串算成一样
+    表上没有 ymd 字段时整表作为一个分组，键为 None
+    Returns:
+        dict: {ymd: (行数, 校验和)}
+    """
+    row_expr = "CONCAT_WS('|', " + ", ".join(f"IFNULL({col}, '\\\\N')" for col in columns) + ")"
+    where_conditions = []
+    params = {}
+    if has_ymd and start_date:
+        where_conditions.append("ymd >= :start_date")
+        params['start_date'] = start_date
+    if has_ymd and end_date:
+        where_conditions.append("ymd <= :end_date")
+        params['end_date'] = end_date
+
+    group_col = "ymd" if has_ymd else "NULL"
+    query = f"SELECT {group_col} AS ymd, COUNT(*) AS cnt, BIT_XOR(CRC32({row_expr})) AS crc FROM {table_name}"
+    if where_conditions:
+        query += " WHERE " + " AND ".join(where_conditions)
+    if has_ymd:
+        query += " GROUP BY ymd"
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(query), params).fetchall()
+    return {(str(row[0]) if row[0] is not None else None): (int(row[1]), int(row[2] or 0))
+            for row in rows if row[1]}
+
+
+def sync_table_streaming(source_user, source_password, source_host, source_database,
+                         target_user, target_password, target_host, target_database,
+                         source_table, target_table=None, start_date=None, end_date=None,
+                         chunk_size=20000, replace_days=False):
+    """
+    跨服务器流式同步一张表：
+      1. 两端按 ymd 比较行数和 CRC 校验和，只处理不一致的交易日
+      2. 每个交易日从源端按 keyset 分块流式读取，每块用多行 VALUES 写入目标端的独立暂存表（表名带随机后缀，可多个同步并发）
+      3. 一天的数据全部进入暂存表后，在一个事务里 upsert 合并到目标表（replace_days=True 时先删掉目标表当天的数据），再清空暂存表
+    内存中最多只有一个数据块
+
+    :param source_table:  源表名称
+    :param target_table:  目标表名称，默认与源表同名
+    :param start_date:    起始日期，None 表示不限（表上没有 ymd 字段时忽略日期）
+    :param end_date:      结束日期
+    :param chunk_size:    每块行数
+    :param replace_days:  True 时不一致的交易日以源端为准整天替换，False 时取并集（原 upsert 语义）
+    :return: dict，table / days_compared / days_copied / rows / bytes / seconds
+    """
+    target_table = target_table or source_table
+    source_engine = get_engine(source_user, source_password, source_host, source_database)
+    target_engine = get_engine(target_user, target_password, target_host, target_database)
+    sync_start = time.perf_counter()
+
+    # 两端都有的字段才参与校验和同步
+    target_columns = set(_table_columns(target_engine, target_table))
+    columns = [col for col in _table_columns(source_engine, source_table) if col in target_columns]
+    has_ymd = 'ymd' in columns
+
+    source_sums = _day_checksums(source_engine, source_table, columns, has_ymd, start_date, end_date)
+    target_sums = _day_checksums(target_engine, target_table, columns, has_ymd, start_date, end_date)
+    diff_days = sorted((day for day, checksum in source_sums.items() if target_sums.get(day) != checksum),
+                       key=lambda day: day or '')
+
+    report = {'table': target_table, 'days_compared': len(source_sums), 'days_copied': len(diff_days),
+              'rows': 0, 'bytes': 0, 'seconds': 0.0}
+    if not diff_days:
+        report['seconds'] = round(time.perf_counter() - sync_start, 3)
+        logging.info(f"    {source_host}.{source_table} -> {target_host}.{target_table} 两端一致，无需同步。")
+        return report
+
+    key_cols = get_unique_key(target_engine, target_table)
+    staging_table = f"tmp_sync_{uuid.uuid4().hex[:8]}_{target_table}"[:64]
+    columns_str = ", ".join(columns)
+    update_str = ", ".join(f"{col} = VALUES({col})" for col in columns if col not in key_cols) \
+        or f"{columns[0]} = {columns[0]}"
+    merge_sql = (f"INSERT INTO {target_table} ({columns_str}) SELECT {columns_str} FROM {staging_table} "
+                 f"ON DUPLICATE KEY UPDATE {update_str}")
+
+    try:
+        with target_engine.begin() as conn:
+            conn.execute(text(f"CREATE TABLE {staging_table} LIKE {target_table}"))
+            # 暂存表去掉分区，避免源端数据超出目标分区范围时写入失败
+            if conn.execute(text("SELECT COUNT(*) FROM information_schema.PARTITIONS "
+                                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name "
+                                 "AND PARTITION_NAME IS NOT NULL"), {'name': staging_table}).scalar():
+                conn.execute(text(f"ALTER TABLE {staging_table} REMOVE PARTITIONING"))
+
+        for day in diff_days:
+            for chunk in iter_mysql_to_dataframe(user=source_user,
+                                                 password=source_password,
+                                                 host=source_host,
+                                                 database=source_database,
+                                                 table_name=source_table,
+                                                 start_date=day if has_ymd else None,
+                                                 end_date=day if has_ymd else None,
+                                                 cols=columns,
+                                                 chunk_size=chunk_size):
+                _write_by_values(target_user, target_password, target_host, target_database,
+                                 chunk, staging_table, mode='ignore')
+                report['rows'] += len(chunk)
+
+            with target_engine.begin() as conn:
+                if replace_days:
+                    if has_ymd:
+                        conn.execute(text(f"DELETE FROM {target_table} WHERE ymd = :day"), {'day': day})
+                    else:
+                        conn.execute(text(f"DELETE FROM {target_table}"))
+                conn.execute(text(merge_sql))
+                conn.execute(text(f"DELETE FROM {staging_table}"))
+    finally:
+        with target_engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+        report['bytes'] = _write_stats.pop(staging_table, {}).get('bytes', 0)
+
+    report['seconds'] = round(time.perf_counter() - sync_start, 3)
+    logging.info(f"    {source_host}.{source_table} -> {target_host}.{target_table} 同步完成："
+                 f"比对 {report['days_compared']} 天，同步 {report['days_copied']} 天，"
+                 f"{report['rows']} 行，{report['bytes'] / 1024 / 1024:.2f} MB，耗时 {report['seconds']} 秒")
+    return report
+
+
+def sync_tables_parallel(source_user, source_password, source_host, source_database,
+                         target_user, target_password, target_host, target_database,
+                         tables, start_date=None, end_date=None, max_workers=4, chunk_size=20000,
+                         replace_days=False):
+    """
+    多张表并发执行 sync_table_streaming，单表失败不影响其他表
+    :param tables:      表名列表（两端同名）
+    :param max_workers: 并发表数，两端连接池都要留够连接
+    :return: DataFrame，每张表一行同步报告，失败的表 error 列非空
+    """
+    def sync_one(table_name):
+        try:
+            return sync_table_streaming(source_user, source_password, source_host, source_database,
+                                        target_user, target_password, target_host, target_database,
+                                        source_table=table_name, start_date=start_date, end_date=end_date,
+                                        chunk_size=chunk_size, replace_days=replace_days)
+        except Exception as e:
+            logging.error(f"    表 {table_name} 同步失败: {e}")
+            return {'table': table_name, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        reports = list(executor.map(sync_one, tables))
+
+    report_df = pd.DataFrame(reports)
+    if 'error' not in report_df.columns:
+        report_df['error'] = None
+    logging.info(f"    共同步 {len(tables)} 张表，{int(report_df['rows'].fillna(0).sum())} 行，"
+                 f"{report_df['bytes'].fillna(0).sum() / 1024 / 1024:.2f} MB，失败 {int(report_df['error'].notna().sum())} 张。")
+    return report_df
 
 
 def cross_server_upsert_all(source_user, source_password, source_host, source_database,
@@ -277,7 +1309,7 @@ def cross_server_upsert_all(source_user, source_password, source_host, source_da
                             source_table, target_table):
     """
     跨服务器迁移数据，并在目标服务器上实现数据的并集。
-    这是一种追加取并集的方式
+    这是一种追加取并集的方式，由 sync_table_streaming 流式完成，只同步校验和不一致的交易日
 
     :param source_user:      源服务器的数据库用户名
     :param source_password:  源服务器的数据库密码
@@ -289,52 +1321,13 @@ def cross_server_upsert_all(source_user, source_password, source_host, source_da
     :param target_database:  目标服务器的数据库名称
     :param source_table:     源表名称（字符串）
     :param target_table:     目标表名称（字符串）
-    :param columns:          需要更新或插入的列名列表（列表）
-    """
-
-    # 源服务器连接
-    source_db_url = f'mysql+pymysql://{source_user}:{source_password}@{source_host}:3306/{source_database}'
-    source_engine = create_engine(source_db_url)
-
-    # 目标服务器连接
-    target_db_url = f'mysql+pymysql://{target_user}:{target_password}@{target_host}:3306/{target_database}'
-    target_engine = create_engine(target_db_url)
-
-    # 从源服务器读取数据
-    df = pd.read_sql_table(source_table, source_engine)
-
-    # 动态获取列名
-    columns = df.columns.tolist()
-
-    # 在目标服务器创建临时表并插入数据
-    temp_table_name = 'temp_source_data'
-    df.to_sql(name=temp_table_name, con=target_engine, if_exists='replace', index=False)
-
-    # 构建列名部分
-    columns_str = ", ".join(columns)
-
-    # 构建 ON DUPLICATE KEY UPDATE 部分
-    update_str = ", ".join([f"{col} = VALUES({col})" for col in columns])
-
-    # 构建 SELECT 部分
-    select_str = ", ".join(columns)
-
-    # 构建完整的 SQL 语句
-    sql = f"""
-    INSERT INTO {target_table} ({columns_str})
-    SELECT {select_str}
-    FROM {temp_table_name}
-    ON DUPLICATE KEY UPDATE 
-    {update_str};
     """
+    report = sync_table_streaming(source_user, source_password, source_host, source_database,
+                                  target_user, target_password, target_host, target_database,
+                                  source_table=source_table, target_table=target_table)
 
-    # 在目标服务器上执行合并操作
-    with target_engine.connect() as connection:
-        connection.execute(text(sql))
-        connection.execute(f"DROP TABLE {temp_table_name};")
-
-    print(f"数据已从 {source_table} 迁移并合并到 {target_table}。")
-
+    print(f"数据已从 {source_table} 迁移并合并到 {target_table}，共 {report['rows']} 行。")
+    return report
 
 
 def cross_server_upsert_ymd(source_user, source_password, source_host, source_database,
@@ -342,7 +1335,7 @@ def cross_server_upsert_ymd(source_user, source_password, source_host, source_da
                             source_table, target_table, start_date, end_date):
     """
     跨服务器迁移数据，并在目标服务器上实现数据的并集。
-    这是一种追加取并集的方式
+    这是一种追加取并集的方式，由 sync_table_streaming 流式完成，只同步 [start_date, end_date] 内校验和不一致的交易日
 
     :param source_user:      源服务器的数据库用户名
     :param source_password:  源服务器的数据库密码
@@ -354,59 +1347,168 @@ def cross_server_upsert_ymd(source_user, source_password, source_host, source_da
     :param target_database:  目标服务器的数据库名称
     :param source_table:     源表名称（字符串）
     :param target_table:     目标表名称（字符串）
-    :param columns:          需要更新或插入的列名列表（列表）
+    :param start_date:       起始日期
+    :param end_date:         结束日期
     """
+    report = sync_table_streaming(source_user, source_password, source_host, source_database,
+                                  target_user, target_password, target_host, target_database,
+                                  source_table=source_table, target_table=target_table,
+                                  start_date=start_date, end_date=end_date)
 
-    # 源服务器连接
-    source_db_url = f'mysql+pymysql://{source_user}:{source_password}@{source_host}:3306/{source_database}'
-    source_engine = create_engine(source_db_url)
-
-    # 目标服务器连接
-    target_db_url = f'mysql+pymysql://{target_user}:{target_password}@{target_host}:3306/{target_database}'
-    target_engine = create_engine(target_db_url)
+    print(f"数据已从 {source_table} 迁移并合并到 {target_table}，共 {report['rows']} 行。")
+    return report
 
-    # # 从源服务器读取数据
-    # df = pd.read_sql_table(source_table, source_engine)
 
-    # 从源服务器读取数据，限制 ymd 在 [start_date, end_date] 内
-    query = f"""
-    SELECT * FROM {source_table}
-    WHERE ymd BETWEEN '{start_date}' AND '{end_date}'
+def _plan_key_ranges(engine, table_name, split_col, chunk_size):
     """
-    df = pd.read_sql_query(query, source_engine)
-
-    # 动态获取列名
-    columns = df.columns.tolist()
-
-    # 在目标服务器创建临时表并插入数据
-    temp_table_name = 'temp_source_data'
-    df.to_sql(name=temp_table_name, con=target_engine, if_exists='replace', index=False)
-
-    # 构建列名部分
-    columns_str = ", ".join(columns)
-    # 构建 ON DUPLICATE KEY UPDATE 部分
-    update_str = ", ".join([f"{col} = VALUES({col})" for col in columns])
-    # 构建 SELECT 部分
-    select_str = ", ".join(columns)
-
-    # 构建完整的 SQL 语句
-    sql = f"""
-    INSERT INTO {target_table} ({columns_str})
-    SELECT {select_str}
-    FROM {temp_table_name}
-    ON DUPLICATE KEY UPDATE 
-    {update_str};
+    按 split_col 的取值把整表切成若干闭区间 [lo, hi]，每个区间约 chunk_size 行
+    同一取值不会被拆到两个区间，区间之间互不重叠；split_col 为 NULL 的行单独成一个 [None, None] 区间（按 IS NULL 复制）
+    Returns:
+        list: [[lo, hi, 预计行数], ...]
     """
+    counts_df = pd.read_sql(text(f"SELECT {split_col} AS k, COUNT(*) AS cnt FROM {table_name} "
+                                 f"GROUP BY {split_col} ORDER BY {split_col}"), engine)
+    null_mask = counts_df['k'].isna()
+    null_rows = int(counts_df.loc[null_mask, 'cnt'].sum())
+    counts_df = counts_df[~null_mask].reset_index(drop=True)
+
+    ranges = []
+    if not counts_df.empty:
+        # 累计行数整除 chunk_size 得到区间编号，再取每个区间的首尾取值
+        counts_df['chunk'] = (counts_df['cnt'].cumsum() - counts_df['cnt']) // chunk_size
+        grouped = counts_df.groupby('chunk').agg(lo=('k', 'first'), hi=('k', 'last'), cnt=('cnt', 'sum'))
+        ranges = [[str(row.lo), str(row.hi), int(row.cnt)] for row in grouped.itertuples()]
+    if null_rows:
+        ranges.append([None, None, null_rows])
+    return ranges
+
+
+def _range_condition(split_col, lo):
+    """键区间的 WHERE 条件：[None, None] 区间对应 split_col IS NULL"""
+    if lo is None:
+        return f"{split_col} IS NULL"
+    return f"{split_col} >= :lo AND {split_col} <= :hi"
+
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def shadow_replace_migrate(source_db_url, target_db_url, table_name, chunk_size=50000, max_workers=4,
+                           checkpoint_dir=None):
+    """
+    影子表方式的整表迁移，可断点续传：
+      1. 在目标库建影子表 {table_name}_shadow（结构同目标表），线上表在迁移期间照常可读
+      2. 按主键 / 唯一键第一列（都没有时用 ymd，再没有则直接报错）把源表切成互不重叠的键区间，
+         切分列为 NULL 的行单独成一个区间，多线程逐区间复制到影子表
+      3. 每完成一个区间就把进度写入检查点文件，中途失败重跑时跳过已完成的区间
+      4. 全部完成后，影子表行数与切换前重新统计的源表 COUNT(*) 一致，才 RENAME TABLE 原子地交换线上表和影子表，
+         再删除旧表和检查点；不一致（如复制期间源表有写入、唯一键冲突丢行）时报错，线上表保持不变
 
-    # 在目标服务器上执行合并操作
-    with target_engine.connect() as connection:
-        connection.execute(text(sql))
-        connection.execute(f"DROP TABLE {temp_table_name};")
-
-    print(f"数据已从 {source_table} 迁移并合并到 {target_table}。")
-
-
-def full_replace_migrate(source_host, source_db_url, target_host, target_db_url, table_name, chunk_size=10000):
+    Args:
+        source_db_url  (str): 源端 MySQL 数据库的连接 URL
+        target_db_url  (str): 目标 MySQL 数据库的连接 URL
+        table_name     (str): 要迁移的表名
+        chunk_size     (int): 每个键区间的目标行数
+        max_workers    (int): 并发复制的线程数
+        checkpoint_dir (str): 检查点文件目录，默认系统临时目录下的 quant_migrate
+    Returns:
+        int: 复制的总行数
+    """
+    source_engine = get_engine_by_url(source_db_url)
+    target_engine = get_engine_by_url(target_db_url)
+    target_url = make_url(target_db_url)
+    shadow_table = f"{table_name}_shadow"
+
+    checkpoint_dir = checkpoint_dir or os.path.join(tempfile.gettempdir(), 'quant_migrate')
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_path = os.path.join(checkpoint_dir, f"{target_url.host}_{target_url.database}_{table_name}.json")
+
+    with target_engine.connect() as conn:
+        shadow_exists = conn.execute(text("SELECT COUNT(*) FROM information_schema.TABLES "
+                                          "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"),
+                                     {'name': shadow_table}).scalar() > 0
+
+    checkpoint = None
+    if os.path.exists(checkpoint_path) and shadow_exists:
+        with open(checkpoint_path, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        logging.info(f"    {table_name} 从检查点续传：已完成 {len(checkpoint['done'])}/{len(checkpoint['ranges'])} 个区间。")
+
+    if checkpoint is None:
+        key_cols = get_unique_key(source_engine, table_name)
+        if key_cols:
+            split_col = key_cols[0]
+        elif 'ymd' in _table_columns(source_engine, table_name):
+            split_col = 'ymd'
+        else:
+            raise ValueError(f"{table_name} 没有主键 / 唯一键，也没有 ymd 字段，无法切分键区间做影子表迁移，"
+                             f"请先加主键或改用 mode='truncate'")
+        with target_engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {shadow_table}"))
+            conn.execute(text(f"CREATE TABLE {shadow_table} LIKE {table_name}"))
+        checkpoint = {'table_name': table_name,
+                      'shadow_table': shadow_table,
+                      'split_col': split_col,
+                      'ranges': _plan_key_ranges(source_engine, table_name, split_col, chunk_size),
+                      'done': {}}
+        _save_checkpoint(checkpoint_path, checkpoint)
+        logging.info(f"    {table_name} 按 {split_col} 切分为 {len(checkpoint['ranges'])} 个区间，开始复制到 {shadow_table}。")
+
+    split_col = checkpoint['split_col']
+    checkpoint_lock = threading.Lock()
+    pending = [idx for idx in range(len(checkpoint['ranges'])) if str(idx) not in checkpoint['done']]
+
+    def copy_range(idx):
+        lo, hi, _ = checkpoint['ranges'][idx]
+        params = {'lo': lo, 'hi': hi} if lo is not None else {}
+        condition = _range_condition(split_col, lo)
+        # 区间可能在上次中断时写了一半，先清掉再写，保证重跑幂等
+        with target_engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {shadow_table} WHERE {condition}"), params)
+
+        chunk = pd.read_sql(text(f"SELECT * FROM {table_name} WHERE {condition}"), source_engine, params=params)
+        if not chunk.empty:
+            _write_by_values(target_url.username, target_url.password, target_url.host, target_url.database,
+                             chunk, shadow_table, mode='ignore', engine=target_engine)
+
+        with checkpoint_lock:
+            checkpoint['done'][str(idx)] = len(chunk)
+            _save_checkpoint(checkpoint_path, checkpoint)
+            logging.info(f"    {shadow_table} 区间 [{lo}, {hi}] 写入 {len(chunk)} 行，"
+                         f"进度 {len(checkpoint['done'])}/{len(checkpoint['ranges'])}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() 让任一区间的异常在这里抛出；已完成的区间都已记入检查点
+        list(executor.map(copy_range, pending))
+    _write_stats.pop(shadow_table, None)
+
+    copied_rows = sum(checkpoint['done'].values())
+    # 切换前重新统计源表行数，与影子表实际行数核对（检查点里的行数是复制时自己记的，不能用来核对）
+    with source_engine.connect() as conn:
+        source_rows = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+    with target_engine.connect() as conn:
+        shadow_rows = conn.execute(text(f"SELECT COUNT(*) FROM {shadow_table}")).scalar()
+    if shadow_rows != source_rows:
+        raise RuntimeError(f"影子表 {shadow_table} 行数 {shadow_rows} 与源表 {table_name} 行数 {source_rows} 不一致，"
+                           f"未切换线上表；删除检查点 {checkpoint_path} 后重跑可重新全量复制")
+
+    # RENAME TABLE 多表改名是原子的，读线上表的查询要么看到旧表，要么看到完整的新表
+    old_table = f"{table_name}_old_{uuid.uuid4().hex[:6]}"
+    with target_engine.begin() as conn:
+        conn.execute(text(f"RENAME TABLE {table_name} TO {old_table}, {shadow_table} TO {table_name}"))
+        conn.execute(text(f"DROP TABLE {old_table}"))
+    os.remove(checkpoint_path)
+
+    logging.info(f"    表 {table_name} 影子表迁移完成，共 {copied_rows} 行，已原子切换。")
+    return copied_rows
+
+
+def full_replace_migrate(source_host, source_db_url, target_host, target_db_url, table_name, chunk_size=10000,
+                         mode='truncate', max_workers=4):
     """
     将本地 MySQL 数据库中的表数据导入到远程 MySQL 数据库中。
     整体暴力迁移，全删全插
@@ -418,11 +1520,26 @@ def full_replace_migrate(source_host, source_db_url, target_host, target_db_url,
         target_db_url (str): 目标 MySQL 数据库的连接 URL
         table_name    (str): 要迁移的表名
         chunk_size    (int): 每次读取和写入的数据块大小，默认 10000 行
+        mode          (str): 'truncate' 默认，原方式，先清空目标表再分页写入；
+                             'shadow' 影子表 + 检查点 + 原子切换（见 shadow_replace_migrate），失败可重跑续传，
+                             目标库账号需要 CREATE / RENAME / DROP 权限
+        max_workers   (int): shadow 模式下并发复制的线程数
     """
-    # 创建源端数据库的SQLAlchemy引擎
-    source_engine = create_engine(source_db_url)
-    # 创建目标数据库的SQLAlchemy引擎
-    target_engine = create_engine(target_db_url)
+    if mode == 'shadow':
+        try:
+            shadow_replace_migrate(source_db_url, target_db_url, table_name,
+                                   chunk_size=chunk_size, max_workers=max_workers)
+            print(f"表 {table_name} 数据迁移完成。")
+        except Exception as e:
+            print(f"数据迁移过程中发生错误: {str(e)}，重新执行即可从检查点续传")
+            print("错误堆栈信息：")
+            traceback.print_exc()
+        return
+
+    # 获取源端数据库的共享引擎
+    source_engine = get_engine_by_url(source_db_url)
+    # 获取目标数据库的共享引擎
+    target_engine = get_engine_by_url(target_db_url)
 
     try:
         # 1. 清空目标表（使用text语句，避免SQL注入，且单独执行）
@@ -480,6 +1597,7 @@ def full_replace_migrate(source_host, source_db_url, target_host, target_db_url,
 def get_stock_codes_latest():
     """
     这是为了取最新的 stock_code, 首先默认从类变量里面获取 stock_code(df), 如果df为空，就从mysql里面去取最新的
+    底层走 data_from_mysql_to_dataframe_latest 的查询缓存，股票代码表未更新时重复调用不访问数据库
     Args:
         df:
     Returns:
@@ -511,11 +1629,8 @@ def execute_sql_statements(user, password, host, database, sql_statements):
     database (str): 数据库名称。
     sql_statements (list): 包含 SQL 语句的列表。
     """
-    # 创建数据库连接 URL
-    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
-
-    # 创建数据库引擎，设置连接池
-    engine = create_engine(db_url, pool_size=10, max_overflow=20, pool_recycle=3600)
+    # 获取共享连接池
+    engine = get_engine(user, password, host, database)
 
     try:
         # 使用连接池执行 SQL 语句
@@ -529,17 +1644,13 @@ def execute_sql_statements(user, password, host, database, sql_statements):
     except SQLAlchemyError as e:
         # 捕获数据库相关的错误
         print(f"Error executing SQL: {e}")
-    finally:
-        # 确保连接被正确关闭
-        engine.dispose()
 
 
 def execute_query(user, password, host, database, sql):
     """
     执行查询 SQL，返回 DataFrame
     """
-    db_url = f'mysql+pymysql://{user}:{password}@{host}:3306/{database}'
-    engine = create_engine(db_url, pool_size=5, max_overflow=10, pool_recycle=3600)
+    engine = get_engine(user, password, host, database)
 
     try:
         with engine.connect() as connection:
@@ -548,5 +1659,3 @@ def execute_query(user, password, host, database, sql):
     except SQLAlchemyError as e:
         print(f"Error executing query: {e}")
         return pd.DataFrame()
-    finally:
-        engine.dispose()
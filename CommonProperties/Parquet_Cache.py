@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+from sqlalchemy import text
+
+import CommonProperties.Mysql_Utils as mysql_utils
+from CommonProperties.Base_Properties import cache_window_path, cache_linux_path, cache_mac_path
+from CommonProperties.set_config import get_platform
+from CommonProperties.Table_Schema import apply_table_dtypes, load_schema_registry
+
+
+######################  缓存配置  #############################
+# tables:       走本地缓存的热点表
+# batch_days:   缺失 / 变化的日期按多少天一批从 MySQL 拉取
+# checksum_ttl: 逐日 CRC 校验的有效期（秒）。远端水位（行数 + 最大 ymd）与本地一致、且区间内每天都在有效期内校验过时，
+#               读取不再触发全区间的校验和扫描；水位不一致或校验过期时才扫描
+CACHE_CONFIG = {
+    'enabled': True,
+    'root': None,
+    'tables': {'ods_stock_kline_daily_ts', 'dwd_ashare_stock_base_info', 'ods_trading_days_insight'},
+    'batch_days': 20,
+    'checksum_ttl': 3600,
+}
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.lock'
+# 落盘 dtype 的版本号，与 manifest 中记录的不一致时整表重新拉取（旧版本把价格 / 成交量存成了 float32）
+DTYPE_VERSION = 2
+
+_table_locks = {}
+_locks_guard = threading.Lock()
+
+
+def configure_cache(**cache_kwargs):
+    """
+    修改缓存配置，例如 configure_cache(enabled=False) 或 configure_cache(tables={...}, root='/data/cache')
+    """
+    CACHE_CONFIG.update(cache_kwargs)
+    CACHE_CONFIG['tables'] = set(CACHE_CONFIG['tables'])
+
+
+def is_cached_table(table_name):
+    """判断某张表的读取是否走本地缓存"""
+    return CACHE_CONFIG['enabled'] and table_name in CACHE_CONFIG['tables']
+
+
+def get_cache_root():
+    """缓存根目录，未显式配置时按平台取 Base_Properties 中的地址"""
+    if CACHE_CONFIG['root']:
+        return CACHE_CONFIG['root']
+    platform_name = get_platform()
+    if platform_name == 'Windows':
+        return cache_window_path
+    if platform_name == 'Mac':
+        return cache_mac_path
+    return cache_linux_path
+
+
+def _table_dir(host, database, table_name):
+    """每个 (host, database, table) 一个目录，目录下每个交易日一个 ymd=YYYYMMDD.parquet 文件"""
+    return os.path.join(get_cache_root(), f"{host}_{database}", table_name)
+
+
+def _day_file(table_dir, ymd):
+    return os.path.join(table_dir, f"ymd={ymd}.parquet")
+
+
+def _thread_lock(table_dir):
+    with _locks_guard:
+        return _table_locks.setdefault(table_dir, threading.Lock())
+
+
+@contextmanager
+def _table_lock(table_dir, shared=False):
+    """
+    表目录的锁：进程内线程锁 + 目录下 .lock 文件的进程间文件锁（flock；Windows 上为 msvcrt 排他锁）
+    同步写入用排他锁，只读用共享锁，多个进程同时同步 / 读取同一张表不会互相覆盖或读到半截数据
+    """
+    with _thread_lock(table_dir):
+        os.makedirs(table_dir, exist_ok=True)
+        with open(os.path.join(table_dir, LOCK_FILE), 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _tmp_path(path):
+    """同目录下本进程独占的临时文件名，配合 os.replace 原子替换"""
+    return f"{path}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+def _to_ymd(date_value):
+    """统一日期格式为 YYYYMMDD 字符串"""
+    return pd.to_datetime(str(date_value)).strftime('%Y%m%d')
+
+
+def load_manifest(table_dir):
+    """
+    读取表的 manifest
+    Returns:
+        dict: {'max_ymd': 'YYYYMMDD', 'row_count': 总行数, 'days': {'YYYYMMDD': 行数},
+               'checksums': {'YYYYMMDD': 校验和}, 'verified': {'YYYYMMDD': 最近一次校验的时间戳}}
+    """
+    manifest_path = os.path.join(table_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {'max_ymd': None, 'row_count': 0, 'days': {}, 'checksums': {}, 'verified': {}}
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    manifest.setdefault('checksums', {})
+    manifest.setdefault('verified', {})
+    return manifest
+
+
+def _save_manifest(table_dir, manifest):
+    """先写唯一命名的临时文件再原子替换，进程中途退出也不会留下半个 manifest"""
+    manifest['max_ymd'] = max(manifest['days']) if manifest['days'] else None
+    manifest['row_count'] = int(sum(manifest['days'].values()))
+    tmp_path = _tmp_path(os.path.join(table_dir, MANIFEST_FILE))
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(table_dir, MANIFEST_FILE))
+
+
+def _remote_watermark(engine, table_name, start_date=None, end_date=None):
+    """远端区间内的 (行数, 最大 ymd)，只走 ymd 索引，不读整行"""
+    where_conditions = []
+    params = {}
+    if start_date:
+        where_conditions.append("ymd >= :start_date")
+        params['start_date'] = start_date
+    if end_date:
+        where_conditions.append("ymd <= :end_date")
+        params['end_date'] = end_date
+
+    query = f"SELECT COUNT(*) AS cnt, MAX(ymd) AS max_ymd FROM {table_name}"
+    if where_conditions:
+        query += " WHERE " + " AND ".join(where_conditions)
+    with engine.connect() as conn:
+        row = conn.execute(text(query), params).fetchone()
+    return int(row[0] or 0), (_to_ymd(row[1]) if row[1] is not None else None)
+
+
+def _local_watermark(manifest, start_ymd=None, end_ymd=None):
+    """本地 manifest 在区间内的 (行数, 最大 ymd)"""
+    days = [day for day in manifest['days']
+            if (start_ymd is None or day >= start_ymd) and (end_ymd is None or day <= end_ymd)]
+    return int(sum(manifest['days'][day] for day in days)), (max(days) if days else None)
+
+
+def _remote_day_checksums(engine, table_name, start_date=None, end_date=None):
+    """
+    远端每天的行数和内容校验和，复用 Mysql_Utils._day_checksums：BIT_XOR(CRC32(整行拼接))，数值被 upsert 修改也能发现
+    Returns:
+        dict: {'YYYYMMDD': (行数, 校验和)}
+    """
+    columns = mysql_utils._table_columns(engine, table_name)
+    sums = mysql_utils._day_checksums(engine, table_name, columns, True, start_date, end_date)
+    return {_to_ymd(day): checksum for day, checksum in sums.items()}
+
+
+def _group_batches(days, batch_days):
+    """把待拉取的日期（已排序）按 batch_days 个一组切分"""
+    return [days[i:i + batch_days] for i in range(0, len(days), batch_days)]
+
+
+def sync_table(user, password, host, database='quant', table_name='', start_date=None, end_date=None, verify=None):
+    """
+    把 [start_date, end_date] 内的远端数据增量同步到本地缓存
+      1. 先比较远端水位（区间行数 + 最大 ymd，只走索引）与本地 manifest，一致且区间内的校验都未过期时直接返回
+      2. 否则按天比较行数和 CRC 校验和（全区间扫描），只拉取缺失或内容变化的交易日；远端已删除的日期同步删除
+    整个同步持有表目录的进程间文件锁，多个进程同时同步同一张表时串行执行
+    Args:
+        table_name: MySQL 表名
+        database:   数据库名称
+        start_date: 起始日期
+        end_date:   结束日期
+        verify:     True 总是做校验和扫描；False 只看水位；None 水位一致时按 CACHE_CONFIG['checksum_ttl'] 决定
+    Returns:
+        int: 本次重新拉取的交易日数
+    """
+    start_ymd = _to_ymd(start_date) if start_date else None
+    end_ymd = _to_ymd(end_date) if end_date else None
+    table_dir = _table_dir(host, database, table_name)
+    engine = mysql_utils.get_engine(user, password, host, database)
+
+    with _table_lock(table_dir):
+        manifest = load_manifest(table_dir)
+        if manifest.get('dtype_version') != DTYPE_VERSION:
+            manifest['days'], manifest['checksums'], manifest['verified'] = {}, {}, {}
+            manifest['dtype_version'] = DTYPE_VERSION
+        cached_days, cached_sums, verified = manifest['days'], manifest['checksums'], manifest['verified']
+
+        if verify is not True and _remote_watermark(engine, table_name, start_ymd, end_ymd) == \
+                _local_watermark(manifest, start_ymd, end_ymd):
+            expire_before = time.time() - CACHE_CONFIG['checksum_ttl']
+            local_days = [day for day in cached_days
+                          if (start_ymd is None or day >= start_ymd) and (end_ymd is None or day <= end_ymd)]
+            if verify is False or all(verified.get(day, 0) >= expire_before for day in local_days):
+                return 0
+
+        remote_sums = _remote_day_checksums(engine, table_name, start_ymd, end_ymd)
+        checked_at = time.time()
+        stale_days = sorted(day for day, (cnt, crc) in remote_sums.items()
+                            if cached_days.get(day) != cnt or cached_sums.get(day) != crc)
+
+        # 远端已经没有的日期（仅限本次同步区间内）
+        removed_days = [day for day in cached_days
+                        if day not in remote_sums
+                        and (start_ymd is None or day >= start_ymd)
+                        and (end_ymd is None or day <= end_ymd)]
+        for day in removed_days:
+            if os.path.exists(_day_file(table_dir, day)):
+                os.remove(_day_file(table_dir, day))
+            cached_days.pop(day, None)
+            cached_sums.pop(day, None)
+            verified.pop(day, None)
+
+        for batch in _group_batches(stale_days, CACHE_CONFIG['batch_days']):
+            batch_set = set(batch)
+            chunks = []
+            for chunk in mysql_utils.iter_mysql_to_dataframe(user=user,
+                                                             password=password,
+                                                             host=host,
+                                                             database=database,
+                                                             table_name=table_name,
+                                                             start_date=batch[0],
+                                                             end_date=batch[-1]):
+                chunk = apply_table_dtypes(chunk, table_name, categorical=False)
+                chunks.append(chunk[pd.to_datetime(chunk['ymd']).dt.strftime('%Y%m%d').isin(batch_set)])
+
+            batch_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            if batch_df.empty:
+                continue
+
+            batch_ymd = pd.to_datetime(batch_df['ymd']).dt.strftime('%Y%m%d')
+            for day, day_df in batch_df.groupby(batch_ymd, sort=True):
+                tmp_path = _tmp_path(_day_file(table_dir, day))
+                day_df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, _day_file(table_dir, day))
+                cached_days[day] = len(day_df)
+                # 校验和记远端值：拉取期间远端又有改动时，下次同步行数或校验和对不上会再拉一次
+                cached_sums[day] = remote_sums[day][1]
+                verified[day] = checked_at
+
+            # 每批落盘后立即更新 manifest，中途失败下次只补剩余的日期
+            _save_manifest(table_dir, manifest)
+
+        # 校验一致的日期记下校验时间，有效期内只看水位
+        verified.update({day: checked_at for day in remote_sums if day not in stale_days})
+        _save_manifest(table_dir, manifest)
+
+    if stale_days or removed_days:
+        logging.info(f"    缓存表：{table_name} 同步完成，拉取 {len(stale_days)} 天，删除 {len(removed_days)} 天，"
+                     f"本地最新日期 {manifest['max_ymd']}，共 {manifest['row_count']} 行。")
+    return len(stale_days)
+
+
+def read_table(user, password, host, database='quant', table_name='', start_date=None, end_date=None, cols=None,
+               sync=True, compact=False, stock_codes=None, typed=True):
+    """
+    从本地缓存读取 [start_date, end_date] 的数据，返回结果与 data_from_mysql_to_dataframe 一致
+    Args:
+        table_name: MySQL 表名
+        database:   数据库名称
+        start_date: 起始日期
+        end_date:   结束日期
+        cols:       要选择的字段列表
+        sync:       读取前是否先与远端做增量同步
+        compact:    是否降精度（float32 价格、分类 stock_code），缓存文件本身始终按无损类型保存
+        stock_codes: 只读取这些股票（读 Parquet 时按行过滤），None 表示全市场
+        typed:      False 时 DATE 列还原为 datetime.date，与驱动直接读出的一致；小数列仍为 float64
+    Returns:
+        df: 读取到的 DataFrame
+    """
+    if sync:
+        sync_table(user, password, host, database, table_name, start_date, end_date)
+
+    start_ymd = _to_ymd(start_date) if start_date else None
+    end_ymd = _to_ymd(end_date) if end_date else None
+    table_dir = _table_dir(host, database, table_name)
+
+    with _table_lock(table_dir, shared=True):
+        days = sorted(day for day in load_manifest(table_dir)['days']
+                      if (start_ymd is None or day >= start_ymd) and (end_ymd is None or day <= end_ymd))
+        filters = [('stock_code', 'in', [str(code) for code in stock_codes])] if stock_codes is not None else None
+        parts = [pd.read_parquet(_day_file(table_dir, day), columns=list(cols) if cols else None, filters=filters)
+                 for day in days]
+
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    df = apply_table_dtypes(df, table_name, compact=compact)
+    if not typed:
+        df = _restore_driver_dates(df, table_name)
+    logging.info(f"    缓存表：{table_name} 读取成功，{len(days)} 个交易日，共 {df.shape[0]} 行。")
+    return df
+
+
+def _restore_driver_dates(df, table_name):
+    """把 DATE 列从 datetime64 还原为 datetime.date，供未开启 typed 的调用方使用"""
+    columns = load_schema_registry().get(table_name.lower(), {})
+    date_cols = [col for col, (mysql_type, _, _) in columns.items() if mysql_type == 'date'] or ['ymd']
+    for col in date_cols:
+        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.date
+    return df
+
+
+def clear_cache(host=None, database='quant', table_name=None):
+    """
+    删除缓存；不给 table_name 时清空整个缓存根目录
+    """
+    if table_name:
+        table_dir = _table_dir(host, database, table_name)
+        with _table_lock(table_dir):
+            shutil.rmtree(table_dir, ignore_errors=True)
+    else:
+        shutil.rmtree(get_cache_root(), ignore_errors=True)
@@ -0,0 +1,211 @@
+import os
+import json
+import uuid
+import shutil
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import CommonProperties.Mysql_Utils as mysql_utils
+from CommonProperties.Parquet_Cache import get_cache_root
+
+
+######################  行情面板字段：面板字段名 -> ods_stock_kline_daily_ts 字段名  #############################
+PANEL_FIELDS = {
+    'open': 'open',
+    'high': 'high',
+    'low': 'low',
+    'close': 'close',
+    'volume': 'volume',
+    'amount': 'trading_amount',
+}
+
+# 成交量 / 成交额超过 2^24 后 float32 无法精确表示，这两个字段用 float64；价格字段 float32 足够
+WIDE_FIELDS = ('volume', 'amount')
+
+DAYS_FILE = 'trading_days.npy'
+CODES_FILE = 'stock_codes.npy'
+META_FILE = 'meta.json'
+
+
+def get_panel_dir(host, database='quant'):
+    """面板目录，和 Parquet 缓存放在同一个根目录下"""
+    return os.path.join(get_cache_root(), 'price_panel', f"{host}_{database}")
+
+
+def build_price_panel(user, password, host, database='quant', start_date=None, end_date=None,
+                      table_name='ods_stock_kline_daily_ts', panel_dir=None):
+    """
+    把 K 线表物化成 [交易日 x 股票] 的稠密矩阵（价格 float32、成交量 / 成交额 float64），每个字段一个 .npy 文件，另存交易日 / 股票代码索引文件
+    停牌等缺失位置为 NaN。先写到临时目录再整体替换，已经 memmap 打开旧面板的进程不受影响
+    Args:
+        database:   数据库名称
+        start_date: 起始日期
+        end_date:   结束日期
+        table_name: K 线表名
+        panel_dir:  面板目录，默认 get_panel_dir(host, database)
+    Returns:
+        str: 面板目录
+    """
+    panel_dir = panel_dir or get_panel_dir(host, database)
+    cols = ['ymd', 'stock_code'] + list(PANEL_FIELDS.values())
+
+    kline_df = mysql_utils.data_from_mysql_to_dataframe(user=user,
+                                                        password=password,
+                                                        host=host,
+                                                        database=database,
+                                                        table_name=table_name,
+                                                        start_date=start_date,
+                                                        end_date=end_date,
+                                                        cols=cols)
+    if kline_df.empty:
+        logging.warning(f"    {table_name} 在 {start_date} - {end_date} 没有数据，行情面板未生成。")
+        return None
+
+    trading_days = pd.DatetimeIndex(pd.to_datetime(kline_df['ymd']).unique()).sort_values()
+    stock_codes = pd.Index(kline_df['stock_code'].astype(str).unique()).sort_values()
+    day_idx = trading_days.get_indexer(pd.to_datetime(kline_df['ymd']))
+    code_idx = stock_codes.get_indexer(kline_df['stock_code'].astype(str))
+    shape = (len(trading_days), len(stock_codes))
+
+    tmp_dir = f"{panel_dir}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir)
+    try:
+        for field, column in PANEL_FIELDS.items():
+            dtype = np.float64 if field in WIDE_FIELDS else np.float32
+            panel = np.lib.format.open_memmap(os.path.join(tmp_dir, f"{field}.npy"), mode='w+',
+                                              dtype=dtype, shape=shape)
+            panel[:] = np.nan
+            panel[day_idx, code_idx] = kline_df[column].to_numpy(dtype=dtype, na_value=np.nan)
+            panel.flush()
+            del panel
+
+        np.save(os.path.join(tmp_dir, DAYS_FILE), trading_days.values.astype('datetime64[D]'))
+        np.save(os.path.join(tmp_dir, CODES_FILE), stock_codes.to_numpy(dtype=str))
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as file:
+            json.dump({'table_name': table_name,
+                       'start_date': trading_days[0].strftime('%Y%m%d'),
+                       'end_date': trading_days[-1].strftime('%Y%m%d'),
+                       'shape': list(shape),
+                       'fields': list(PANEL_FIELDS),
+                       'built_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, file, ensure_ascii=False, indent=2)
+
+        # 旧目录先改名再删除：Linux 上已映射的页在进程关闭前仍然有效
+        old_dir = None
+        if os.path.exists(panel_dir):
+            old_dir = f"{panel_dir}.old-{uuid.uuid4().hex[:8]}"
+            os.rename(panel_dir, old_dir)
+        os.rename(tmp_dir, panel_dir)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    logging.info(f"    行情面板生成成功：{panel_dir}，{shape[0]} 个交易日 x {shape[1]} 只股票。")
+    return panel_dir
+
+
+class PricePanel:
+    """
+    只读的全市场行情面板，各字段矩阵以 np.memmap 打开：多个进程打开同一目录时共享操作系统页缓存，加载几乎零耗时
+    用法：
+        panel = PricePanel.open(host)
+        close = panel['close']                              # [n_days x n_stocks] memmap
+        close_df = panel.to_frame('close', '20250101', '20250630', ['000001', '600000'])
+    """
+
+    def __init__(self, panel_dir):
+        self.panel_dir = panel_dir
+        with open(os.path.join(panel_dir, META_FILE), 'r', encoding='utf-8') as file:
+            self.meta = json.load(file)
+
+        self.trading_days = pd.DatetimeIndex(np.load(os.path.join(panel_dir, DAYS_FILE)))
+        self.stock_codes = pd.Index(np.load(os.path.join(panel_dir, CODES_FILE)))
+        self._fields = {}
+
+    @classmethod
+    def open(cls, host, database='quant'):
+        return cls(get_panel_dir(host, database))
+
+    @property
+    def shape(self):
+        return len(self.trading_days), len(self.stock_codes)
+
+    def __getitem__(self, field):
+        """按需 memmap 打开字段矩阵，只读"""
+        if field not in self._fields:
+            if field not in PANEL_FIELDS:
+                raise KeyError(f"行情面板没有字段 {field}，可选：{list(PANEL_FIELDS)}")
+            self._fields[field] = np.load(os.path.join(self.panel_dir, f"{field}.npy"), mmap_mode='r')
+        return self._fields[field]
+
+    def covers(self, start_date, end_date):
+        """判断面板是否覆盖 [start_date, end_date]"""
+        return (self.trading_days[0] <= pd.to_datetime(str(start_date))
+                and self.trading_days[-1] >= pd.to_datetime(str(end_date)))
+
+    def day_slice(self, start_date=None, end_date=None):
+        """日期区间 -> 行切片，连续切片保证取出的仍是 memmap 视图而非拷贝"""
+        start = self.trading_days.searchsorted(pd.to_datetime(str(start_date))) if start_date else 0
+        stop = self.trading_days.searchsorted(pd.to_datetime(str(end_date)), side='right') if end_date else len(self.trading_days)
+        return slice(start, stop)
+
+    def code_indexer(self, stock_codes):
+        """股票代码 -> 列下标，不在面板中的代码为 -1"""
+        return self.stock_codes.get_indexer(pd.Index(stock_codes).astype(str))
+
+    def get(self, field, start_date=None, end_date=None, stock_codes=None):
+        """
+        取字段矩阵的子块
+        Args:
+            field:       open / high / low / close / volume / amount
+            start_date:  起始日期
+            end_date:    结束日期
+            stock_codes: 股票代码列表，None 表示全部（此时返回零拷贝视图）
+        Returns:
+            ndarray: [n_days x n_stocks]
+        """
+        values = self[field][self.day_slice(start_date, end_date)]
+        if stock_codes is None:
+            return values
+        code_idx = self.code_indexer(stock_codes)
+        result = values[:, np.where(code_idx >= 0, code_idx, 0)]
+        result[:, code_idx < 0] = np.nan
+        return result
+
+    def to_frame(self, field, start_date=None, end_date=None, stock_codes=None):
+        """取字段子块并包装成 index=交易日、columns=股票代码 的 DataFrame"""
+        rows = self.day_slice(start_date, end_date)
+        columns = self.stock_codes if stock_codes is None else pd.Index(stock_codes)
+        return pd.DataFrame(self.get(field, start_date, end_date, stock_codes),
+                            index=self.trading_days[rows], columns=columns, copy=False)
+
+    def to_long(self, stock_code, start_date=None, end_date=None):
+        """
+        取单只股票的 OHLCV 长表，列名与 ods_stock_kline_daily_ts 一致，去掉停牌（close 为 NaN）的日期
+        """
+        rows = self.day_slice(start_date, end_date)
+        code_idx = self.code_indexer([stock_code])[0]
+        if code_idx < 0:
+            return pd.DataFrame()
+
+        df = pd.DataFrame({'ymd': self.trading_days[rows]})
+        for field, column in PANEL_FIELDS.items():
+            df[column] = self[field][rows, code_idx]
+        df.insert(1, 'stock_code', stock_code)
+        return df[df['close'].notna()].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    from CommonProperties import set_config
+    set_config.setup_logging_config()
+
+    build_price_panel(user=mysql_utils.origin_user,
+                      password=mysql_utils.origin_password,
+                      host=mysql_utils.origin_host,
+                      database=mysql_utils.origin_database,
+                      start_date='20240101',
+                      end_date=datetime.now().strftime('%Y%m%d'))
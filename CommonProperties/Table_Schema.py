@@ -0,0 +1,161 @@
+import os
+import re
+import decimal
+import logging
+
+import pandas as pd
+
+######################  建表 SQL 所在目录  #############################
+ddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datas_prepare', 'C00_SQL')
+
+# 建表语句里不是字段定义的行
+_NON_COLUMN_KEYWORDS = {'UNIQUE', 'INDEX', 'KEY', 'PRIMARY', 'CONSTRAINT', 'FOREIGN', 'FULLTEXT'}
+_COLUMN_PATTERN = re.compile(r'^`?(\w+)`?\s+(\w+)\s*(\(\s*[\d\s,]+\))?', re.IGNORECASE)
+_CREATE_PATTERN = re.compile(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:\w+\.)?(\w+)\s*\(', re.IGNORECASE)
+
+# table_name -> {column: (mysql_type, 精度参数, 是否可为 NULL)}
+_schema_registry = None
+
+
+def _extract_table_body(sql_text, open_idx):
+    """从 CREATE TABLE 的左括号开始按括号配对截取字段定义部分"""
+    depth = 0
+    for idx in range(open_idx, len(sql_text)):
+        if sql_text[idx] == '(':
+            depth += 1
+        elif sql_text[idx] == ')':
+            depth -= 1
+            if depth == 0:
+                return sql_text[open_idx + 1:idx]
+    return sql_text[open_idx + 1:]
+
+
+def parse_ddl(sql_text):
+    """
+    解析建表 SQL，返回各表的字段类型
+    Args:
+        sql_text: 建表 SQL 文本
+    Returns:
+        dict: {table_name: {column: (mysql_type, 精度参数, 是否可为 NULL)}}
+    """
+    schemas = {}
+    for match in _CREATE_PATTERN.finditer(sql_text):
+        table_name = match.group(1).lower()
+        body = _extract_table_body(sql_text, match.end() - 1)
+
+        columns = {}
+        for line in body.splitlines():
+            line = line.strip().lstrip(',').strip()
+            if not line or line.startswith('--'):
+                continue
+            if line.split()[0].upper() in _NON_COLUMN_KEYWORDS:
+                continue
+            column_match = _COLUMN_PATTERN.match(line)
+            if column_match:
+                column, mysql_type, type_args = column_match.groups()
+                nullable = 'NOT NULL' not in line.upper()
+                columns[column.lower()] = (mysql_type.lower(), type_args, nullable)
+
+        schemas[table_name] = columns
+    return schemas
+
+
+def load_schema_registry(reload=False):
+    """
+    读取 datas_prepare/C00_SQL 下所有 .sql 建表文件，构建 表 -> 字段类型 注册表（进程内只解析一次）
+    """
+    global _schema_registry
+    if _schema_registry is not None and not reload:
+        return _schema_registry
+
+    registry = {}
+    if os.path.isdir(ddl_dir):
+        for file_name in sorted(os.listdir(ddl_dir)):
+            if not file_name.endswith('.sql'):
+                continue
+            with open(os.path.join(ddl_dir, file_name), 'r', encoding='utf-8') as file:
+                registry.update(parse_ddl(file.read()))
+    else:
+        logging.warning(f"建表 SQL 目录不存在: {ddl_dir}")
+
+    _schema_registry = registry
+    return _schema_registry
+
+
+def _mysql_type_to_dtype(column, mysql_type, type_args, nullable=True, compact=False):
+    """
+    MySQL 字段类型 -> 读入 pandas 后的目标 dtype，返回 None 表示保持原样
+    默认只做无损转换（日期 -> datetime64，小数 -> float64，成交量 -> int64 / 可为空时 float64）；
+    compact=True 时价格降为 float32、stock_code 转分类，仅供只读的大区间分析使用，不要用在读出后再写回库的路径上
+    """
+    if column == 'stock_code':
+        return 'category' if compact else None
+    if mysql_type in ('date', 'datetime', 'timestamp'):
+        return 'datetime64[ns]'
+    if mysql_type in ('float', 'decimal', 'numeric'):
+        return 'float32' if compact else 'float64'
+    if mysql_type in ('double', 'real'):
+        # 带精度的 double(12,2) 多是价格，compact 时降为 float32；裸 double 多是金额 / 市值，始终保留 float64
+        return 'float32' if compact and type_args else 'float64'
+    if mysql_type in ('bigint', 'int', 'integer') and 'volume' in column:
+        # 成交量超过 2^24 后 float32 无法精确表示，任何模式下都不降精度
+        return 'float64' if nullable else 'int64'
+    return None
+
+
+def get_table_dtypes(table_name, compact=False):
+    """
+    获取某张表各字段读入 pandas 后的目标 dtype
+    Args:
+        table_name: 表名
+        compact:    是否降精度（float32 价格、分类 stock_code）
+    Returns:
+        dict: {column: dtype}，表不在建表 SQL 中时返回 {}
+    """
+    columns = load_schema_registry().get(table_name.lower(), {})
+    dtypes = {}
+    for column, (mysql_type, type_args, nullable) in columns.items():
+        dtype = _mysql_type_to_dtype(column, mysql_type, type_args, nullable, compact)
+        if dtype:
+            dtypes[column] = dtype
+    return dtypes
+
+
+def apply_table_dtypes(df, table_name, categorical=True, compact=False):
+    """
+    按注册表把 DataFrame 的列转换为目标 dtype：ymd 等日期列 datetime64[ns]，小数 float64，整数成交量 int64
+    compact=True 时价格再降为 float32、stock_code 转分类
+    表不在注册表中时只做兜底转换：ymd 转 datetime64，Decimal 列转 float
+    Args:
+        df:          读取到的 DataFrame
+        table_name:  来源表名
+        categorical: 是否转换分类列；分块读取时应在全部拼接后再转，避免各块分类不一致
+        compact:     是否降精度
+    Returns:
+        df: 转换后的 DataFrame
+    """
+    if df.empty:
+        return df
+
+    dtypes = get_table_dtypes(table_name, compact=compact)
+    if not dtypes:
+        dtypes = {'ymd': 'datetime64[ns]'} if 'ymd' in df.columns else {}
+        for col in df.columns[df.dtypes == object]:
+            sample = df[col].dropna()
+            if not sample.empty and isinstance(sample.iloc[0], decimal.Decimal):
+                dtypes[col] = 'float64'
+
+    for col, dtype in dtypes.items():
+        if col not in df.columns or str(df[col].dtype) == dtype:
+            continue
+        if dtype == 'category':
+            if categorical:
+                df[col] = df[col].astype('category')
+        elif dtype == 'datetime64[ns]':
+            df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+        elif dtype == 'int64' and df[col].isna().any():
+            # 建表为 NOT NULL 但实际读到空值（如 LEFT JOIN 结果）时退回 float64，不丢数据
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
@@ -76,7 +76,8 @@ def transfer_local_to_origin_mysql():
                                          source_db_url=local_db_url,
                                          target_host=origin_host,
                                          target_db_url=origin_db_url,
-                                         table_name=tableName)
+                                         table_name=tableName,
+                                         mode='shadow')
 
 
 # @timing_decorator
@@ -134,7 +135,8 @@ def transfer_origin_to_local_mysql():
                                          source_db_url=origin_db_url,
                                          target_host=local_host,
                                          target_db_url=local_db_url,
-                                         table_name=tableName)
+                                         table_name=tableName,
+                                         mode='shadow')
 
 @timing_decorator
 def append_origin_to_local_mysql():
@@ -189,33 +191,19 @@ def append_origin_to_local_mysql():
     start_date = '2025-01-03'
     end_date = '2025-02-22'
 
-    for tableName in table_all_list:
-        sourceTable = tableName
-        targetTable = tableName
-
-        mysql_utils.cross_server_upsert_ymd(source_user=origin_user,
-                                            source_password=origin_password,
-                                            source_host=origin_host,
-                                            source_database=origin_database,
-                                            target_user=local_user,
-                                            target_password=local_password,
-                                            target_host=local_host,
-                                            target_database=local_database,
-                                            source_table=sourceTable,
-                                            target_table=targetTable,
-                                            start_date=start_date,
-                                            end_date=end_date)
-
-        # mysql_utils.cross_server_upsert_all(source_user=origin_user,
-        #                                     source_password=origin_password,
-        #                                     source_host=origin_host,
-        #                                     source_database=origin_database,
-        #                                     target_user=local_user,
-        #                                     target_password=local_password,
-        #                                     target_host=local_host,
-        #                                     target_database=local_database,
-        #                                     source_table=sourceTable,
-        #                                     target_table=targetTable)
+    # 按交易日比对两端校验和，只流式同步不一致的交易日，多张表并发
+    mysql_utils.sync_tables_parallel(source_user=origin_user,
+                                     source_password=origin_password,
+                                     source_host=origin_host,
+                                     source_database=origin_database,
+                                     target_user=local_user,
+                                     target_password=local_password,
+                                     target_host=local_host,
+                                     target_database=local_database,
+                                     tables=table_all_list,
+                                     start_date=start_date,
+                                     end_date=end_date,
+                                     max_workers=4)
 
 
 @timing_decorator
@@ -268,33 +256,19 @@ def append_local_to_origin_mysql():
     start_date = '2024-10-01'
     end_date = '2024-11-04'
 
-    for tableName in table_all_list:
-        sourceTable = tableName
-        targetTable = tableName
-
-        mysql_utils.cross_server_upsert_ymd(source_user=local_user,
-                                            source_password=local_password,
-                                            source_host=local_host,
-                                            source_database=local_database,
-                                            target_user=origin_user,
-                                            target_password=origin_password,
-                                            target_host=origin_host,
-                                            target_database=origin_database,
-                                            source_table=sourceTable,
-                                            target_table=targetTable,
-                                            start_date=start_date,
-                                            end_date=end_date)
-
-        # mysql_utils.cross_server_upsert_all(source_user=local_user,
-        #                                     source_password=local_password,
-        #                                     source_host=local_host,
-        #                                     source_database=local_database,
-        #                                     target_user=origin_user,
-        #                                     target_password=origin_password,
-        #                                     target_host=origin_host,
-        #                                     target_database=origin_database,
-        #                                     source_table=sourceTable,
-        #                                     target_table=targetTable)
+    # 按交易日比对两端校验和，只流式同步不一致的交易日，多张表并发
+    mysql_utils.sync_tables_parallel(source_user=local_user,
+                                     source_password=local_password,
+                                     source_host=local_host,
+                                     source_database=local_database,
+                                     target_user=origin_user,
+                                     target_password=origin_password,
+                                     target_host=origin_host,
+                                     target_database=origin_database,
+                                     tables=table_all_list,
+                                     start_date=start_date,
+                                     end_date=end_date,
+                                     max_workers=4)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+import time
+import logging
+
+from CommonProperties import Mysql_Utils
+from CommonProperties import set_config
+
+# ************************************************************************
+#  调用日志配置
+set_config.setup_logging_config()
+
+
+def benchmark_parallel_read(table_name='ods_stock_kline_daily_ts', start_date='20250101', end_date='20260227',
+                            cols=None, worker_options=(2, 4, 8), span_days=30):
+    """
+    对比单线程顺序读取与按 ymd 分区并发读取的耗时
+    Args:
+        table_name:     要读取的表
+        start_date:     起始日期
+        end_date:       结束日期
+        cols:           读取的字段
+        worker_options: 依次测试的并发线程数
+        span_days:      每个子区间的自然日跨度
+    Returns:
+        dict: {读取方式: 耗时秒数}
+    """
+    cols = cols or ['ymd', 'stock_code', 'open', 'high', 'low', 'close', 'volume']
+    db_args = dict(user=Mysql_Utils.origin_user,
+                   password=Mysql_Utils.origin_password,
+                   host=Mysql_Utils.origin_host,
+                   database=Mysql_Utils.origin_database,
+                   table_name=table_name,
+                   start_date=start_date,
+                   end_date=end_date,
+                   cols=cols)
+
+    # 先借一次连接，把建池开销排除在计时之外
+    Mysql_Utils.execute_query(user=db_args['user'], password=db_args['password'], host=db_args['host'],
+                              database=db_args['database'], sql="SELECT 1")
+
+    results = {}
+
+    start = time.perf_counter()
+    single_df = Mysql_Utils.data_from_mysql_to_dataframe(**db_args)
+    results['single'] = time.perf_counter() - start
+    logging.info(f"单线程读取 {len(single_df)} 行，耗时 {results['single']:.2f} 秒")
+
+    for workers in worker_options:
+        start = time.perf_counter()
+        parallel_df = Mysql_Utils.data_from_mysql_to_dataframe_parallel(max_workers=workers, span_days=span_days,
+                                                                        **db_args)
+        elapsed = time.perf_counter() - start
+        results[f'parallel_{workers}'] = elapsed
+        logging.info(f"{workers} 线程并发读取 {len(parallel_df)} 行，耗时 {elapsed:.2f} 秒，"
+                     f"加速比 {results['single'] / elapsed:.2f}x")
+
+    logging.info(f"连接池统计: {Mysql_Utils.get_pool_stats()}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_parallel_read()
@@ -0,0 +1,161 @@
+import math
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from CommonProperties import set_config
+from strategy.scoring_kernels import (sigmoid_score, capped_linear_score, log2_score, binary_score, banded_score,
+                                      level_bucket)
+
+# ************************************************************************
+#  调用日志配置
+set_config.setup_logging_config()
+
+# 每个内核至少要比逐行 apply 快这么多倍
+MIN_SPEEDUP = 20
+
+
+######################  改造前 factor_library 中的标量打分函数，仅用于核对结果和计时  #############################
+
+def legacy_smooth_score(pct):
+    if pd.isna(pct):
+        return 0.0
+    x = pct * 0.15
+    sigmoid = 1 / (1 + math.exp(-x))
+    return round(100 * (1 - sigmoid), 2)
+
+
+def legacy_zt_score(scoring_method, lookback_days=5):
+    if scoring_method == 'log':
+        max_score_factor = 100 / math.log2(lookback_days + 1) if lookback_days > 0 else 20
+
+        def calculate_score(zt_count):
+            if zt_count == 0:
+                return 0
+            return min(round(math.log2(zt_count + 1) * max_score_factor, 2), 100)
+    elif scoring_method == 'binary':
+        def calculate_score(zt_count):
+            return 100 if zt_count > 0 else 0
+    else:
+        score_per_zt = 100 / lookback_days if lookback_days > 0 else 20
+
+        def calculate_score(zt_count):
+            return min(zt_count * score_per_zt, 100)
+
+    return lambda zt_count: round(calculate_score(zt_count), 2)
+
+
+def legacy_volume_score(row):
+    score = 0
+    if not pd.isna(row['vol_ma5']) and not pd.isna(row['vol_ma60']):
+        if row['vol_ma5'] < row['vol_ma60'] * 0.8:
+            score += 30
+        elif row['vol_ma5'] < row['vol_ma60']:
+            score += 20
+        elif row['vol_ma5'] < row['vol_ma60'] * 1.2:
+            score += 10
+
+    if row['consecutive_shrink_days'] >= 3:
+        score += 30
+    elif row['consecutive_shrink_days'] == 2:
+        score += 20
+    elif row['consecutive_shrink_days'] == 1:
+        score += 10
+    return min(score, 60)
+
+
+def legacy_price_score(row):
+    if row['consecutive_down_days'] >= 3:
+        return 40
+    elif row['consecutive_down_days'] == 2:
+        return 30
+    elif row['consecutive_down_days'] == 1:
+        return 20
+    return 0
+
+
+def legacy_score_level(score):
+    if score >= 80:
+        return 'A'
+    elif score >= 60:
+        return 'B'
+    elif score >= 40:
+        return 'C'
+    elif score >= 20:
+        return 'D'
+    return 'E'
+
+
+def make_synthetic_scores(n_rows=1_000_000, seed=0):
+    """构造各打分函数的输入列：股东人数变化、涨停次数、均量、连续天数、综合得分"""
+    rng = np.random.default_rng(seed)
+    pct = rng.normal(0, 15, n_rows).round(2)
+    pct[rng.random(n_rows) < 0.05] = np.nan
+    vol_ma60 = rng.uniform(1e5, 1e7, n_rows)
+    vol_ma5 = vol_ma60 * rng.uniform(0.5, 1.5, n_rows)
+    vol_ma5[rng.random(n_rows) < 0.02] = np.nan
+    return pd.DataFrame({'pct_of_total_sh': pct,
+                         'zt_count': rng.integers(0, 6, n_rows),
+                         'vol_ma5': vol_ma5,
+                         'vol_ma60': vol_ma60,
+                         'consecutive_shrink_days': rng.integers(0, 6, n_rows),
+                         'consecutive_down_days': rng.integers(0, 6, n_rows),
+                         'composite_score': rng.integers(0, 101, n_rows).astype(np.float64)})
+
+
+def _time_per_million(func, n_rows, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat * 1_000_000 / n_rows
+
+
+def benchmark_scoring_kernels(n_rows=1_000_000, legacy_rows=200_000):
+    """
+    各打分内核的微基准：与旧版 apply 实现逐值核对，并按每百万行耗时比较
+    旧版逐行 apply（尤其 axis=1）在百万行上要跑几十秒，只取前 legacy_rows 行计时后按行数折算
+    Returns:
+        DataFrame: kernel, legacy_ms_per_million, vectorized_ms_per_million, speedup
+    """
+    df = make_synthetic_scores(n_rows)
+    legacy_df = df.iloc[:legacy_rows]
+
+    cases = [
+        ('sigmoid', lambda frame: frame['pct_of_total_sh'].apply(legacy_smooth_score),
+         lambda frame: sigmoid_score(frame['pct_of_total_sh'], steepness=0.15)),
+        ('capped_linear', lambda frame: frame['zt_count'].apply(legacy_zt_score('linear')),
+         lambda frame: capped_linear_score(frame['zt_count'], 100 / 5)),
+        ('log2', lambda frame: frame['zt_count'].apply(legacy_zt_score('log')),
+         lambda frame: log2_score(frame['zt_count'], 5)),
+        ('binary', lambda frame: frame['zt_count'].apply(legacy_zt_score('binary')),
+         lambda frame: binary_score(frame['zt_count'])),
+        ('banded_volume', lambda frame: frame.apply(legacy_volume_score, axis=1),
+         lambda frame: np.minimum(banded_score(frame['vol_ma5'], [frame['vol_ma60'] * 0.8, frame['vol_ma60'],
+                                                                  frame['vol_ma60'] * 1.2], [30, 20, 10], below=True)
+                                  + banded_score(frame['consecutive_shrink_days'], [3, 2, 1], [30, 20, 10]), 60)),
+        ('banded_price', lambda frame: frame.apply(legacy_price_score, axis=1),
+         lambda frame: banded_score(frame['consecutive_down_days'], [3, 2, 1], [40, 30, 20])),
+        ('level_bucket', lambda frame: frame['composite_score'].apply(legacy_score_level),
+         lambda frame: level_bucket(frame['composite_score'], [80, 60, 40, 20], ['A', 'B', 'C', 'D'], default='E')),
+    ]
+
+    rows = []
+    for name, legacy_func, kernel_func in cases:
+        legacy_result, legacy_ms = _time_per_million(lambda: legacy_func(legacy_df), legacy_rows)
+        np.testing.assert_array_equal(np.asarray(kernel_func(legacy_df)), legacy_result.to_numpy())
+
+        _, kernel_ms = _time_per_million(lambda: kernel_func(df), n_rows, repeat=3)
+        speedup = legacy_ms / kernel_ms
+        rows.append({'kernel': name, 'legacy_ms_per_million': legacy_ms * 1000,
+                     'vectorized_ms_per_million': kernel_ms * 1000, 'speedup': speedup})
+        logging.info(f"{name}: 旧实现 {legacy_ms:.2f} 秒/百万行，向量化 {kernel_ms * 1000:.1f} 毫秒/百万行，加速比约 {speedup:.0f}x")
+        if speedup < MIN_SPEEDUP:
+            logging.warning(f"{name} 加速比 {speedup:.1f}x 低于 {MIN_SPEEDUP}x")
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    print(benchmark_scoring_kernels())
@@ -0,0 +1,79 @@
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+import backtrader as bt
+
+from CommonProperties import set_config
+from backtest.backtest_engine import StockBacktestEngine
+from backtest.factor_driven_strategy import FactorDrivenStrategy
+from backtest.vectorized_simulator import simulate_factor_strategy
+from strategy.factor_score_table import FactorScoreTable
+
+# ************************************************************************
+#  调用日志配置
+set_config.setup_logging_config()
+
+FACTORS = ['pb', 'zt', 'shareholder']
+
+
+def make_synthetic_market(n_stocks, n_days, seed=0, halt_ratio=0.0):
+    """构造得分矩阵（5 日平滑，让持仓有延续性）和收盘价矩阵"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2023-01-02', periods=n_days)
+    scores = {name: pd.DataFrame(np.clip(rng.normal(55, 25, (n_days, n_stocks)), 0, 100))
+              .rolling(5, min_periods=1).mean().round(2).to_numpy() for name in FACTORS}
+    close = 10 * np.cumprod(1 + rng.normal(0.0003, 0.02, (n_days, n_stocks)), axis=0)
+    close[rng.random(close.shape) < halt_ratio] = np.nan
+    return dates, scores, close
+
+
+def run_backtrader(dates, scores, close, params, initial_cash=100000):
+    """同一份数据用 backtrader + FactorDrivenStrategy 跑一遍，作为对照"""
+    codes = [f'{600000 + idx}' for idx in range(close.shape[1])]
+    table = FactorScoreTable.from_arrays(np.stack([scores[name] for name in FACTORS]), FACTORS, dates, codes)
+    engine = StockBacktestEngine.from_factor_scores(table)
+
+    cerebro = engine.create_cerebro(initial_cash)
+    for idx, code in enumerate(codes):
+        kline_df = pd.DataFrame({'open': close[:, idx], 'high': close[:, idx], 'low': close[:, idx],
+                                 'close': close[:, idx], 'volume': 1e6}, index=dates)
+        cerebro.adddata(bt.feeds.PandasData(dataname=kline_df), name=code)
+    cerebro.addstrategy(FactorDrivenStrategy, backtest_engine=engine, **params)
+    strat = cerebro.run()[0]
+    return engine._extract_performance_metrics(strat, initial_cash, cerebro, 'start', 'end')
+
+
+def benchmark_vectorized_simulator(n_stocks=5000, n_days=750, check_stocks=20, check_days=600):
+    """
+    1. 小股票池上与 backtrader 逐项核对绩效字典
+    2. 全市场规模（默认 5000 只 x 750 个交易日）计时
+    Returns:
+        dict: backtrader_seconds, vectorized_seconds, full_universe_seconds
+    """
+    dates, scores, close = make_synthetic_market(check_stocks, check_days)
+    params = {'buy_threshold': 60, 'hold_threshold': 45, 'sell_threshold': 30}
+
+    start = time.perf_counter()
+    expected = run_backtrader(dates, scores, close, params)
+    backtrader_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = simulate_factor_strategy(scores, close, dates, 'start', 'end', params=params)['metrics']
+    vectorized_seconds = time.perf_counter() - start
+    assert actual == expected, f"与 backtrader 结果不一致：\n{expected}\n{actual}"
+
+    dates, scores, close = make_synthetic_market(n_stocks, n_days, halt_ratio=0.02)
+    start = time.perf_counter()
+    metrics = simulate_factor_strategy(scores, close, dates, 'start', 'end')['metrics']
+    full_universe_seconds = time.perf_counter() - start
+
+    logging.info(f"{check_stocks} 只 x {check_days} 天：backtrader {backtrader_seconds:.2f} 秒，向量化 {vectorized_seconds:.3f} 秒，绩效一致")
+    logging.info(f"全市场 {n_stocks} 只 x {n_days} 天：{full_universe_seconds:.2f} 秒，共 {metrics['总交易次数']} 笔交易")
+    return {'backtrader_seconds': backtrader_seconds, 'vectorized_seconds': vectorized_seconds,
+            'full_universe_seconds': full_universe_seconds}
+
+
+if __name__ == '__main__':
+    print(benchmark_vectorized_simulator())
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from strategy.factor_cache import FactorCache
+
+TRADING_DAYS = [day.strftime('%Y%m%d') for day in pd.bdate_range('2026-01-05', periods=20)]
+
+
+def _compute(start_ymd, end_ymd):
+    days = [day for day in TRADING_DAYS if start_ymd <= day <= end_ymd]
+    return pd.DataFrame({'ymd': np.repeat(days, 1000),
+                         'stock_code': np.tile([f"{i:06d}" for i in range(1000)], len(days)),
+                         'pb_score': np.random.default_rng(0).uniform(0, 100, 1000 * len(days))})
+
+
+def test_small_memory_limit_keeps_every_day():
+    cache = FactorCache(max_bytes=100_000)
+    result = cache.get_range('pb', {}, TRADING_DAYS, _compute)
+    assert cache.stats['evicted_days'] > 0
+    assert result['ymd'].nunique() == len(TRADING_DAYS)
+    assert len(result) == 1000 * len(TRADING_DAYS)
+
+    # 再取一次：被淘汰的日期重新计算，结果仍然完整
+    again = cache.get_range('pb', {}, TRADING_DAYS, _compute)
+    assert again['ymd'].nunique() == len(TRADING_DAYS)
+
+
+def test_spilled_days_are_read_back(tmp_path):
+    cache = FactorCache(max_bytes=100_000, spill_dir=str(tmp_path))
+    first = cache.get_range('pb', {}, TRADING_DAYS, _compute)
+    calls = []
+    second = cache.get_range('pb', {}, TRADING_DAYS, lambda start, end: calls.append((start, end)) or _compute(start, end))
+    assert not calls
+    pd.testing.assert_frame_equal(first, second)
+
+
+if __name__ == '__main__':
+    import tempfile
+    from pathlib import Path
+    test_small_memory_limit_keeps_every_day()
+    test_spilled_days_are_read_back(Path(tempfile.mkdtemp()))
+    print('ok')
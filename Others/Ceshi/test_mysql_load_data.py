@@ -0,0 +1,89 @@
+import re
+
+import pandas as pd
+import pymysql
+from pymysql.constants import COMMAND
+from pymysql.protocol import MysqlPacket
+
+from CommonProperties import Mysql_Utils
+
+
+class FakeInfileServer(pymysql.connections.Connection):
+    """
+    不连真实 MySQL 的 pymysql 连接：只替换收发包，服务端对 LOAD DATA LOCAL INFILE 的应答按协议构造，
+    客户端一侧（LoadLocalPacketWrapper 解析文件名、_send_local_file 读文件发包、读 OK 包）走 pymysql 原生代码
+    """
+
+    def __init__(self):
+        super().__init__(defer_connect=True, local_infile=True)
+        self.queries = []
+        self.received = b''
+        self._pending = []
+
+    @staticmethod
+    def _ok_packet(affected_rows):
+        return MysqlPacket(b'\x00' + bytes([affected_rows]) + b'\x00' + b'\x02\x00' + b'\x00\x00', 'utf8')
+
+    def _execute_command(self, command, sql):
+        assert command == COMMAND.COM_QUERY
+        sql = sql.decode('utf8') if isinstance(sql, bytes) else sql
+        self.queries.append(sql)
+        match = re.search(r"LOCAL INFILE '([^']*)'", sql)
+        if match:
+            # 服务端回 0xFB + 文件名（bytes），要求客户端发送该文件
+            self._pending.append(MysqlPacket(b'\xfb' + match.group(1).encode('utf8'), 'utf8'))
+        else:
+            self._pending.append(self._ok_packet(0))
+
+    def _read_packet(self, packet_type=MysqlPacket):
+        if self._pending:
+            return self._pending.pop(0)
+        # 文件发送完毕（客户端已写空包），按收到的行数回 OK
+        return self._ok_packet(self.received.count(b'\n'))
+
+    def write_packet(self, payload):
+        self.received += payload
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def raw_connection(self):
+        return self.connection
+
+
+def test_load_data_sends_payload_through_pymysql_infile_flow():
+    df = pd.DataFrame({'ymd': ['2025-01-02', '2025-01-03'], 'stock_code': ['600000', '000001'],
+                       'volume': [123456789, None]})
+    payload = Mysql_Utils._dataframe_to_csv_bytes(df)
+    server = FakeInfileServer()
+
+    affected = Mysql_Utils._execute_load_data(FakeEngine(server), 'ods_test', list(df.columns), payload, 'ignore')
+
+    assert affected == 2
+    assert server.received == payload
+    assert server.queries[0].lstrip().startswith('LOAD DATA LOCAL INFILE')
+    assert server.queries[-1] == 'COMMIT'
+
+
+def test_load_data_removes_temp_file():
+    server = FakeInfileServer()
+    Mysql_Utils._execute_load_data(FakeEngine(server), 'ods_test', ['a'], b'1\n', 'ignore')
+
+    filename = re.search(r"LOCAL INFILE '([^']*)'", server.queries[0]).group(1)
+    try:
+        open(filename, 'rb')
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError(f"临时文件未删除：{filename}")
+
+
+if __name__ == '__main__':
+    test_load_data_sends_payload_through_pymysql_infile_flow()
+    test_load_data_removes_temp_file()
+    print('ok')
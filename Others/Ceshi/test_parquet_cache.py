@@ -0,0 +1,106 @@
+import os
+import zlib
+import datetime
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+from CommonProperties import Parquet_Cache
+import CommonProperties.Mysql_Utils as mysql_utils
+
+# 假的远端表：不连 MySQL，水位 / _day_checksums / 分块读取都从这个 DataFrame 计算
+REMOTE = {'df': pd.DataFrame({'ymd': pd.to_datetime(['2026-01-05', '2026-01-05', '2026-01-06']),
+                              'stock_code': ['000001', '000002', '000001'],
+                              'close': [10.0, 20.0, 10.5]})}
+CALLS = {'checksums': 0}
+
+
+def _fake_day_checksums(engine, table_name, columns, has_ymd=True, start_date=None, end_date=None):
+    CALLS['checksums'] += 1
+    sums = {}
+    for ymd, day_df in REMOTE['df'].groupby('ymd'):
+        crc = 0
+        for row in day_df.astype(str).itertuples(index=False):
+            crc ^= zlib.crc32('|'.join(row).encode('utf-8'))
+        sums[ymd.strftime('%Y-%m-%d')] = (len(day_df), crc)
+    return sums
+
+
+def _fake_watermark(engine, table_name, start_date=None, end_date=None):
+    df = REMOTE['df']
+    return len(df), df['ymd'].max().strftime('%Y%m%d')
+
+
+def _fake_iter(user, password, host, database='quant', table_name='', start_date=None, end_date=None, **kwargs):
+    df = REMOTE['df']
+    yield df[(df['ymd'] >= pd.to_datetime(start_date)) & (df['ymd'] <= pd.to_datetime(end_date))].copy()
+
+
+def _patch(mp, cache_root):
+    mp.setitem(Parquet_Cache.CACHE_CONFIG, 'root', cache_root)
+    mp.setattr(mysql_utils, 'get_engine', lambda *args, **kwargs: None)
+    mp.setattr(mysql_utils, '_table_columns', lambda engine, table_name: list(REMOTE['df'].columns))
+    mp.setattr(mysql_utils, '_day_checksums', _fake_day_checksums)
+    mp.setattr(mysql_utils, 'iter_mysql_to_dataframe', _fake_iter)
+    mp.setattr(Parquet_Cache, '_remote_watermark', _fake_watermark)
+
+
+def _sync_in_process(cache_root):
+    # 子进程用完即退出，补丁不需要还原
+    _patch(pytest.MonkeyPatch(), cache_root)
+    Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo')
+    return Parquet_Cache.load_manifest(Parquet_Cache._table_dir('h', 'quant', 't_demo'))['row_count']
+
+
+def test_value_change_with_same_row_count_is_resynced(monkeypatch):
+    _patch(monkeypatch, tempfile.mkdtemp())
+    monkeypatch.setitem(REMOTE, 'df', REMOTE['df'].copy())
+    assert Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo') == 2
+    assert Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo') == 0
+
+    # 更早的一天数值被 upsert 修改，行数不变：水位一致，需要校验和扫描才能发现
+    REMOTE['df'].loc[0, 'close'] = 11.0
+    assert Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo', verify=True) == 1
+    df = Parquet_Cache.read_table('u', 'p', 'h', table_name='t_demo', sync=False)
+    assert df.loc[df['stock_code'] == '000001', 'close'].iloc[0] == 11.0
+
+    # 未 typed 的调用方拿到与驱动一致的 date 对象
+    untyped = Parquet_Cache.read_table('u', 'p', 'h', table_name='t_demo', sync=False, typed=False)
+    assert isinstance(untyped['ymd'].iloc[0], datetime.date)
+
+
+def test_matching_watermark_skips_checksum_scan_until_ttl(monkeypatch):
+    _patch(monkeypatch, tempfile.mkdtemp())
+    monkeypatch.setitem(CALLS, 'checksums', 0)
+    Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo')
+    assert CALLS['checksums'] == 1
+
+    # 水位一致且校验未过期：不扫描
+    assert Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo') == 0
+    assert CALLS['checksums'] == 1
+
+    # 校验过期：重新扫描
+    monkeypatch.setitem(Parquet_Cache.CACHE_CONFIG, 'checksum_ttl', -1)
+    assert Parquet_Cache.sync_table('u', 'p', 'h', table_name='t_demo') == 0
+    assert CALLS['checksums'] == 2
+
+
+def test_concurrent_process_syncs_leave_consistent_cache():
+    cache_root = tempfile.mkdtemp()
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        row_counts = list(executor.map(_sync_in_process, [cache_root] * 8))
+    assert set(row_counts) == {3}
+
+    table_dir = os.path.join(cache_root, 'h_quant', 't_demo')
+    assert not [name for name in os.listdir(table_dir) if '.tmp' in name]
+
+
+if __name__ == '__main__':
+    with pytest.MonkeyPatch.context() as mp:
+        test_value_change_with_same_row_count_is_resynced(mp)
+    with pytest.MonkeyPatch.context() as mp:
+        test_matching_watermark_skips_checksum_scan_until_ttl(mp)
+    test_concurrent_process_syncs_leave_consistent_cache()
+    print('ok')
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from CommonProperties.Table_Schema import parse_ddl, get_table_dtypes, apply_table_dtypes
+
+DDL = """
+CREATE TABLE IF NOT EXISTS quant.t_volume_demo (
+     ymd          DATE          NOT NULL  COMMENT '交易日期'
+    ,stock_code   VARCHAR(20)   NOT NULL  COMMENT '股票代码'
+    ,close        DECIMAL(10,2)           COMMENT '收盘价'
+    ,volume       BIGINT        NOT NULL  COMMENT '成交量'
+    ,vol_nullable BIGINT                  COMMENT '成交量'
+    ,UNIQUE KEY idx_code_ymd (stock_code, ymd)
+);
+"""
+
+
+def test_parse_ddl_records_nullability():
+    columns = parse_ddl(DDL)['t_volume_demo']
+    assert columns['volume'] == ('bigint', None, False)
+    assert columns['vol_nullable'] == ('bigint', None, True)
+
+
+def test_volume_above_float32_precision_is_preserved():
+    # 2^24 + 1 在 float32 中会被舍入成 2^24
+    volume = 2 ** 24 + 1
+    df = pd.DataFrame({'ymd': ['2024-01-02'], 'stock_code': ['000001'], 'close': [10.01], 'volume': [volume]})
+    typed = apply_table_dtypes(df, 'ods_stock_kline_daily_ts')
+    assert int(typed['volume'].iloc[0]) == volume
+    assert typed['close'].dtype == 'float64'
+    assert typed['stock_code'].dtype != 'category'
+
+
+def test_compact_is_opt_in_and_keeps_volume_wide():
+    dtypes = get_table_dtypes('ods_stock_kline_daily_ts', compact=True)
+    assert dtypes['close'] == 'float32'
+    assert dtypes['stock_code'] == 'category'
+    assert dtypes['volume'] == 'float64'
+    assert 'float32' not in get_table_dtypes('ods_stock_kline_daily_ts').values()
+
+
+if __name__ == '__main__':
+    test_parse_ddl_records_nullability()
+    test_volume_above_float32_precision_is_preserved()
+    test_compact_is_opt_in_and_keeps_volume_wide()
+    print('ok')
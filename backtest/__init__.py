@@ -2,10 +2,15 @@ from .backtest_engine import StockBacktestEngine
 from .simple_strategy import SimpleStrategy
 from .factor_driven_strategy import FactorDrivenStrategy
 from .performance_analysis import PerformanceAnalyzer
+from .param_sweep import run_param_sweep
+from .vectorized_simulator import run_vectorized_backtest, simulate_factor_strategy
 
 __all__ = [
     'StockBacktestEngine',
     'SimpleStrategy',
     'FactorDrivenStrategy',
-    'PerformanceAnalyzer'
+    'PerformanceAnalyzer',
+    'run_param_sweep',
+    'run_vectorized_backtest',
+    'simulate_factor_strategy'
 ]
\ No newline at end of file
@@ -6,8 +6,10 @@ import logging
 from CommonProperties import Mysql_Utils
 from CommonProperties.Base_utils import timing_decorator
 from strategy.factor_library import FactorLibrary
+from strategy.factor_score_table import FactorScoreTable
 from backtest.simple_strategy import SimpleStrategy
 from backtest.factor_driven_strategy import FactorDrivenStrategy
+from backtest.vectorized_simulator import run_vectorized_backtest
 
 # 复用你的日志配置
 logger = logging.getLogger(__name__)
@@ -26,6 +28,23 @@ class StockBacktestEngine:
         self.factor_lib = FactorLibrary()
         # 提前初始化cerebro（但要注意线程安全）
         self.cerebro = None
+        # 回测窗口内预先算好的因子得分表，run_backtest 在 cerebro.run() 之前加载
+        self.factor_scores = None
+        # 得分表是否经过去极值 / 标准化 / 中性化预处理，窗口外补加载时沿用
+        self.preprocess_factors = False
+
+    @classmethod
+    def from_factor_scores(cls, factor_scores):
+        """
+        离线引擎：只持有已经算好的因子得分表，不连数据库、不创建 FactorLibrary
+        供参数寻优的子进程使用，FactorDrivenStrategy 通过 get_factor_scores_batch 查表
+        """
+        engine = cls.__new__(cls)
+        engine.factor_lib = None
+        engine.cerebro = None
+        engine.factor_scores = factor_scores
+        engine.preprocess_factors = False
+        return engine
 
     @timing_decorator
     def _prepare_feed(self, stock_code, start_date, end_date):
@@ -114,7 +133,6 @@ class StockBacktestEngine:
             logger.error(f"查询{stock_code}@{date_str}的{factor_type}因子失败：{str(e)}")
             return False
 
-    @timing_decorator
     def get_factor_score(self, stock_code, date, factor_type='pb'):
         """
         获取因子百分制得分（新版）
@@ -127,46 +145,30 @@ class StockBacktestEngine:
         Returns:
             float: 0-100的得分
         """
+        # 已预加载得分表时直接查表，不再按单日重算全市场因子
+        if self.factor_scores is not None and self.factor_scores.covers(date):
+            return self.factor_scores.lookup(date, stock_code, factor_type)
+
         try:
             date_str = date.strftime('%Y%m%d')
             stock_code_clean = stock_code.split('.')[0] if '.' in stock_code else stock_code
 
-            if factor_type == 'pb':
-                # PB因子百分制
-                pb_df = self.factor_lib.pb_factor_score(start_date=date_str, end_date=date_str)
-                if not pb_df.empty:
-                    filtered = pb_df[pb_df['stock_code'] == stock_code_clean]
-                    if not filtered.empty:
-                        return float(filtered['pb_score'].iloc[0])
-                return 0.0
-
-            elif factor_type == 'zt':
-                # 涨停因子百分制
-                zt_df = self.factor_lib.zt_factor_score(start_date=date_str, end_date=date_str)
-                if not zt_df.empty:
-                    filtered = zt_df[zt_df['stock_code'] == stock_code_clean]
-                    if not filtered.empty:
-                        return float(filtered['zt_score'].iloc[0])
-                return 0.0
-
-            elif factor_type == 'shareholder':
-                # 筹码因子百分制
-                sh_df = self.factor_lib.shareholder_factor_score(start_date=date_str, end_date=date_str)
-                if not sh_df.empty:
-                    filtered = sh_df[sh_df['stock_code'] == stock_code_clean]
-                    if not filtered.empty:
-                        return float(filtered['shareholder_score'].iloc[0])
-                return 0.0
-
-            else:
+            if factor_type not in ('pb', 'zt', 'shareholder'):
                 logger.warning(f"不支持的因子类型：{factor_type}")
                 return 0.0
 
+            # 未预加载时按单日取因子，结果进因子缓存，同一天的其他股票 / 因子查询不再重算
+            factor_df = self.factor_lib.get_factor(factor_type, date_str, date_str)
+            if not factor_df.empty:
+                filtered = factor_df[factor_df['stock_code'].astype(str) == stock_code_clean]
+                if not filtered.empty:
+                    return float(filtered[f'{factor_type}_score'].iloc[0])
+            return 0.0
+
         except Exception as e:
             logger.error(f"获取{stock_code}@{date_str}的{factor_type}因子得分失败：{str(e)}")
             return 0.0
 
-    @timing_decorator
     def get_factor_scores(self, stock_code, date):
         """
         一次性获取所有因子的百分制得分
@@ -184,6 +186,43 @@ class StockBacktestEngine:
             'shareholder': self.get_factor_score(stock_code, date, 'shareholder')
         }
 
+    @timing_decorator
+    def preload_factor_scores(self, start_date, end_date, factors=('pb', 'zt', 'shareholder'), preprocess=False):
+        """
+        一次性算出回测窗口内全市场的因子得分，之后 get_factor_score / get_factor_scores_batch 都只查表
+        preprocess=True 时装入去极值、标准化、市值 / 行业中性化后的得分
+        Returns:
+            FactorScoreTable
+        """
+        self.preprocess_factors = preprocess
+        self.factor_scores = FactorScoreTable.build(self.factor_lib, start_date, end_date, factors,
+                                                    preprocess=preprocess)
+        return self.factor_scores
+
+    def get_factor_scores_batch(self, dates, codes, factors=None):
+        """
+        批量获取因子百分制得分
+
+        Args:
+            dates: 日期列表
+            codes: 股票代码列表
+            factors: 因子列表，默认得分表中的全部因子
+
+        Returns:
+            DataFrame: index 为 (ymd, stock_code)，每个因子一列
+        """
+        dates = list(dates)
+        start, end = pd.to_datetime(str(min(dates))), pd.to_datetime(str(max(dates)))
+        table = self.factor_scores
+        if table is None or not table.covers(start, end):
+            # 超出已加载窗口时把窗口扩展到新日期，而不是换成只含这几天的表，逐日调用时最多重载一次
+            if table is not None and table.start_date is not None:
+                start = min(start, pd.Timestamp(table.start_date))
+                end = max(end, pd.Timestamp(table.end_date))
+            self.preload_factor_scores(start.strftime('%Y%m%d'), end.strftime('%Y%m%d'),
+                                       factors or ('pb', 'zt', 'shareholder'), preprocess=self.preprocess_factors)
+        return self.factor_scores.get_batch(dates, codes, factors)
+
     @timing_decorator
     def update_datas(self, cerebro, new_stock_codes, start_date, end_date, current_date):
         """
@@ -213,7 +252,8 @@ class StockBacktestEngine:
                      end_date,
                      initial_cash=100000,
                      strategy_type='simple',
-                     stock_selection_func=None):
+                     stock_selection_func=None,
+                     preprocess_factors=False):
         """
         执行回测主逻辑
         :param stock_codes: 初始选股列表
@@ -222,13 +262,11 @@ class StockBacktestEngine:
         :param initial_cash: 初始资金（默认10万）
         :param strategy_type: 策略类型（simple/factor_driven）
         :param stock_selection_func: 动态选股函数（仅dynamic_pool策略需要）
+        :param preprocess_factors: 因子合成前是否先去极值、标准化并做市值 / 行业中性化（仅factor_driven策略）
         :return: 绩效指标字典
         """
-        # 1. 初始化Backtrader核心引擎
-        self.cerebro = bt.Cerebro()  # 保存cerebro实例供外部调用
-        self.cerebro.broker.setcash(initial_cash)  # 设置初始资金
-        self.cerebro.broker.setcommission(commission=0.0003)  # 佣金：千分之0.3
-        self.cerebro.broker.set_coc(True)  # 以收盘价成交（贴近实盘）
+        # 1. 初始化Backtrader核心引擎（保存cerebro实例供外部调用）
+        self.cerebro = self.create_cerebro(initial_cash)
 
         # 2. 加载初始股票数据
         valid_codes = []
@@ -248,6 +286,9 @@ class StockBacktestEngine:
             logger.info("加载简易调仓策略")
 
         elif strategy_type == 'factor_driven':
+            # 回测期间的因子得分一次性预加载，next() 中只查表
+            self.preload_factor_scores(start_date, end_date, preprocess=preprocess_factors)
+
             # 传递回测引擎实例给因子策略
             self.cerebro.addstrategy(
                 FactorDrivenStrategy,
@@ -259,14 +300,7 @@ class StockBacktestEngine:
             logger.error(f"不支持的策略类型：{strategy_type}")
             return None
 
-        # 4. 添加绩效分析器
-        self.cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe', riskfreerate=0.03)
-        self.cerebro.addanalyzer(bt.analyzers.Returns, _name='returns', tann=252)
-        self.cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        self.cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade_analyzer')
-        self.cerebro.addanalyzer(bt.analyzers.SQN, _name='sqn')
-
-        # 5. 运行回测
+        # 4. 运行回测
         logger.info(f"开始回测：{start_date} ~ {end_date}，初始资金：{initial_cash}元")
         results = self.cerebro.run()
         if not results:
@@ -274,11 +308,42 @@ class StockBacktestEngine:
             return None
         strat = results[0]
 
-        # 6. 提取绩效指标
+        # 5. 提取绩效指标
         perf = self._extract_performance_metrics(strat, initial_cash, self.cerebro, start_date, end_date)
         logger.info(f"回测完成，最终资金：{perf['最终资金']}元")
         return perf
 
+    @timing_decorator
+    def run_vectorized_backtest(self, start_date, end_date, stock_codes=None, initial_cash=100000,
+                                preprocess_factors=False, **strategy_params):
+        """
+        不经过 backtrader 的因子驱动策略回测：得分矩阵直接算信号、持仓和净值，可以跑全市场（不做 stock_codes[:5] 截断）
+        :param stock_codes: 股票池，None 表示全市场
+        :param strategy_params: FactorDrivenStrategy 的权重与阈值（pb_weight / buy_threshold 等）
+        :return: 与 run_backtest 相同的绩效指标字典
+        """
+        return run_vectorized_backtest(self.factor_lib, start_date, end_date, stock_codes=stock_codes,
+                                       initial_cash=initial_cash, preprocess_factors=preprocess_factors,
+                                       **strategy_params)
+
+    @staticmethod
+    def create_cerebro(initial_cash):
+        """
+        创建统一配置的 Cerebro：资金、佣金千分之0.3、收盘价成交，并挂好 _extract_performance_metrics 需要的分析器
+        """
+        cerebro = bt.Cerebro()
+        cerebro.broker.setcash(initial_cash)  # 设置初始资金
+        cerebro.broker.setcommission(commission=0.0003)  # 佣金：千分之0.3
+        cerebro.broker.set_coc(True)  # 以收盘价成交（贴近实盘）
+
+        # 绩效分析器
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe', riskfreerate=0.03)
+        cerebro.addanalyzer(bt.analyzers.Returns, _name='returns', tann=252)
+        cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade_analyzer')
+        cerebro.addanalyzer(bt.analyzers.SQN, _name='sqn')
+        return cerebro
+
     def _extract_performance_metrics(self, strat, initial_cash, cerebro, start_date, end_date):
         """提取标准化绩效指标（含胜率）"""
         # 基础收益指标
@@ -294,7 +359,7 @@ class StockBacktestEngine:
         # 计算核心指标
         total_return = round((final_cash - initial_cash) / initial_cash * 100, 2)
         annual_return = round(returns_ana.get('rnorm', 0) * 100, 2)
-        sharpe_ratio = round(sharpe_ana.get('sharperatio', 0), 2)
+        sharpe_ratio = round(sharpe_ana.get('sharperatio') or 0, 2)  # 不足一个年化周期时为 None
         max_drawdown = round(drawdown_ana.get('max', {}).get('drawdown', 0), 2)
 
         # 胜率/盈亏比计算（容错）
@@ -328,7 +393,7 @@ class StockBacktestEngine:
             '总交易次数': total_trades,
             '胜率': win_rate,
             '盈亏比': profit_loss_ratio,
-            '策略质量得分(SQN)': round(sqn_ana.get('sqn', 0), 2)
+            '策略质量得分(SQN)': round(sqn_ana.get('sqn') or 0, 2)
         }
 
     def get_cerebro(self):
@@ -405,8 +470,8 @@ class StockBacktestEngine:
         清理数据缓存
         """
         try:
-            # 如果有缓存机制，可以在这里清理
-            pass
+            self.factor_scores = None
+            self.factor_lib.factor_cache.clear()
         except Exception as e:
             logger.warning(f"清理数据缓存失败: {str(e)}")
 
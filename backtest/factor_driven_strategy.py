@@ -2,10 +2,11 @@
 
 import backtrader as bt
 import logging
-from typing import Optional
+from typing import TYPE_CHECKING
 from CommonProperties.Base_utils import timing_decorator
-# 导入引擎类，让IDE能识别类型
-from backtest.backtest_engine import StockBacktestEngine
+# 导入引擎类，让IDE能识别类型（backtest_engine 也导入本模块，运行时导入会循环引用）
+if TYPE_CHECKING:
+    from backtest.backtest_engine import StockBacktestEngine
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,7 @@ class FactorDrivenStrategy(bt.Strategy):
     """
     # 声明参数
     params = (
-        ('backtest_engine', Optional[StockBacktestEngine], None),
+        ('backtest_engine', None),  # Optional[StockBacktestEngine]
         ('pb_weight', 0.4),           # PB因子权重
         ('zt_weight', 0.3),            # 涨停因子权重
         ('shareholder_weight', 0.3),    # 筹码因子权重
@@ -33,21 +34,22 @@ class FactorDrivenStrategy(bt.Strategy):
             return
 
         # 1. 校验回测引擎参数是否传递成功
-        engine: StockBacktestEngine = self.p.backtest_engine
+        engine: 'StockBacktestEngine' = self.p.backtest_engine
         if not engine:
             logger.error("回测引擎实例未传递，无法查询因子")
             return
 
-        # 2. 遍历所有股票，逐只判断因子得分
+        # 2. 当日所有股票的因子百分制得分一次取出（回测前已预加载，只查表）
+        stock_codes = [data._name for data in self.datas if data._name]
+        day_scores = engine.get_factor_scores_batch([current_date], stock_codes, ['pb', 'zt', 'shareholder'])
+
+        # 3. 遍历所有股票，逐只判断因子得分
         for data in self.datas:
             stock_code = data._name
             if not stock_code:
                 continue
 
-            # 3. 查询当日因子百分制得分
-            pb_score = engine.get_factor_score(stock_code, current_date, 'pb')
-            zt_score = engine.get_factor_score(stock_code, current_date, 'zt')
-            shareholder_score = engine.get_factor_score(stock_code, current_date, 'shareholder')
+            pb_score, zt_score, shareholder_score = day_scores.xs(stock_code, level='stock_code').iloc[0]
 
             # 4. 计算综合得分（加权平均）
             composite_score = (
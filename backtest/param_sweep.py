@@ -0,0 +1,397 @@
+# backtest/param_sweep.py
+import os
+import json
+import hashlib
+import logging
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import backtrader as bt
+
+from backtest.backtest_engine import StockBacktestEngine
+from backtest.factor_driven_strategy import FactorDrivenStrategy
+from strategy.factor_score_table import FactorScoreTable
+
+logger = logging.getLogger(__name__)
+
+# FactorDrivenStrategy 中参与寻优的参数
+SWEEP_PARAMS = ['pb_weight', 'zt_weight', 'shareholder_weight', 'buy_threshold', 'sell_threshold', 'hold_threshold']
+WEIGHT_PARAMS = ['pb_weight', 'zt_weight', 'shareholder_weight']
+
+# 排名指标：指标名 -> 是否越大越好
+# 引擎的 夏普比率 按自然年收益率计算，不足两年的回测区间总是 0，排名改用日收益率年化（x sqrt(252)）的夏普比率
+RANK_METRICS = {'日频夏普比率': True, '最大回撤': False, '总收益率': True}
+RISK_FREE_RATE = 0.03
+
+# 结果文件的指标口径版本，写进 context_key，口径变化后旧结果不再参与续跑和排名
+RESULTS_VERSION = 2
+
+# 行情面板中传给子进程的字段
+FEED_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+######################  共享内存：父进程预加载一次，子进程挂载只读视图  #############################
+
+class SharedArrays:
+    """
+    一组 ndarray 放进 multiprocessing.shared_memory
+    父进程 create() 拷入数据后把 spec（共享块名、形状、dtype，可 pickle）交给子进程，子进程 attach() 得到零拷贝视图
+    """
+
+    def __init__(self, blocks, arrays):
+        self._blocks = blocks
+        self.arrays = arrays
+
+    @classmethod
+    def create(cls, arrays):
+        blocks, views = {}, {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            view[...] = array
+            blocks[name], views[name] = block, view
+        return cls(blocks, views)
+
+    @classmethod
+    def attach(cls, spec):
+        blocks, views = {}, {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks[name] = block
+            views[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        return cls(blocks, views)
+
+    @property
+    def spec(self):
+        return {name: (self._blocks[name].name, array.shape, array.dtype.str) for name, array in self.arrays.items()}
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def close(self, unlink=False):
+        """释放本进程的映射；创建方 unlink=True 时同时删除共享块"""
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+        self._blocks = {}
+
+
+######################  参数组合  #############################
+
+def normalize_weights(params):
+    """三个因子权重归一到和为 1，保证综合得分仍是 0-100，与买卖阈值可比"""
+    total = sum(params[name] for name in WEIGHT_PARAMS if name in params)
+    if total <= 0:
+        return params
+    return {**params, **{name: round(params[name] / total, 4) for name in WEIGHT_PARAMS if name in params}}
+
+
+def default_params():
+    """FactorDrivenStrategy 中寻优参数的默认值"""
+    return {name: getattr(FactorDrivenStrategy.params, name) for name in SWEEP_PARAMS}
+
+
+def _complete(params, weights_sum_to_one):
+    """未参与搜索的参数取策略默认值，保证结果文件每行的参数列一致"""
+    params = {**default_params(), **params}
+    return normalize_weights(params) if weights_sum_to_one else params
+
+
+def _is_valid(params):
+    """卖出阈值不高于持仓阈值、持仓阈值不高于买入阈值，否则刚买入就会被卖出"""
+    return params['sell_threshold'] <= params['hold_threshold'] <= params['buy_threshold']
+
+
+def param_grid(grid, weights_sum_to_one=True):
+    """
+    网格搜索的全部参数组合
+    Args:
+        grid:               {参数名: 候选值列表}，参数名取自 SWEEP_PARAMS
+        weights_sum_to_one: 是否把权重归一（归一后重复的组合只保留一个）
+    Returns:
+        list[dict]
+    """
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"不支持的寻优参数：{sorted(unknown)}，可选：{SWEEP_PARAMS}")
+
+    names = list(grid)
+    combos, seen = [], set()
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = _complete(dict(zip(names, values)), weights_sum_to_one)
+        key = params_key(params)
+        if _is_valid(params) and key not in seen:
+            seen.add(key)
+            combos.append(params)
+    return combos
+
+
+def random_params(space, n_samples, seed=0, weights_sum_to_one=True):
+    """
+    随机搜索的参数组合
+    Args:
+        space:     {参数名: (下限, 上限) 均匀采样，或候选值列表}
+        n_samples: 组合个数（不满足阈值大小关系的样本会被丢弃重采，最多尝试 20 倍）
+    Returns:
+        list[dict]
+    """
+    unknown = set(space) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"不支持的寻优参数：{sorted(unknown)}，可选：{SWEEP_PARAMS}")
+
+    rng = np.random.default_rng(seed)
+    combos, seen = [], set()
+    for _ in range(n_samples * 20):
+        if len(combos) >= n_samples:
+            break
+        params = {}
+        for name, choices in space.items():
+            if isinstance(choices, tuple):
+                value = rng.uniform(*choices)
+                params[name] = round(value, 4) if name in WEIGHT_PARAMS else round(value, 1)
+            else:
+                params[name] = choices[rng.integers(len(choices))]
+        params = _complete(params, weights_sum_to_one)
+        key = params_key(params)
+        if _is_valid(params) and key not in seen:
+            seen.add(key)
+            combos.append(params)
+    return combos
+
+
+def params_key(params):
+    """参数组合 -> 结果文件中的唯一键，续跑时据此跳过已完成的组合"""
+    return json.dumps({name: float(params[name]) for name in sorted(params)}, sort_keys=True)
+
+
+def context_key(stock_codes, start_date, end_date, initial_cash, preprocess_factors):
+    """
+    寻优上下文（回测区间、股票池、初始资金、因子预处理）-> 短哈希
+    同一个结果文件里只有上下文相同的行才算已完成、才参与排名，换了区间或股票池不会误用旧结果
+    """
+    context = {'start_date': pd.to_datetime(str(start_date)).strftime('%Y%m%d'),
+               'end_date': pd.to_datetime(str(end_date)).strftime('%Y%m%d'),
+               'stock_codes': sorted(str(code) for code in stock_codes),
+               'initial_cash': float(initial_cash),
+               'preprocess_factors': bool(preprocess_factors),
+               'results_version': RESULTS_VERSION}
+    return hashlib.sha1(json.dumps(context, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+######################  结果文件与排名  #############################
+
+def load_results(results_file, context=None):
+    """
+    读取已完成的结果，文件不存在时返回空表
+    Args:
+        context: context_key 的结果，给出时只返回该上下文的行（旧文件没有 context_key 列，视为其他上下文）
+    """
+    if not results_file or not os.path.exists(results_file):
+        return pd.DataFrame()
+    results_df = pd.read_csv(results_file, dtype={'params_key': str, 'context_key': str})
+    if context is None:
+        return results_df
+    if 'context_key' not in results_df.columns:
+        results_df['context_key'] = None
+    matched = results_df[results_df['context_key'] == context].reset_index(drop=True)
+    if len(matched) < len(results_df):
+        logger.info(f"结果文件 {results_file} 中有 {len(results_df) - len(matched)} 行属于其他回测区间 / 股票池，已忽略")
+    return matched
+
+
+def _append_result(results_file, row):
+    """每完成一个组合追加一行，进程中断后已完成的结果不丢"""
+    row_df = pd.DataFrame([row])
+    if os.path.exists(results_file):
+        header = pd.read_csv(results_file, nrows=0).columns
+        if list(header) != list(row_df.columns):
+            # 列和已有文件不一致（旧版本文件 / 指标有增减）时按列并集整体重写，避免错列
+            merged = pd.concat([load_results(results_file), row_df], ignore_index=True)
+            tmp_path = f"{results_file}.tmp-{os.getpid()}"
+            merged.to_csv(tmp_path, index=False, encoding='utf-8')
+            os.replace(tmp_path, results_file)
+            return
+    row_df.to_csv(results_file, mode='a', header=not os.path.exists(results_file), index=False, encoding='utf-8')
+
+
+def rank_results(results_df):
+    """
+    按日频夏普比率（高）、最大回撤（低）、总收益率（高）分别排名，取平均名次作为综合排名
+    Returns:
+        DataFrame: 增加各指标名次列与 综合排名，按综合排名升序
+    """
+    if results_df.empty:
+        return results_df
+    ranked = results_df.copy()
+    rank_cols = []
+    for metric, higher_is_better in RANK_METRICS.items():
+        col = f'{metric}_名次'
+        ranked[col] = pd.to_numeric(ranked[metric], errors='coerce').rank(ascending=not higher_is_better,
+                                                                         method='min', na_option='bottom')
+        rank_cols.append(col)
+    ranked['综合排名'] = ranked[rank_cols].mean(axis=1).rank(method='min')
+    return ranked.sort_values(['综合排名'] + rank_cols).reset_index(drop=True)
+
+
+######################  子进程  #############################
+
+_worker_state = {}
+
+
+def _init_worker(spec, dates, stock_codes, factors, start_date, end_date, initial_cash):
+    """子进程初始化：挂载共享内存，构造只读得分表与离线回测引擎，整理每只股票的行情表"""
+    shared = SharedArrays.attach(spec)
+    dates = pd.DatetimeIndex(dates)
+    # 得分表窗口取请求区间与共享交易日的并集，行情中的每根 K 线都直接查表，不会触发重新加载
+    window = dates.append(pd.to_datetime([str(start_date), str(end_date)]))
+    table = FactorScoreTable.from_arrays(shared.arrays['factor_scores'], factors, dates,
+                                         [code.split('.')[0] for code in stock_codes],
+                                         start_date=window.min(), end_date=window.max())
+
+    frames = {}
+    for idx, code in enumerate(stock_codes):
+        kline_df = pd.DataFrame({field: shared.arrays[field][:, idx] for field in FEED_FIELDS}, index=dates)
+        kline_df.index.name = 'datetime'
+        kline_df = kline_df[kline_df['close'].notna()]
+        if not kline_df.empty:
+            frames[code] = kline_df
+
+    _worker_state.update(shared=shared, engine=StockBacktestEngine.from_factor_scores(table), frames=frames,
+                         start_date=start_date, end_date=end_date, initial_cash=initial_cash)
+
+
+def _run_params(params):
+    """子进程中跑一组参数的 FactorDrivenStrategy 回测，返回 run_backtest 的绩效字典外加 日频夏普比率"""
+    state = _worker_state
+    engine = state['engine']
+    cerebro = engine.create_cerebro(state['initial_cash'])
+    # 日收益率的夏普比率，按 252 个交易日年化，年化无风险利率同样折算到日
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe_daily', timeframe=bt.TimeFrame.Days,
+                        annualize=True, riskfreerate=RISK_FREE_RATE)
+    for code, kline_df in state['frames'].items():
+        cerebro.adddata(bt.feeds.PandasData(dataname=kline_df), name=code)
+    cerebro.addstrategy(FactorDrivenStrategy, backtest_engine=engine, **params)
+
+    strat = cerebro.run()[0]
+    perf = engine._extract_performance_metrics(strat, state['initial_cash'], cerebro,
+                                               state['start_date'], state['end_date'])
+    perf['日频夏普比率'] = round(strat.analyzers.sharpe_daily.get_analysis().get('sharperatio') or 0, 2)
+    return perf
+
+
+######################  入口  #############################
+
+def _load_price_arrays(engine, stock_codes, dates, start_date, end_date):
+    """整个股票池的 K 线只取一次（行情面板覆盖时走 memmap），对齐成 {字段: [交易日 x 股票]} 矩阵"""
+    arrays = {field: np.full((len(dates), len(stock_codes)), np.nan) for field in FEED_FIELDS}
+    all_kline_df = engine.factor_lib.get_kline_data(stock_codes, start_date, end_date)
+    groups = dict(list(all_kline_df.groupby(all_kline_df['stock_code'].astype(str)))) if not all_kline_df.empty else {}
+    for idx, code in enumerate(stock_codes):
+        kline_df = groups.get(code)
+        if kline_df is None or kline_df.empty:
+            logger.warning(f"股票[{code}]在{start_date}-{end_date}无数据")
+            continue
+        day_idx = dates.get_indexer(pd.to_datetime(kline_df['ymd'].astype(str)))
+        valid = day_idx >= 0
+        for field in FEED_FIELDS:
+            arrays[field][day_idx[valid], idx] = pd.to_numeric(kline_df[field], errors='coerce').to_numpy()[valid]
+    return arrays
+
+
+def run_param_sweep(stock_codes, start_date, end_date, grid=None, space=None, n_samples=50, seed=0,
+                    results_file='param_sweep_results.csv', max_workers=None, initial_cash=100000,
+                    preprocess_factors=False, engine=None):
+    """
+    FactorDrivenStrategy 的参数寻优：网格（grid）或随机（space + n_samples）搜索，多进程并行回测
+    行情与因子得分只在父进程加载一次，放入共享内存，各子进程挂载同一份数据；
+    每完成一组参数立即追加到 results_file（带 context_key），再次运行时只跳过同一上下文下已有的组合
+    Args:
+        stock_codes:        股票池（不做数量截断）
+        start_date:         回测开始日期（YYYYMMDD）
+        end_date:           回测结束日期（YYYYMMDD）
+        grid:               网格搜索 {参数名: 候选值列表}
+        space:              随机搜索 {参数名: (下限, 上限) 或候选值列表}
+        n_samples:          随机搜索的组合个数
+        seed:               随机种子
+        results_file:       结果文件（CSV），用于续跑
+        max_workers:        进程数，默认 CPU 核数
+        initial_cash:       初始资金
+        preprocess_factors: 因子得分是否经过去极值 / 标准化 / 中性化
+        engine:             已有的 StockBacktestEngine，默认新建
+    Returns:
+        DataFrame: 本上下文下全部组合（含历史结果）的绩效与排名，按综合排名升序
+    """
+    if grid is None and space is None:
+        raise ValueError("grid 和 space 至少给出一个")
+    combos = param_grid(grid) if grid is not None else random_params(space, n_samples, seed=seed)
+
+    stock_codes = [str(code) for code in stock_codes]
+    context = context_key(stock_codes, start_date, end_date, initial_cash, preprocess_factors)
+    done = load_results(results_file, context)
+    done_keys = set(done['params_key']) if not done.empty else set()
+    pending = [params for params in combos if params_key(params) not in done_keys]
+    logger.info(f"参数寻优：共{len(combos)}组，已完成{len(combos) - len(pending)}组，待运行{len(pending)}组")
+    if not pending:
+        return rank_results(done)
+
+    # 1. 父进程一次性加载因子得分与行情
+    engine = engine or StockBacktestEngine()
+    table = engine.preload_factor_scores(start_date, end_date, preprocess=preprocess_factors)
+    dates = table.dates
+    if not len(dates):
+        logger.error(f"回测期间 {start_date}~{end_date} 无因子得分，终止参数寻优")
+        return rank_results(done)
+
+    arrays = _load_price_arrays(engine, stock_codes, dates, start_date, end_date)
+    code_idx = table.stock_codes.get_indexer([code.split('.')[0] for code in stock_codes])
+    scores = table.values[:, :, np.maximum(code_idx, 0)]
+    scores[:, :, code_idx < 0] = 0.0
+    arrays['factor_scores'] = scores
+
+    # 2. 放入共享内存，子进程挂载
+    shared = SharedArrays.create(arrays)
+    logger.info(f"共享内存加载完成：{len(dates)} 个交易日 x {len(stock_codes)} 只股票，{shared.nbytes / 1024 ** 2:.1f} MB")
+    try:
+        init_args = (shared.spec, dates.to_numpy(), stock_codes, list(table.factors), start_date, end_date, initial_cash)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=init_args) as executor:
+            futures = {executor.submit(_run_params, params): params for params in pending}
+            for finished, future in enumerate(as_completed(futures), 1):
+                params = futures[future]
+                try:
+                    perf = future.result()
+                except Exception as e:
+                    logger.error(f"参数组合 {params} 回测失败：{str(e)}")
+                    continue
+                _append_result(results_file, {'context_key': context, 'params_key': params_key(params),
+                                              **params, **perf})
+                logger.info(f"[{finished}/{len(pending)}] {params} -> 日频夏普比率 {perf['日频夏普比率']}，"
+                            f"最大回撤 {perf['最大回撤']}%，总收益率 {perf['总收益率']}%")
+    finally:
+        shared.close(unlink=True)
+
+    return rank_results(load_results(results_file, context))
+
+
+if __name__ == '__main__':
+    from CommonProperties import set_config
+    set_config.setup_logging_config()
+
+    ranked = run_param_sweep(
+        stock_codes=['600000', '000001', '601318', '002594', '300059'],
+        start_date='20250101',
+        end_date='20250630',
+        grid={'pb_weight': [0.2, 0.4, 0.6],
+              'zt_weight': [0.2, 0.3],
+              'shareholder_weight': [0.2, 0.3],
+              'buy_threshold': [60, 70, 80],
+              'sell_threshold': [20, 30],
+              'hold_threshold': [40, 50]},
+    )
+    print(ranked.head(20).to_string())
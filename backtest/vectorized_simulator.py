@@ -0,0 +1,230 @@
+# backtest/vectorized_simulator.py
+# FactorDrivenStrategy 阈值逻辑的数组版模拟器：不经过 backtrader，[交易日 x 股票] 得分矩阵直接算出信号、持仓和净值
+# 与 backtrader 版一致的约定：收盘价成交（set_coc）、佣金千分之0.3、买入金额 = 当日可用现金 * 0.9 / 股票数、卖出清仓
+import math
+import logging
+
+import numpy as np
+import pandas as pd
+
+from strategy.factor_score_table import FactorScoreTable
+from strategy.factor_analytics import load_close_matrix
+
+logger = logging.getLogger(__name__)
+
+# 与 FactorDrivenStrategy.params 的默认值一致
+DEFAULT_STRATEGY_PARAMS = {
+    'pb_weight': 0.4,
+    'zt_weight': 0.3,
+    'shareholder_weight': 0.3,
+    'buy_threshold': 70,
+    'sell_threshold': 30,
+    'hold_threshold': 50,
+}
+
+COMMISSION = 0.0003          # 佣金：千分之0.3
+CASH_FRACTION = 0.9          # 每次买入可用现金的比例
+RISK_FREE_RATE = 0.03        # 夏普比率的无风险利率（年）
+TRADING_DAYS_PER_YEAR = 252  # 年化收益率的年化天数
+
+
+def composite_scores(score_matrices, params=None):
+    """
+    加权综合得分：pb * pb_weight + zt * zt_weight + shareholder * shareholder_weight，缺失得分按 0 计
+    Args:
+        score_matrices: {'pb' / 'zt' / 'shareholder': [交易日 x 股票] 得分矩阵}
+    Returns:
+        ndarray: [交易日 x 股票]
+    """
+    params = {**DEFAULT_STRATEGY_PARAMS, **(params or {})}
+    composite = None
+    for name in ('pb', 'zt', 'shareholder'):
+        weighted = np.nan_to_num(np.asarray(score_matrices[name], dtype=np.float64)) * params[f'{name}_weight']
+        composite = weighted if composite is None else composite + weighted
+    return composite
+
+
+def threshold_holdings(composite, tradable, buy_threshold=70, sell_threshold=30, hold_threshold=50):
+    """
+    把综合得分转成每日收盘后的持仓状态
+    空仓时得分 >= buy_threshold 买入；持仓时得分 <= sell_threshold 或 < hold_threshold 清仓；其余保持
+    要求 sell_threshold <= hold_threshold <= buy_threshold，此时买卖条件互斥，状态机等价于"买入记 1、卖出记 0、其余沿用前一日"的前向填充
+    Args:
+        composite: [交易日 x 股票] 综合得分
+        tradable:  [交易日 x 股票] 当日有收盘价（可成交）的标记，停牌日不改变状态
+    Returns:
+        ndarray[bool]: [交易日 x 股票] 收盘后是否持仓
+    """
+    if not sell_threshold <= hold_threshold <= buy_threshold:
+        raise ValueError(f"阈值需满足 sell <= hold <= buy，当前 {sell_threshold} / {hold_threshold} / {buy_threshold}")
+
+    signal = np.full(composite.shape, np.nan)
+    signal[(composite <= sell_threshold) | (composite < hold_threshold)] = 0.0
+    signal[composite >= buy_threshold] = 1.0
+    signal[~tradable] = np.nan
+    return pd.DataFrame(signal).ffill().fillna(0.0).to_numpy(dtype=bool)
+
+
+def simulate_holdings(holdings, close, initial_cash=100000, commission=COMMISSION, cash_fraction=CASH_FRACTION):
+    """
+    按持仓状态逐日撮合：当日由空仓变持仓按收盘价买入，由持仓变空仓按收盘价全部卖出
+    买入股数依赖当日开盘前的现金，只能按交易日推进；每一步都是对全部股票的数组运算
+    Args:
+        holdings: [交易日 x 股票] 收盘后是否持仓
+        close:    [交易日 x 股票] 收盘价，停牌为 NaN（估值沿用最近收盘价）
+    Returns:
+        dict: values（每日总资产）、cash（每日现金）、trade_pnl（已平仓交易的扣费盈亏）、open_trades（期末未平仓数）
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n_days, n_stocks = close.shape
+    n_feeds = max(int(np.isfinite(close).any(axis=0).sum()), 1)
+    marks = pd.DataFrame(close).ffill().fillna(0.0).to_numpy()
+
+    previous = np.vstack([np.zeros((1, n_stocks), dtype=bool), holdings[:-1]])
+    buys, sells = holdings & ~previous, previous & ~holdings
+    # 与 backtrader 一致：最后一个交易日发出的订单没有下一根 K 线撮合，不成交
+    buys[-1:], sells[-1:] = False, False
+
+    cash = float(initial_cash)
+    shares = np.zeros(n_stocks)
+    cost = np.zeros(n_stocks)          # 买入成交额 + 买入佣金
+    values = np.empty(n_days)
+    cash_curve = np.empty(n_days)
+    trade_pnl = []
+
+    for day in range(n_days):
+        price = close[day]
+        budget = cash * cash_fraction / n_feeds   # 策略 next() 中读到的可用现金，当日所有买单共用
+
+        sell_idx = np.flatnonzero(sells[day])
+        if len(sell_idx):
+            proceeds = shares[sell_idx] * price[sell_idx]
+            fees = proceeds * commission
+            cash += float((proceeds - fees).sum())
+            trade_pnl.append(proceeds - fees - cost[sell_idx])
+            shares[sell_idx] = 0.0
+            cost[sell_idx] = 0.0
+
+        buy_idx = np.flatnonzero(buys[day])
+        if len(buy_idx):
+            size = budget / price[buy_idx]
+            amount = size * price[buy_idx]
+            shares[buy_idx] = size
+            cost[buy_idx] = amount * (1 + commission)
+            cash -= float(cost[buy_idx].sum())
+
+        values[day] = cash + float(shares @ marks[day])
+        cash_curve[day] = cash
+
+    return {'values': values,
+            'cash': cash_curve,
+            'trade_pnl': np.concatenate(trade_pnl) if trade_pnl else np.empty(0),
+            'open_trades': int((shares > 0).sum())}
+
+
+def performance_metrics(values, trade_pnl, dates, initial_cash, start_date, end_date):
+    """
+    与 StockBacktestEngine._extract_performance_metrics 相同口径、相同键名的绩效字典
+      - 年化收益率：对数总收益按交易日数折算到 252 天（backtrader Returns）
+      - 夏普比率：自然年收益率减 3% 后的均值 / 总体标准差，不足两年时为 0（backtrader SharpeRatio 默认参数）
+      - 最大回撤：逐日总资产相对历史最高点的最大回撤百分比
+      - 胜率 / 盈亏比 / SQN：按已平仓交易的扣费盈亏计算
+    """
+    values = np.asarray(values, dtype=np.float64)
+    final_cash = round(float(values[-1]), 2) if len(values) else initial_cash
+
+    ratio = final_cash / initial_cash
+    annual_return = round((math.exp(math.log(ratio) / len(values) * TRADING_DAYS_PER_YEAR) - 1) * 100, 2) \
+        if ratio > 0 and len(values) else 0
+
+    year_end = pd.Series(values, index=pd.DatetimeIndex(dates)).groupby(pd.DatetimeIndex(dates).year).last()
+    yearly = year_end.to_numpy() / np.r_[initial_cash, year_end.to_numpy()[:-1]] - 1
+    excess = yearly - RISK_FREE_RATE
+    sharpe_ratio = round(float(excess.mean() / excess.std()), 2) if len(excess) and excess.std() > 0 else 0
+
+    peak = np.maximum.accumulate(values)
+    max_drawdown = round(float(((peak - values) / peak).max() * 100), 2) if len(values) else 0
+
+    trade_pnl = np.asarray(trade_pnl, dtype=np.float64)
+    total_trades = len(trade_pnl)
+    won, lost = trade_pnl[trade_pnl >= 0], trade_pnl[trade_pnl < 0]
+    win_rate = round(len(won) / total_trades * 100, 2) if total_trades > 0 else 0
+    avg_win = won.mean() if len(won) else 0
+    avg_loss = abs(lost.mean()) if len(lost) else 1
+    profit_loss_ratio = round(float(avg_win / avg_loss), 2) if avg_loss else 0
+    sqn = round(float(math.sqrt(total_trades) * trade_pnl.mean() / trade_pnl.std()), 2) \
+        if total_trades > 1 and trade_pnl.std() > 0 else 0
+
+    return {
+        # 基础信息
+        '初始资金': initial_cash,
+        '最终资金': final_cash,
+        '回测周期': f"{start_date} ~ {end_date}",
+        # 收益指标
+        '总收益率': round((final_cash - initial_cash) / initial_cash * 100, 2),
+        '年化收益率': annual_return,
+        '夏普比率': sharpe_ratio,
+        '最大回撤': max_drawdown,
+        # 胜率指标
+        '总交易次数': total_trades,
+        '胜率': win_rate,
+        '盈亏比': profit_loss_ratio,
+        '策略质量得分(SQN)': sqn
+    }
+
+
+def simulate_factor_strategy(score_matrices, close, dates, start_date, end_date, initial_cash=100000, params=None):
+    """
+    得分矩阵 -> 信号 -> 持仓 -> 净值 -> 绩效，一次跑完整个股票池
+    Args:
+        score_matrices: {'pb' / 'zt' / 'shareholder': [交易日 x 股票] 0-100 得分}
+        close:          [交易日 x 股票] 收盘价，停牌为 NaN
+        dates:          交易日
+        params:         FactorDrivenStrategy 的权重与阈值，未给出的取默认值
+    Returns:
+        dict: metrics（绩效字典）、values（每日总资产 Series）、holdings（[交易日 x 股票] 持仓状态）
+    """
+    params = {**DEFAULT_STRATEGY_PARAMS, **(params or {})}
+    close = np.asarray(close, dtype=np.float64)
+    holdings = threshold_holdings(composite_scores(score_matrices, params), np.isfinite(close) & (close > 0),
+                                  params['buy_threshold'], params['sell_threshold'], params['hold_threshold'])
+    result = simulate_holdings(holdings, close, initial_cash)
+    metrics = performance_metrics(result['values'], result['trade_pnl'], dates, initial_cash, start_date, end_date)
+    return {'metrics': metrics,
+            'values': pd.Series(result['values'], index=pd.DatetimeIndex(dates)),
+            'holdings': holdings}
+
+
+def run_vectorized_backtest(factor_lib, start_date, end_date, stock_codes=None, initial_cash=100000,
+                            preprocess_factors=False, **params):
+    """
+    用数组模拟器回测 FactorDrivenStrategy 的阈值逻辑，默认全市场、不截断股票数
+    Args:
+        factor_lib:         FactorLibrary
+        stock_codes:        股票池，None 表示收盘价矩阵中的全部股票
+        preprocess_factors: 因子得分是否经过去极值 / 标准化 / 中性化
+        params:             策略权重与阈值
+    Returns:
+        dict: 与 run_backtest 相同的绩效字典
+    """
+    table = FactorScoreTable.build(factor_lib, start_date, end_date, preprocess=preprocess_factors)
+    close_df = load_close_matrix(factor_lib, start_date, end_date)
+    if close_df.empty or not len(table.dates):
+        logger.error(f"回测期间 {start_date}~{end_date} 无行情或因子数据，终止回测")
+        return None
+
+    close_df.index = pd.to_datetime(close_df.index.astype(str))
+    close_df.columns = [str(code).split('.')[0] for code in close_df.columns]
+    if stock_codes is not None:
+        close_df = close_df.reindex(columns=[str(code).split('.')[0] for code in stock_codes])
+    dates = close_df.index[(close_df.index >= table.dates[0]) & (close_df.index <= table.dates[-1])]
+    close_df = close_df.loc[dates]
+
+    scores = table.get_batch(dates, close_df.columns, ['pb', 'zt', 'shareholder'])
+    score_matrices = {name: scores[name].to_numpy().reshape(len(dates), len(close_df.columns))
+                      for name in ('pb', 'zt', 'shareholder')}
+
+    result = simulate_factor_strategy(score_matrices, close_df.to_numpy(), dates, start_date, end_date,
+                                      initial_cash, params)
+    logger.info(f"向量化回测完成：{len(dates)} 个交易日 x {close_df.shape[1]} 只股票，最终资金：{result['metrics']['最终资金']}元")
+    return result['metrics']
@@ -188,6 +188,19 @@ COMMENT='因子汇总表（所有因子得分）';
 
 
 
+--2.3
+------------------  dwd_factor_state  因子增量计算状态表
+CREATE TABLE IF NOT EXISTS quant.dwd_factor_state (
+    factor_name       VARCHAR(32)  NOT NULL  COMMENT '因子名称(pb/zt/shareholder/volume/summary)',
+    last_ymd          DATE         NOT NULL  COMMENT '已计算到的最新交易日',
+    update_time       TIMESTAMP    DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    PRIMARY KEY (factor_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+COMMENT='因子增量计算状态表';
+
+
+
+
 
 
 
@@ -289,12 +289,10 @@ class CalDWD:
         # ymd = DateUtility.next_day(-1)
 
         # 2.定义 SQL 模板
+        #   按唯一键 (ymd, stock_code) upsert，重跑某天时只改动有变化的行，不再先整天 DELETE 再插入
         sql_statements_template = [
             """
-            DELETE  FROM quant.dwd_ashare_stock_base_info WHERE  ymd = '{ymd}';
-            """,
-            """
-            insert IGNORE  into quant.dwd_ashare_stock_base_info 
+            insert into quant.dwd_ashare_stock_base_info 
             select 
                   tkline.ymd       
                  ,tkline.stock_code
@@ -383,7 +381,23 @@ class CalDWD:
               where ymd = (SELECT MAX(ymd) FROM quant.dwd_stock_a_total_plate)
               group by ymd, stock_code, stock_name 
             ) tplate
-            ON SUBSTRING_INDEX(tkline.stock_code, '.', 1)=SUBSTRING_INDEX(tplate.stock_code, '.', 1);
+            ON SUBSTRING_INDEX(tkline.stock_code, '.', 1)=SUBSTRING_INDEX(tplate.stock_code, '.', 1)
+            ON DUPLICATE KEY UPDATE
+                  stock_name      = VALUES(stock_name)
+                 ,close           = VALUES(close)
+                 ,change_pct      = VALUES(change_pct)
+                 ,volume          = VALUES(volume)
+                 ,trading_amount  = VALUES(trading_amount)
+                 ,market_value    = VALUES(market_value)
+                 ,total_value     = VALUES(total_value)
+                 ,total_capital   = VALUES(total_capital)
+                 ,float_capital   = VALUES(float_capital)
+                 ,shareholder_num = VALUES(shareholder_num)
+                 ,pct_of_total_sh = VALUES(pct_of_total_sh)
+                 ,pb              = VALUES(pb)
+                 ,pe              = VALUES(pe)
+                 ,market          = VALUES(market)
+                 ,plate_names     = VALUES(plate_names);
             """]
 
         # 3.主程序替换 {ymd} 占位符
@@ -728,7 +742,7 @@ class CalDWD:
             # 往前多取300天用于计算年线（确保足够的数据）
             query_start = (start_dt - pd.Timedelta(days=400)).strftime('%Y%m%d')
 
-            kline_df = mysql_utils.data_from_mysql_to_dataframe(
+            kline_df = mysql_utils.data_from_mysql_to_dataframe_parallel(
                 user=origin_user,
                 password=origin_password,
                 host=origin_host,
@@ -736,7 +750,9 @@ class CalDWD:
                 table_name='ods_stock_kline_daily_ts',
                 start_date=query_start,
                 end_date=end_date,
-                cols=['stock_code', 'ymd', 'close', 'volume']
+                cols=['stock_code', 'ymd', 'close', 'volume'],
+                max_workers=4,
+                span_days=30
             )
 
             if kline_df.empty:
@@ -753,7 +769,7 @@ class CalDWD:
             # 4. 按股票分组计算均线
             result_dfs = []
 
-            for stock, stock_df in kline_df.groupby('stock_code'):
+            for stock, stock_df in kline_df.groupby('stock_code', observed=True):
                 stock_df = stock_df.copy()
                 stock_df = stock_df.sort_values('ymd')
 
@@ -813,7 +829,8 @@ class CalDWD:
                 database=origin_database,
                 df=all_df,
                 table_name="dwd_stock_technical_indicators",
-                merge_on=['ymd', 'stock_code']
+                merge_on=['ymd', 'stock_code'],
+                method='load_data'
             )
 
             logging.info(f"技术指标计算完成：共{len(all_df)}条记录，日期范围{start_date}~{end_date}")
@@ -1,3 +1,4 @@
-from Others.strategy.factor_library import FactorLibrary
+from strategy.factor_library import FactorLibrary
+from strategy.factor_registry import TableRead, FactorSpec, register_factor
 
-__all__ = ['FactorLibrary']
\ No newline at end of file
+__all__ = ['FactorLibrary', 'TableRead', 'FactorSpec', 'register_factor']
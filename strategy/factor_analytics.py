@@ -0,0 +1,266 @@
+# strategy/factor_analytics.py
+import logging
+
+import numpy as np
+import pandas as pd
+
+from CommonProperties import Mysql_Utils
+from strategy.factor_score_table import FACTOR_SCORE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZONS = (1, 5, 10, 20)
+
+
+######################  矩阵工具：所有计算都在 [交易日 x 股票] 矩阵上按行进行  #############################
+
+def forward_returns(close, horizons=DEFAULT_HORIZONS):
+    """
+    未来 h 个交易日的收益率矩阵：ret[t] = close[t + h] / close[t] - 1，末尾不足 h 天的行为 NaN
+    Args:
+        close:    [交易日 x 股票] 收盘价矩阵（ndarray 或 DataFrame）
+        horizons: 持有期列表
+    Returns:
+        dict: {h: ndarray}
+    """
+    close = np.asarray(close, dtype=np.float64)
+    result = {}
+    for horizon in horizons:
+        ret = np.full_like(close, np.nan)
+        if horizon < len(close):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ret[:-horizon] = close[horizon:] / close[:-horizon] - 1
+        ret[~np.isfinite(ret)] = np.nan
+        result[horizon] = ret
+    return result
+
+
+def row_rank(matrix):
+    """逐行（截面）排名，NaN 保持 NaN，并列取平均名次"""
+    return pd.DataFrame(matrix).rank(axis=1, method='average').to_numpy(dtype=np.float64)
+
+
+def row_corr(x, y, min_count=10):
+    """
+    逐行 Pearson 相关系数，只用两边都非 NaN 的位置；有效样本少于 min_count 或方差为 0 的行为 NaN
+    用一次遍历的求和公式（einsum 逐行点积），不生成去均值后的中间矩阵
+    Returns:
+        ndarray: 每行一个值
+    """
+    valid = ~(np.isnan(x) | np.isnan(y))
+    count = valid.sum(axis=1)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+
+    sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = np.einsum('ij,ij->i', x, y) - sum_x * sum_y / count
+        var_x = np.einsum('ij,ij->i', x, x) - sum_x * sum_x / count
+        var_y = np.einsum('ij,ij->i', y, y) - sum_y * sum_y / count
+        corr = cov / np.sqrt(var_x * var_y)
+
+    corr[(count < min_count) | ~np.isfinite(corr)] = np.nan
+    return corr
+
+
+def quantile_labels(factor_rank, n_quantiles=5):
+    """
+    截面分组：每行按因子名次的百分位切成 n_quantiles 组，1 为因子值最低组，NaN 为 0；并列的股票落在同一组
+    Args:
+        factor_rank: row_rank 的结果
+    Returns:
+        ndarray[int8]
+    """
+    with np.errstate(invalid='ignore'):
+        pct = factor_rank / np.sum(~np.isnan(factor_rank), axis=1, keepdims=True)
+        labels = np.ceil(pct * n_quantiles)
+    return np.where(np.isnan(labels), 0, np.clip(labels, 1, n_quantiles)).astype(np.int8)
+
+
+def quantile_mean_returns(labels, returns, n_quantiles=5):
+    """
+    各组每日的等权平均收益
+    Returns:
+        ndarray: [交易日 x n_quantiles]
+    """
+    result = np.full((len(labels), n_quantiles), np.nan)
+    valid_ret = ~np.isnan(returns)
+    for quantile in range(1, n_quantiles + 1):
+        member = (labels == quantile) & valid_ret
+        count = member.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[:, quantile - 1] = np.where(member, returns, 0.0).sum(axis=1) / count
+    return result
+
+
+def quantile_turnover(labels, quantile):
+    """
+    某一组的每日换手率：当日组内股票中前一日不在该组的比例（首日为 NaN）
+    """
+    member = labels == quantile
+    stayed = (member[1:] & member[:-1]).sum(axis=1)
+    size = member[1:].sum(axis=1)
+    turnover = np.full(len(labels), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover[1:] = 1 - stayed / size
+    return turnover
+
+
+def ic_summary(ic):
+    """IC 序列的统计：均值、标准差、IR、t 值、IC > 0 的比例、有效天数"""
+    ic = pd.Series(ic).dropna()
+    if ic.empty:
+        return {'ic_mean': np.nan, 'ic_std': np.nan, 'ic_ir': np.nan, 't_stat': np.nan, 'positive_ratio': np.nan,
+                'days': 0}
+    std = ic.std()
+    return {'ic_mean': ic.mean(),
+            'ic_std': std,
+            'ic_ir': ic.mean() / std if std else np.nan,
+            't_stat': ic.mean() / std * np.sqrt(len(ic)) if std else np.nan,
+            'positive_ratio': (ic > 0).mean(),
+            'days': len(ic)}
+
+
+######################  分析入口  #############################
+
+def compute_factor_analytics(factor_matrices, close, dates=None, horizons=DEFAULT_HORIZONS, n_quantiles=5,
+                             decay_lags=None):
+    """
+    所有因子一起做截面分析，全部是矩阵运算，没有逐股票循环；每个矩阵只排名一次
+    Args:
+        factor_matrices: {factor_name: [交易日 x 股票] 因子矩阵}，与 close 行列对齐
+        close:           [交易日 x 股票] 收盘价矩阵，行数可以比因子矩阵多（多出的尾部用于计算远期收益）
+        dates:           因子矩阵的交易日（结果的索引），默认 0..n-1
+        horizons:        远期收益的持有期
+        n_quantiles:     分组数
+        decay_lags:      IC 衰减看的滞后天数：t 日因子与 t+lag 日的次日收益的 rank IC，默认 0..9
+    Returns:
+        dict:
+            ic / rank_ic:      {h: DataFrame[交易日 x 因子]}
+            ic_summary:        DataFrame，index 为 (factor, horizon, method)
+            ic_decay:          DataFrame[滞后天数 x 因子]，rank IC 均值
+            quantile_returns:  {factor: DataFrame[交易日 x 组]}，持有期为 horizons[0]
+            quantile_summary:  DataFrame[因子 x 组]，各组平均收益及多空收益
+            turnover:          DataFrame[交易日 x (因子_top / 因子_bottom)]
+    """
+    n_days = len(next(iter(factor_matrices.values())))
+    dates = pd.Index(dates if dates is not None else range(n_days), name='ymd')
+    decay_lags = list(decay_lags if decay_lags is not None else range(10))
+
+    # 远期收益多算 max(decay_lags) 行，IC 衰减直接取次日收益名次矩阵的滞后切片
+    all_returns = forward_returns(close, sorted(set(horizons) | {1}))
+    returns = {h: ret[:n_days] for h, ret in all_returns.items()}
+    return_ranks = {h: row_rank(ret) for h, ret in returns.items()}
+    next_day_rank = row_rank(all_returns[1][:n_days + max(decay_lags, default=0)])
+
+    factor_values = {name: np.asarray(matrix, dtype=np.float64) for name, matrix in factor_matrices.items()}
+    factor_ranks = {name: row_rank(matrix) for name, matrix in factor_values.items()}
+
+    ic, rank_ic, summary_rows = {}, {}, []
+    for horizon in horizons:
+        ic[horizon] = pd.DataFrame({name: row_corr(values, returns[horizon]) for name, values in factor_values.items()},
+                                   index=dates)
+        rank_ic[horizon] = pd.DataFrame({name: row_corr(ranks, return_ranks[horizon])
+                                         for name, ranks in factor_ranks.items()}, index=dates)
+        for name in factor_values:
+            summary_rows.append({'factor': name, 'horizon': horizon, 'method': 'ic', **ic_summary(ic[horizon][name])})
+            summary_rows.append({'factor': name, 'horizon': horizon, 'method': 'rank_ic',
+                                 **ic_summary(rank_ic[horizon][name])})
+
+    decay = {}
+    for name, ranks in factor_ranks.items():
+        decay[name] = []
+        for lag in decay_lags:
+            lagged = next_day_rank[lag:lag + n_days]
+            decay[name].append(np.nanmean(row_corr(ranks[:len(lagged)], lagged)) if len(lagged) else np.nan)
+    ic_decay = pd.DataFrame(decay, index=pd.Index(decay_lags, name='lag'))
+
+    quantile_returns, quantile_rows, turnover = {}, {}, {}
+    quantile_cols = [f"Q{quantile}" for quantile in range(1, n_quantiles + 1)]
+    for name, ranks in factor_ranks.items():
+        labels = quantile_labels(ranks, n_quantiles)
+        daily = pd.DataFrame(quantile_mean_returns(labels, returns[horizons[0]], n_quantiles),
+                             index=dates, columns=quantile_cols)
+        quantile_returns[name] = daily
+        quantile_rows[name] = {**daily.mean().to_dict(),
+                               'long_short': (daily[quantile_cols[-1]] - daily[quantile_cols[0]]).mean()}
+        turnover[f"{name}_top"] = quantile_turnover(labels, n_quantiles)
+        turnover[f"{name}_bottom"] = quantile_turnover(labels, 1)
+
+    return {'ic': ic,
+            'rank_ic': rank_ic,
+            'ic_summary': pd.DataFrame(summary_rows).set_index(['factor', 'horizon', 'method']),
+            'ic_decay': ic_decay,
+            'quantile_returns': quantile_returns,
+            'quantile_summary': pd.DataFrame(quantile_rows).T,
+            'turnover': pd.DataFrame(turnover, index=dates)}
+
+
+def load_close_matrix(factor_lib, start_date, end_date):
+    """
+    [交易日 x 股票] 收盘价矩阵：优先用本地行情面板（memmap），不覆盖时从 ods_stock_kline_daily_ts 读取后透视
+    Returns:
+        DataFrame: index 为交易日，columns 为股票代码
+    """
+    panel = factor_lib.get_price_panel()
+    if panel is not None and panel.covers(start_date, end_date):
+        return panel.to_frame('close', start_date, end_date)
+
+    kline_df = Mysql_Utils.data_from_mysql_to_dataframe(user=factor_lib.user,
+                                                        password=factor_lib.password,
+                                                        host=factor_lib.host,
+                                                        database=factor_lib.database,
+                                                        table_name='ods_stock_kline_daily_ts',
+                                                        start_date=start_date,
+                                                        end_date=end_date,
+                                                        cols=['ymd', 'stock_code', 'close'])
+    if kline_df.empty:
+        return pd.DataFrame()
+    kline_df['stock_code'] = kline_df['stock_code'].astype(str)
+    return kline_df.pivot_table(index='ymd', columns='stock_code', values='close', aggfunc='last', observed=True)
+
+
+def factor_to_matrix(factor_df, score_col, dates, stock_codes):
+    """因子长表 -> 与 dates / stock_codes 对齐的 [交易日 x 股票] 矩阵，缺失为 NaN"""
+    matrix = np.full((len(dates), len(stock_codes)), np.nan)
+    if factor_df.empty:
+        return matrix
+    day_idx = dates.get_indexer(pd.to_datetime(factor_df['ymd'].astype(str)))
+    code_idx = stock_codes.get_indexer(factor_df['stock_code'].astype(str))
+    valid = (day_idx >= 0) & (code_idx >= 0)
+    matrix[day_idx[valid], code_idx[valid]] = pd.to_numeric(factor_df[score_col], errors='coerce').to_numpy()[valid]
+    return matrix
+
+
+def analyze_factors(factor_lib, start_date, end_date, factors=('pb', 'zt', 'shareholder', 'volume'),
+                    horizons=DEFAULT_HORIZONS, n_quantiles=5):
+    """
+    对 FactorLibrary 的因子输出做截面有效性分析（IC / rank IC / IC 衰减 / 分组收益 / 换手率），不需要跑 backtrader
+    因子经因子缓存获取；收盘价多取 max(horizons) 个交易日用于计算区间末尾的远期收益
+    Returns:
+        dict: 见 compute_factor_analytics
+    """
+    factor_results = factor_lib.get_factors(list(factors), start_date, end_date)
+    trading_days = factor_lib.get_trading_days(start_date, end_date)
+    if not trading_days:
+        logger.warning(f"没有交易日数据: {start_date}~{end_date}")
+        return {}
+
+    close_end_date = factor_lib.shift_trading_day(trading_days[-1], max(horizons))
+    close_df = load_close_matrix(factor_lib, trading_days[0], close_end_date)
+    if close_df.empty:
+        logger.warning(f"没有行情数据: {trading_days[0]}~{close_end_date}")
+        return {}
+
+    # 收盘价的行 = 区间交易日 + 其后用于远期收益的交易日，前 len(dates) 行与因子矩阵对齐
+    dates = pd.DatetimeIndex(pd.to_datetime(trading_days), name='ymd')
+    close_df.index = pd.to_datetime(close_df.index)
+    close_df = close_df.reindex(pd.to_datetime(factor_lib.get_trading_days(trading_days[0], close_end_date)))
+    stock_codes = pd.Index(close_df.columns.astype(str))
+
+    factor_matrices = {name: factor_to_matrix(factor_results[name], FACTOR_SCORE_COLUMNS[name], dates, stock_codes)
+                       for name in factors}
+    result = compute_factor_analytics(factor_matrices, close_df.to_numpy(dtype=np.float64), dates=dates,
+                                      horizons=horizons, n_quantiles=n_quantiles)
+    logger.info(f"因子分析完成：{start_date}~{end_date}，{len(dates)} 个交易日 x {len(stock_codes)} 只股票，因子: {list(factors)}")
+    return result
@@ -0,0 +1,208 @@
+# strategy/factor_cache.py
+import os
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def factor_cache_key(factor_name, params=None):
+    """(因子名, 参数) -> 缓存键，参数顺序无关"""
+    return factor_name, tuple(sorted((params or {}).items()))
+
+
+def _day_key(values):
+    """各因子的 ymd 格式不一（datetime / 'YYYYMMDD' / 'YYYY-MM-DD'），统一为 YYYYMMDD"""
+    return pd.to_datetime(pd.Series(values).astype(str)).dt.strftime('%Y%m%d')
+
+
+def _contiguous_runs(trading_days, missing):
+    """把 missing 中的交易日按 trading_days 的顺序切成连续段 [(start_ymd, end_ymd)]"""
+    runs, run_start, prev = [], None, None
+    for ymd in trading_days:
+        if ymd in missing and run_start is None:
+            run_start = ymd
+        elif ymd not in missing and run_start is not None:
+            runs.append((run_start, prev))
+            run_start = None
+        prev = ymd
+    if run_start is not None:
+        runs.append((run_start, prev))
+    return runs
+
+
+class FactorCache:
+    """
+    多区间因子结果缓存：按 (因子, 参数, 交易日) 逐日存放
+      - 查询区间与已缓存区间部分重叠时，只计算缺失的连续交易日段，再按日拼接
+      - 内存按字节数做 LRU 淘汰；配置 spill_dir 时被淘汰的日数据落盘为 pickle，之后命中磁盘再读回内存
+    默认实例由 get_default_factor_cache() 提供，同一进程内的 FactorLibrary / 回测引擎 / 策略引擎共用
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._days = OrderedDict()     # (key, ymd) -> DataFrame
+        self._sizes = {}
+        self._spilled = set()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.stats = {'hit_days': 0, 'disk_days': 0, 'computed_days': 0, 'evicted_days': 0}
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _spill_file(self, key, ymd):
+        digest = hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, digest, f"{ymd}.pkl")
+
+    def _put_day(self, key, ymd, day_df):
+        size = int(day_df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if (key, ymd) in self._days:
+                self._bytes -= self._sizes.pop((key, ymd))
+                del self._days[(key, ymd)]
+            self._days[(key, ymd)] = day_df
+            self._sizes[(key, ymd)] = size
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        """按最近最少使用淘汰到 max_bytes 以内，配置了 spill_dir 时先落盘"""
+        while self._bytes > self.max_bytes and len(self._days) > 1:
+            (key, ymd), day_df = self._days.popitem(last=False)
+            self._bytes -= self._sizes.pop((key, ymd))
+            self.stats['evicted_days'] += 1
+            if self.spill_dir and (key, ymd) not in self._spilled:
+                path = self._spill_file(key, ymd)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.tmp', 'wb') as file:
+                    pickle.dump(day_df, file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(path + '.tmp', path)
+                self._spilled.add((key, ymd))
+
+    def _get_day(self, key, ymd):
+        """取一天的缓存，内存未命中时尝试磁盘，都没有返回 None"""
+        with self._lock:
+            day_df = self._days.get((key, ymd))
+            if day_df is not None:
+                self._days.move_to_end((key, ymd))
+                self.stats['hit_days'] += 1
+                return day_df
+
+            if self.spill_dir and (key, ymd) in self._spilled:
+                path = self._spill_file(key, ymd)
+                if os.path.exists(path):
+                    with open(path, 'rb') as file:
+                        day_df = pickle.load(file)
+                    self.stats['disk_days'] += 1
+                    self._put_day(key, ymd, day_df)
+                    return day_df
+                self._spilled.discard((key, ymd))
+        return None
+
+    def missing_runs(self, key, trading_days):
+        """
+        找出未缓存的交易日，并按交易日序列切成连续段
+        Returns:
+            list[(start_ymd, end_ymd)]
+        """
+        return _contiguous_runs(trading_days, {ymd for ymd in trading_days
+                                               if (key, ymd) not in self._days and (key, ymd) not in self._spilled})
+
+    def store(self, key, result_df, trading_days):
+        """
+        把一段计算结果按交易日拆开存入缓存；区间内没有数据的交易日存空表，避免反复重算
+        Returns:
+            dict: {ymd: 当日结果}，调用方直接用它拼接，不依赖这些日期此刻还在缓存里（存入时可能已被淘汰）
+        """
+        if result_df is None:
+            return {}
+        days = _day_key(result_df['ymd']) if not result_df.empty else pd.Series(dtype=str)
+        groups = result_df.groupby(days.to_numpy(), sort=False).indices if not result_df.empty else {}
+        empty_df = result_df.iloc[0:0]
+        day_frames = {}
+        for ymd in trading_days:
+            day_frames[ymd] = result_df.iloc[groups[ymd]].reset_index(drop=True) if ymd in groups else empty_df
+            self._put_day(key, ymd, day_frames[ymd])
+        self.stats['computed_days'] += len(trading_days)
+        return day_frames
+
+    def get_range(self, factor_name, params, trading_days, compute, known_days=None):
+        """
+        取 trading_days 上的因子结果：缺失的连续段调用 compute(start_ymd, end_ymd) 计算后入缓存，再按日拼接
+        结果由本次取到 / 算出的日数据直接拼接：内存上限较小时，本次存入的日期可能马上被淘汰，但不会因此从结果中丢失
+        Args:
+            factor_name:  因子名
+            params:       影响结果的参数字典
+            trading_days: 交易日列表（YYYYMMDD，升序）
+            compute:      缺失段的计算函数，返回含 ymd 列的 DataFrame
+            known_days:   调用方刚 store 过的 {ymd: 当日结果}，优先使用，不再回读缓存
+        Returns:
+            DataFrame: 按交易日顺序拼接的结果
+        """
+        key = factor_cache_key(factor_name, params)
+        day_frames = dict(known_days or {})
+        for ymd in trading_days:
+            if ymd in day_frames:
+                continue
+            day_df = self._get_day(key, ymd)
+            if day_df is not None:
+                day_frames[ymd] = day_df
+
+        missing = {ymd for ymd in trading_days if ymd not in day_frames}
+        for start_ymd, end_ymd in _contiguous_runs(trading_days, missing):
+            run_days = [ymd for ymd in trading_days if start_ymd <= ymd <= end_ymd]
+            logger.info(f"因子缓存未命中：{factor_name}{dict(key[1])} {start_ymd}~{end_ymd}，共{len(run_days)}个交易日")
+            day_frames.update(self.store(key, compute(start_ymd, end_ymd), run_days))
+
+        lost = [ymd for ymd in trading_days if ymd not in day_frames]
+        if lost:
+            raise RuntimeError(f"因子 {factor_name} 有 {len(lost)} 个交易日既未命中缓存也未算出：{lost[:5]}")
+        parts = [day_frames[ymd] for ymd in trading_days]
+        if not parts:
+            return pd.DataFrame()
+        non_empty = [part for part in parts if not part.empty]
+        return pd.concat(non_empty, ignore_index=True) if non_empty else parts[0]
+
+    def clear(self, disk=False):
+        """清空内存缓存，disk=True 时连同落盘文件一起删除"""
+        with self._lock:
+            if disk and self.spill_dir:
+                for key, ymd in list(self._spilled):
+                    path = self._spill_file(key, ymd)
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._spilled.clear()
+            self._days.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+
+_default_factor_cache = None
+
+
+def get_default_factor_cache():
+    """进程内共享的因子缓存"""
+    global _default_factor_cache
+    if _default_factor_cache is None:
+        _default_factor_cache = FactorCache()
+    return _default_factor_cache
+
+
+def configure_factor_cache(max_bytes=None, spill_dir=None):
+    """修改共享因子缓存的内存上限 / 落盘目录"""
+    cache = get_default_factor_cache()
+    if max_bytes is not None:
+        cache.max_bytes = max_bytes
+    if spill_dir is not None:
+        cache.spill_dir = spill_dir
+    with cache._lock:
+        cache._evict()
+    return cache
@@ -1,11 +1,216 @@
 # strategy/factor_library.py
+import numpy as np
 import pandas as pd
 import logging
 from CommonProperties import Mysql_Utils
 from CommonProperties.Base_utils import timing_decorator, convert_ymd_format
+from CommonProperties.Price_Panel import PricePanel
+from strategy.scoring_kernels import (sigmoid_score, capped_linear_score, log2_score, binary_score, banded_score,
+                                     level_bucket)
+from strategy.factor_cache import get_default_factor_cache, factor_cache_key
+from strategy.factor_score_table import FACTOR_SCORE_COLUMNS
+from strategy.factor_analytics import factor_to_matrix
+from strategy.factor_registry import (TableRead, register_factor, resolve_factors, plan_loads, load_panel,
+                                      run_factor_specs, factor_watermark, FACTOR_REGISTRY)
 
 logger = logging.getLogger(__name__)
 
+# 增量计算时，各因子在新交易日之前还需要重算的交易日数（回溯尾巴）
+#   pb / shareholder 只依赖当日截面；zt 的回溯期由 zt_factor_score 自己往前取涨停记录；
+#   volume 的连续天数最多看最近5天，需要前4个交易日（vol_ma60 已在 dwd_stock_technical_indicators 中预先算好）
+FACTOR_LOOKBACK_DAYS = {'pb': 0, 'zt': 0, 'shareholder': 0, 'volume': 4}
+
+# 涨停因子的回溯交易日数（含当日）
+ZT_LOOKBACK_DAYS = 5
+
+# 各因子影响结果的参数及默认值，因子缓存按 (因子, 参数) 区分
+FACTOR_DEFAULT_PARAMS = {
+    'pb': {'reverse': True},
+    'zt': {'lookback_days': ZT_LOOKBACK_DAYS, 'scoring_method': 'linear'},
+    'shareholder': {},
+    'volume': {},
+}
+
+# dwd_factor_volume_shrinkage 的列顺序（与表结构完全一致）
+VOLUME_FACTOR_COLUMNS = [
+    'ymd', 'stock_code', 'stock_name',
+    'close', 'volume',
+    'vol_ma5', 'vol_ma60', 'volume_vs_ma5',
+    'is_shrink_today', 'consecutive_shrink_days',
+    'is_down', 'consecutive_down_days',
+    'volume_score', 'price_score', 'composite_score', 'signal_level'
+]
+
+# 因子汇总表 dwd_factor_summary：各因子贡献的列
+SUMMARY_FACTOR_COLUMNS = {
+    'pb': ['pb_score'],
+    'zt': ['zt_score'],
+    'shareholder': ['shareholder_score'],
+    'volume': ['volume_score', 'price_score', 'composite_score', 'signal_level'],
+}
+SUMMARY_SCORE_COLUMNS = ['pb_score', 'zt_score', 'shareholder_score', 'volume_score', 'price_score', 'composite_score']
+
+
+def consecutive_true_count(flags, group_keys=None, cap=None):
+    """
+    截至每一行、往前连续为 True 的行数（含当前行），按 group_keys 分组各自计数，不跨组
+    做法：记录每行之前最近一次"断点"（False 行或组首的前一行）的位置，np.maximum.accumulate 前向填充后，
+    当前位置减去断点位置即为连续天数，全程无 Python 循环
+    Args:
+        flags:      布尔序列，调用方需先按 (组, 日期) 排好序；NaN 按 True 处理（与 if val 的判断一致）
+        group_keys: 分组键序列（如 stock_code），None 表示整体一组
+        cap:        计数上限，例如只看最近 5 天时传 5
+    Returns:
+        ndarray[int64]: 每行的连续天数
+    """
+    flags = np.asarray(flags, dtype=bool)
+    positions = np.arange(len(flags))
+    barrier = np.where(flags, -1, positions)
+
+    if group_keys is not None and len(flags):
+        keys = np.asarray(group_keys)
+        group_start = np.r_[True, keys[1:] != keys[:-1]]
+        barrier = np.where(group_start & flags, positions - 1, barrier)
+
+    counts = positions - np.maximum.accumulate(barrier)
+    return np.minimum(counts, cap) if cap is not None else counts
+
+
+######################  因子预处理：去极值 / 标准化 / 行业市值中性化  #############################
+# 输入都是 [交易日 x 股票] 的 float64 矩阵，缺失为 NaN；每个函数对整段面板一次算完，不逐日循环
+
+def _row_quantiles(sorted_values, counts, q):
+    """已按行升序排序（NaN 在末尾）的矩阵上取每行的 q 分位数（线性插值），没有有效值的行为 NaN"""
+    position = q * np.maximum(counts - 1, 0)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(counts - 1, 0))
+    lower_values = np.take_along_axis(sorted_values, lower[:, None], axis=1)[:, 0]
+    upper_values = np.take_along_axis(sorted_values, upper[:, None], axis=1)[:, 0]
+    result = lower_values + (upper_values - lower_values) * (position - lower)
+    return np.where(counts > 0, result, np.nan)
+
+
+def winsorize_panel(values, method='mad', n_mad=5.0, limits=(0.01, 0.99)):
+    """
+    按日截面去极值
+    Args:
+        values: [交易日 x 股票] 矩阵
+        method: 'mad'      —— 截到 中位数 ± n_mad * 1.4826 * MAD
+                'quantile' —— 截到当日 limits 两个分位数
+        n_mad:  MAD 法的倍数
+        limits: 分位数法的上下分位
+    Returns:
+        ndarray: 同形状矩阵，NaN 保持不变
+    """
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.isfinite(values).sum(axis=1)
+    sorted_values = np.sort(values, axis=1)
+
+    if method == 'quantile':
+        lower = _row_quantiles(sorted_values, counts, limits[0])
+        upper = _row_quantiles(sorted_values, counts, limits[1])
+    elif method == 'mad':
+        median = _row_quantiles(sorted_values, counts, 0.5)
+        mad = _row_quantiles(np.sort(np.abs(values - median[:, None]), axis=1), counts, 0.5) * 1.4826
+        lower, upper = median - n_mad * mad, median + n_mad * mad
+    else:
+        raise ValueError(f"不支持的去极值方法：{method}")
+
+    return np.clip(values, lower[:, None], upper[:, None])
+
+
+def zscore_panel(values):
+    """按日截面标准化为均值 0、标准差 1；当日有效值不足 2 个或标准差为 0 时整行为 NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=1, keepdims=True)
+    filled = np.where(valid, values, 0.0)
+    mean = filled.sum(axis=1, keepdims=True) / np.maximum(counts, 1)
+    std = np.sqrt((np.where(valid, values - mean, 0.0) ** 2).sum(axis=1, keepdims=True) / np.maximum(counts - 1, 1))
+    std = np.where((counts > 1) & (std > 0), std, np.nan)
+    return (values - mean) / std
+
+
+def neutralize_panel(values, exposures, groups=None):
+    """
+    按日截面做分组最小二乘中性化：values ~ 组哑变量 + exposures，返回残差
+    组哑变量部分按 Frisch-Waugh 定理等价为组内去均值（组数再多也不用展开哑变量矩阵），
+    剩下的 K 个连续暴露（如对数市值）对所有交易日一次构造正规方程 [交易日 x K x K]，批量伪逆求解
+    Args:
+        values:    [交易日 x 股票] 因子值
+        exposures: [交易日 x 股票] 矩阵的列表（连续暴露），可为空列表
+        groups:    [交易日 x 股票] 的非负整数组编号（行业 / 市场），-1 表示缺失；None 时只带截距
+    Returns:
+        ndarray: 残差矩阵；因子值、暴露或分组缺失的位置为 NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_days, n_stocks = values.shape
+    exposures = [np.asarray(exposure, dtype=np.float64) for exposure in exposures]
+    if groups is None:
+        groups = np.zeros(values.shape, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+
+    valid = np.isfinite(values) & (groups >= 0)
+    for exposure in exposures:
+        valid &= np.isfinite(exposure)
+
+    # (交易日, 组) 展平为一个编号，bincount 一次求出所有日内各组的均值
+    n_groups = int(groups.max()) + 1 if valid.any() else 1
+    cell = np.arange(n_days)[:, None] * n_groups + np.where(valid, groups, 0)
+    cell_valid = cell[valid]
+    cell_counts = np.maximum(np.bincount(cell_valid, minlength=n_days * n_groups), 1)
+
+    def demean(matrix):
+        sums = np.bincount(cell_valid, weights=matrix[valid], minlength=n_days * n_groups)
+        return np.where(valid, matrix - (sums / cell_counts)[cell], 0.0)
+
+    residual = demean(values)
+    if exposures:
+        design = np.stack([demean(exposure) for exposure in exposures], axis=2)
+        xtx = np.einsum('dsk,dsl->dkl', design, design)
+        xty = np.einsum('dsk,ds->dk', design, residual)
+        beta = np.einsum('dkl,dl->dk', np.linalg.pinv(xtx), xty)
+        residual = residual - np.einsum('dsk,dk->ds', design, beta)
+
+    return np.where(valid, residual, np.nan)
+
+
+def preprocess_factor_matrix(values, log_market_value=None, groups=None, winsorize='mad', neutralize=True):
+    """
+    单个因子面板的预处理流水线：去极值 -> 标准化 -> 行业 / 市值中性化 -> 再标准化
+    Args:
+        values:           [交易日 x 股票] 因子值
+        log_market_value: [交易日 x 股票] 对数流通市值，None 时不做市值中性化
+        groups:           [交易日 x 股票] 行业 / 市场组编号，None 时不做行业中性化
+        winsorize:        'mad' / 'quantile' / None（不去极值）
+        neutralize:       是否做中性化
+    Returns:
+        ndarray: 处理后的 z 值矩阵
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if winsorize:
+        values = winsorize_panel(values, method=winsorize)
+    values = zscore_panel(values)
+    if neutralize and (log_market_value is not None or groups is not None):
+        exposures = [log_market_value] if log_market_value is not None else []
+        values = zscore_panel(neutralize_panel(values, exposures, groups))
+    return values
+
+
+def industry_group_labels(plate_names, market, min_group_size=5):
+    """
+    由 dwd_ashare_stock_base_info 的 plate_names / market 得到每只股票的中性化分组
+    plate_names 是按板块名排序后逗号拼接的字符串，取第一个板块作为行业；
+    没有板块或该板块成员不足 min_group_size 只的股票归入所属 market，两者都没有的记为缺失
+    Returns:
+        Series[str]: 分组标签，缺失为 NaN
+    """
+    plate = pd.Series(plate_names).astype('string').str.split(',').str[0].str.strip()
+    plate = plate.mask(plate == '')
+    sizes = plate.map(plate.value_counts())
+    labels = plate.where(sizes >= min_group_size)
+    return labels.fillna(pd.Series(market, index=labels.index).astype('string').mask(lambda s: s == ''))
+
 
 class FactorLibrary:
     """因子计算库：改为百分制输出"""
@@ -16,9 +221,15 @@ class FactorLibrary:
         self.host = Mysql_Utils.origin_host
         self.database = Mysql_Utils.origin_database
 
-        # 简单缓存，不强制依赖
+        # 每个因子最近一次的结果（aggregate_factors 使用）
         self.cached_factors = {}
 
+        # 按 (因子, 参数, 交易日) 缓存的因子结果，进程内所有 FactorLibrary 共用
+        self.factor_cache = get_default_factor_cache()
+
+        # 全市场行情面板（memmap），首次使用时打开
+        self._price_panel = None
+
         # 获取全量股票列表（stock_code, stock_name）
         self.stocks_df = Mysql_Utils.get_stock_codes_latest()
 
@@ -46,39 +257,7 @@ class FactorLibrary:
             # 转换数值，无效值变为NaN
             pb_df['pb'] = pd.to_numeric(pb_df['pb'], errors='coerce')
 
-            # 按日期分组计算排名
-            result_dfs = []
-
-            for date, date_df in pb_df.groupby('ymd'):
-                date_df = date_df.copy()
-
-                # 获取有效数据的数量: valid_count
-                valid_mask = date_df['pb'].notna()
-                valid_count = valid_mask.sum()
-
-                if valid_count > 0:
-                    # 对有效数据计算百分制得分
-                    valid_data = date_df.loc[valid_mask].copy()
-
-                    if reverse:
-                        # PB越低分越高（价值因子）
-                        valid_data['pb_rank'] = valid_data['pb'].rank(method='min', ascending=True)
-                    else:
-                        valid_data['pb_rank'] = valid_data['pb'].rank(method='min', ascending=False)
-
-                    max_rank = valid_data['pb_rank'].max()
-                    valid_data['pb_score'] = ((max_rank - valid_data['pb_rank']) / max_rank * 100).round(2)
-
-                    # 将得分合并回原数据框
-                    for idx in valid_data.index:
-                        date_df.loc[idx, 'pb_score'] = valid_data.loc[idx, 'pb_score']
-
-                # 无效数据给0分（简单处理）
-                date_df.loc[~valid_mask, 'pb_score'] = 0.0
-
-                result_dfs.append(date_df[['ymd', 'stock_code', 'pb_score']])
-
-            result_df = pd.concat(result_dfs, ignore_index=True)
+            result_df = self.score_pb_cross_section(pb_df, reverse=reverse)
             logger.info(f"PB因子百分制计算完成：共{len(result_df)}条记录")
 
             # 保存到缓存
@@ -91,7 +270,28 @@ class FactorLibrary:
             logger.error(f"计算PB因子失败：{str(e)}")
             return pd.DataFrame(columns=['ymd', 'stock_code', 'pb_score'])
 
-    def zt_factor_score(self, start_date, end_date, lookback_days=5, scoring_method='linear', save_to_cache=True):
+    @staticmethod
+    def score_pb_cross_section(pb_df, reverse=True):
+        """
+        按日期截面对 PB 排名打分，整表一次分组 rank，不逐日循环
+        score = (当日最大名次 - 名次) / 当日最大名次 * 100，名次用 method='min'；PB 缺失给 0 分
+        Args:
+            pb_df:   包含 ymd, stock_code, pb 的 DataFrame
+            reverse: True 时 PB 越低分越高
+        Returns:
+            DataFrame: ymd, stock_code, pb_score，按 ymd 排序、同日内保持原顺序
+        """
+        pb_df = pb_df[pb_df['ymd'].notna()].sort_values('ymd', kind='stable')
+        by_date = pb_df.groupby('ymd', observed=True, sort=False)['pb']
+
+        pb_rank = by_date.rank(method='min', ascending=reverse)
+        max_rank = pb_rank.groupby(pb_df['ymd'], observed=True, sort=False).transform('max')
+
+        result_df = pb_df[['ymd', 'stock_code']].copy()
+        result_df['pb_score'] = ((max_rank - pb_rank) / max_rank * 100).round(2).fillna(0.0)
+        return result_df.reset_index(drop=True)
+
+    def zt_factor_score(self, start_date, end_date, lookback_days=ZT_LOOKBACK_DAYS, scoring_method='linear', save_to_cache=True):
         """
         计算涨停因子百分制评分（0-100分）
 
@@ -119,180 +319,69 @@ class FactorLibrary:
             full_trading_days = self.get_trading_days(query_start_date, end_date)
             if not full_trading_days:
                 logger.warning(f"未获取到交易日数据，范围: {query_start_date} - {end_date}")
-                result_df = pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
+                return pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
+
+            logger.info(
+                f"完整交易日范围: {full_trading_days[0]} 到 {full_trading_days[-1]}, 共{len(full_trading_days)}个交易日")
+
+            # 2. 目标区间：第一个 >= start_date 的交易日 到 最后一个 <= end_date 的交易日
+            trading_days_idx = pd.to_datetime(full_trading_days, format='%Y%m%d')
+            start_idx = int(trading_days_idx.searchsorted(pd.to_datetime(str(start_date))))
+            end_idx = int(trading_days_idx.searchsorted(pd.to_datetime(str(end_date)), side='right')) - 1
+            if start_idx > end_idx:
+                logger.warning(f"在交易日列表中找不到 {start_date} - {end_date} 之间的日期")
+                return pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
+
+            target_trading_days = full_trading_days[start_idx:end_idx + 1]
+            logger.info(
+                f"目标计算区间: {target_trading_days[0]} 到 {target_trading_days[-1]}, 共{len(target_trading_days)}个交易日")
+
+            # 3. 最早需要回溯的交易日
+            actual_query_start = full_trading_days[max(0, start_idx - lookback_days)]
+            logger.info(f"实际查询涨停记录范围: {actual_query_start} 到 {end_date} (回溯{lookback_days}个交易日)")
+
+            # 4. 获取涨停记录
+            zt_df = Mysql_Utils.data_from_mysql_to_dataframe(
+                user=self.user,
+                password=self.password,
+                host=self.host,
+                database=self.database,
+                table_name='dwd_stock_zt_list',
+                start_date=actual_query_start,
+                end_date=end_date,
+                cols=['ymd', 'stock_code']
+            )
+
+            if zt_df.empty:
+                logger.info(f"在范围 {actual_query_start} - {end_date} 内无涨停记录，全部返回0分")
+                result_df = self._get_zero_scores(target_trading_days, start_date, end_date, 'zt_score')
             else:
-                logger.info(
-                    f"完整交易日范围: {full_trading_days[0]} 到 {full_trading_days[-1]}, 共{len(full_trading_days)}个交易日")
+                # 5. 获取全量股票列表
+                stock_base_df = Mysql_Utils.data_from_mysql_to_dataframe(
+                    user=self.user,
+                    password=self.password,
+                    host=self.host,
+                    database=self.database,
+                    table_name='dwd_ashare_stock_base_info',
+                    start_date=target_trading_days[-1],
+                    end_date=target_trading_days[-1],
+                    cols=['stock_code']
+                )
 
-                # 2. 找到 start_date 在完整交易日列表中的位置
-                try:
-                    start_idx = full_trading_days.index(start_date)
-                except ValueError:
-                    # 如果 start_date 不是交易日，找第一个大于等于 start_date 的交易日
-                    start_idx = None
-                    for i, d in enumerate(full_trading_days):
-                        if d >= start_date:
-                            start_idx = i
-                            break
-                    if start_idx is None:
-                        logger.warning(f"在交易日列表中找不到 {start_date} 及之后的日期")
-                        result_df = pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
-                    else:
-                        # 3. 找到 end_date 在完整交易日列表中的位置
-                        try:
-                            end_idx = full_trading_days.index(end_date)
-                        except ValueError:
-                            # 如果 end_date 不是交易日，找最后一个小于等于 end_date 的交易日
-                            end_idx = len(full_trading_days) - 1
-                            for i in range(len(full_trading_days) - 1, -1, -1):
-                                if full_trading_days[i] <= end_date:
-                                    end_idx = i
-                                    break
-
-                        # 4. 截取需要计算的交易日范围（从 start_date 到 end_date）
-                        target_trading_days = full_trading_days[start_idx:end_idx + 1]
-                        logger.info(
-                            f"目标计算区间: {target_trading_days[0]} 到 {target_trading_days[-1]}, 共{len(target_trading_days)}个交易日")
-
-                        # 5. 计算需要查询涨停记录的起始日期（精确计算回溯期）
-                        # 最早需要回溯的交易日索引
-                        earliest_needed_idx = max(0, start_idx - lookback_days)
-                        actual_query_start = full_trading_days[earliest_needed_idx]
-                        logger.info(
-                            f"实际查询涨停记录范围: {actual_query_start} 到 {end_date} (回溯{lookback_days}个交易日)")
-
-                        # 6. 获取涨停记录
-                        zt_df = Mysql_Utils.data_from_mysql_to_dataframe(
-                            user=self.user,
-                            password=self.password,
-                            host=self.host,
-                            database=self.database,
-                            table_name='dwd_stock_zt_list',
-                            start_date=actual_query_start,
-                            end_date=end_date,
-                            cols=['ymd', 'stock_code']
-                        )
-
-                        if zt_df.empty:
-                            logger.info(f"在范围 {actual_query_start} - {end_date} 内无涨停记录，全部返回0分")
-                            result_df = self._get_zero_scores(target_trading_days, start_date, end_date, 'zt_score')
-                        else:
-                            # 7. 确保日期列是字符串格式
-                            if not pd.api.types.is_string_dtype(zt_df['ymd']):
-                                zt_df['ymd'] = zt_df['ymd'].astype(str)
-
-                            # 8. 获取全量股票列表
-                            stock_base_df = Mysql_Utils.data_from_mysql_to_dataframe(
-                                user=self.user,
-                                password=self.password,
-                                host=self.host,
-                                database=self.database,
-                                table_name='dwd_ashare_stock_base_info',
-                                start_date=target_trading_days[-1],
-                                end_date=target_trading_days[-1],
-                                cols=['stock_code']
-                            )
-
-                            if stock_base_df.empty:
-                                logger.warning("未获取到股票基础信息")
-                                result_df = pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
-                            else:
-                                all_stocks = stock_base_df['stock_code'].unique()
-                                logger.info(f"全量股票数量: {len(all_stocks)}")
-
-                                # 9. 为每只股票构建涨停字典
-                                stock_zt_dict = {}
-                                for _, row in zt_df.iterrows():
-                                    stock = row['stock_code']
-                                    date = row['ymd']
-                                    if stock not in stock_zt_dict:
-                                        stock_zt_dict[stock] = []
-                                    stock_zt_dict[stock].append(date)
-
-                                logger.info(f"有涨停记录的股票数量: {len(stock_zt_dict)}")
-
-                                # 10. 为每个目标交易日预先计算回溯起始日期（使用完整交易日列表）
-                                lookback_start_dates = {}
-                                date_to_idx = {date: idx for idx, date in enumerate(full_trading_days)}
-
-                                for current_date in target_trading_days:
-                                    current_idx = date_to_idx[current_date]
-                                    # 计算回溯起始索引：取前 lookback_days 个交易日
-                                    start_idx = max(0, current_idx - lookback_days + 1)  # +1 是因为要包含当前日
-                                    lookback_start_dates[current_date] = full_trading_days[start_idx]
-
-                                # 11. 根据评分方法计算得分函数
-                                if scoring_method == 'linear':
-                                    # 线性得分：每涨停一次得 100/lookback_days 分
-                                    max_possible_zts = lookback_days
-                                    score_per_zt = 100 / max_possible_zts if max_possible_zts > 0 else 20
-                                    logger.info(f"线性评分: 每涨停一次得 {score_per_zt:.2f} 分")
-
-                                    def calculate_score(zt_count):
-                                        return min(zt_count * score_per_zt, 100)
-
-                                elif scoring_method == 'log':
-                                    # 对数得分：涨停越多边际效应递减
-                                    # 公式：log2(涨停次数+1) * (100/log2(lookback_days+1))
-                                    import math
-                                    max_score_factor = 100 / math.log2(lookback_days + 1) if lookback_days > 0 else 20
-
-                                    def calculate_score(zt_count):
-                                        if zt_count == 0:
-                                            return 0
-                                        score = math.log2(zt_count + 1) * max_score_factor
-                                        return min(round(score, 2), 100)
-
-                                    logger.info(f"对数评分: 最大得分因子 {max_score_factor:.2f}")
-
-                                elif scoring_method == 'binary':
-                                    # 二元得分：有涨停就得100分
-                                    def calculate_score(zt_count):
-                                        return 100 if zt_count > 0 else 0
-
-                                    logger.info("二元评分: 有涨停得100分，无涨停得0分")
-                                else:
-                                    # 默认线性
-                                    score_per_zt = 100 / lookback_days if lookback_days > 0 else 20
-
-                                    def calculate_score(zt_count):
-                                        return min(zt_count * score_per_zt, 100)
-
-                                    logger.info(f"默认线性评分: 每涨停一次得 {score_per_zt:.2f} 分")
-
-                                # 12. 计算每个交易日的得分
-                                result_data = []
-                                total_days = len(target_trading_days)
-
-                                for i, current_date in enumerate(target_trading_days):
-                                    if i % 100 == 0 and i > 0:  # 每100个交易日打印一次进度
-                                        logger.info(f"处理进度: {i}/{total_days}")
-
-                                    lookback_start = lookback_start_dates[current_date]
-
-                                    for stock in all_stocks:
-                                        zt_score = 0
-
-                                        if stock in stock_zt_dict:
-                                            # 统计回溯期内涨停次数（使用字符串比较，精确到日）
-                                            recent_zts = [d for d in stock_zt_dict[stock]
-                                                          if lookback_start <= d <= current_date]
-
-                                            zt_score = calculate_score(len(recent_zts))
-                                            # 四舍五入保留2位小数
-                                            zt_score = round(zt_score, 2)
-
-                                        result_data.append({
-                                            'ymd': current_date,
-                                            'stock_code': stock,
-                                            'zt_score': zt_score
-                                        })
-
-                                result_df = pd.DataFrame(result_data)
-
-                                # 13. 统计得分分布
-                                score_distribution = result_df['zt_score'].value_counts().sort_index()
-                                logger.info(f"得分分布(前10): {dict(list(score_distribution.head(10).items()))}")
+                if stock_base_df.empty:
+                    logger.warning("未获取到股票基础信息")
+                    return pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
+
+                all_stocks = stock_base_df['stock_code'].astype(str).unique()
+                logger.info(f"全量股票数量: {len(all_stocks)}，有涨停记录的股票数量: {zt_df['stock_code'].nunique()}")
+
+                # 6. 交易日 x 股票 矩阵上滚动计数并打分
+                result_df = self.score_zt_lookback(zt_df, full_trading_days, target_trading_days, all_stocks,
+                                                   lookback_days=lookback_days, scoring_method=scoring_method)
+
+                # 7. 统计得分分布
+                score_distribution = result_df['zt_score'].value_counts().sort_index()
+                logger.info(f"得分分布(前10): {dict(list(score_distribution.head(10).items()))}")
 
             logger.info(
                 f"涨停因子计算完成：共{len(result_df)}条记录，使用{lookback_days}个交易日回溯，评分方法:{scoring_method}")
@@ -309,6 +398,52 @@ class FactorLibrary:
             logger.error(traceback.format_exc())
             return pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
 
+    @staticmethod
+    def score_zt_lookback(zt_df, trading_days, target_trading_days, all_stocks, lookback_days=5,
+                          scoring_method='linear'):
+        """
+        涨停因子的向量化计算：
+          1. 把涨停记录落到 [交易日 x 股票] 的计数矩阵上
+          2. 沿交易日做累计和，回溯窗口（含当日共 lookback_days 个交易日）内的涨停次数 = 两行累计和之差
+          3. 按评分方法对整块计数矩阵做数组运算，再展开成 ymd, stock_code, zt_score 长表
+        Args:
+            zt_df:               涨停记录，包含 ymd, stock_code
+            trading_days:        含回溯期的完整交易日列表，'YYYYMMDD'
+            target_trading_days: 需要输出的交易日列表，trading_days 的连续子集
+            all_stocks:          输出的股票代码
+            lookback_days:       回溯交易日数量
+            scoring_method:      linear / log / binary，其他值按 linear 处理
+        Returns:
+            DataFrame: ymd('YYYYMMDD'), stock_code, zt_score，按交易日、股票顺序排列
+        """
+        days_idx = pd.to_datetime(pd.Index(trading_days), format='%Y%m%d')
+        stocks_idx = pd.Index(all_stocks).astype(str)
+
+        day_pos = days_idx.get_indexer(pd.to_datetime(zt_df['ymd']))
+        stock_pos = stocks_idx.get_indexer(zt_df['stock_code'].astype(str))
+        valid = (day_pos >= 0) & (stock_pos >= 0)
+
+        zt_counts = np.zeros((len(days_idx), len(stocks_idx)), dtype=np.int32)
+        np.add.at(zt_counts, (day_pos[valid], stock_pos[valid]), 1)
+
+        # cum[t] = 前 t 个交易日的涨停次数，窗口 [t - lookback_days + 1, t] 的次数 = cum[t + 1] - cum[max(0, t - lookback_days + 1)]
+        cum = np.zeros((len(days_idx) + 1, len(stocks_idx)), dtype=np.int32)
+        np.cumsum(zt_counts, axis=0, out=cum[1:])
+        target_pos = days_idx.get_indexer(pd.to_datetime(pd.Index(target_trading_days), format='%Y%m%d'))
+        window_start = np.maximum(target_pos - lookback_days + 1, 0)
+        counts = (cum[target_pos + 1] - cum[window_start]).astype(np.float64)
+
+        if scoring_method == 'log':
+            scores = log2_score(counts, lookback_days)
+        elif scoring_method == 'binary':
+            scores = binary_score(counts)
+        else:
+            scores = capped_linear_score(counts, 100 / lookback_days if lookback_days > 0 else 20)
+
+        return pd.DataFrame({'ymd': np.repeat(np.asarray(target_trading_days), len(stocks_idx)),
+                             'stock_code': np.tile(stocks_idx.to_numpy(), len(target_trading_days)),
+                             'zt_score': scores.ravel()})
+
     def shareholder_factor_score(self, start_date, end_date, save_to_cache=True):
         """
         计算筹码因子百分制评分（0-100分）
@@ -326,8 +461,6 @@ class FactorLibrary:
             DataFrame: 包含 ymd, stock_code, stock_name, shareholder_score
         """
         try:
-            import math
-
             # 获取股东数据
             shareholder_df = Mysql_Utils.data_from_mysql_to_dataframe(
                 user=self.user,
@@ -343,21 +476,7 @@ class FactorLibrary:
             if shareholder_df.empty:
                 result_df = pd.DataFrame(columns=['ymd', 'stock_code', 'stock_name', 'shareholder_score'])
             else:
-                # 转换数值
-                shareholder_df['pct_of_total_sh'] = pd.to_numeric(shareholder_df['pct_of_total_sh'], errors='coerce')
-
-                # 定义平滑得分函数
-                def smooth_score(pct):
-                    if pd.isna(pct):
-                        return 0.0
-                    # sigmoid 变换: 股东减少(-) → 高分，股东增加(+) → 低分
-                    x = pct * 0.15  # 0.15 控制曲线陡峭程度
-                    sigmoid = 1 / (1 + math.exp(-x))
-                    return round(100 * (1 - sigmoid), 2)
-
-                # 计算得分
-                shareholder_df['shareholder_score'] = shareholder_df['pct_of_total_sh'].apply(smooth_score)
-                result_df = shareholder_df[['ymd', 'stock_code', 'stock_name', 'shareholder_score']]
+                result_df = self.score_shareholder_change(shareholder_df)
 
             logger.info(f"股东人数因子计算完成：共{len(result_df)}条记录")
 
@@ -371,6 +490,20 @@ class FactorLibrary:
             logger.error(f"计算股东数因子失败：{str(e)}")
             return pd.DataFrame(columns=['ymd', 'stock_code', 'stock_name', 'shareholder_score'])
 
+    @staticmethod
+    def score_shareholder_change(shareholder_df):
+        """
+        股东人数变化打分：sigmoid 变换，股东减少(-) → 高分，股东增加(+) → 低分，0.15 控制曲线陡峭程度；缺失给 0 分
+        Args:
+            shareholder_df: 包含 ymd, stock_code, stock_name, pct_of_total_sh 的 DataFrame
+        Returns:
+            DataFrame: ymd, stock_code, stock_name, shareholder_score
+        """
+        pct = pd.to_numeric(shareholder_df['pct_of_total_sh'], errors='coerce').to_numpy(dtype=np.float64)
+
+        result_df = shareholder_df[['ymd', 'stock_code', 'stock_name']].copy()
+        result_df['shareholder_score'] = sigmoid_score(pct, steepness=0.15, reverse=True)
+        return result_df
 
     def _get_zero_scores(self, trading_days, start_date, end_date, score_col):
         """生成全0分数据"""
@@ -390,52 +523,106 @@ class FactorLibrary:
             if stock_base_df.empty:
                 return pd.DataFrame(columns=['ymd', 'stock_code', score_col])
 
-            all_stocks = stock_base_df['stock_code'].unique()
+            all_stocks = stock_base_df['stock_code'].astype(str).unique()
 
-            result_data = []
-            for date_str in trading_days:
-                for stock in all_stocks:
-                    result_data.append({
-                        'ymd': date_str,
-                        'stock_code': stock,
-                        score_col: 0.0
-                    })
-
-            return pd.DataFrame(result_data)
+            return pd.DataFrame({'ymd': np.repeat(np.asarray(trading_days), len(all_stocks)),
+                                 'stock_code': np.tile(all_stocks, len(trading_days)),
+                                 score_col: 0.0})
 
         except Exception as e:
             logger.error(f"生成零分数据失败：{str(e)}")
             return pd.DataFrame(columns=['ymd', 'stock_code', score_col])
 
     def get_trading_days(self, start_date, end_date):
-        """获取交易日列表"""
+        """获取交易日列表（查询结果按 ods_trading_days_insight 的水位缓存）"""
         try:
-            trading_days_df = Mysql_Utils.data_from_mysql_to_dataframe(
+            trading_days_df = Mysql_Utils.read_sql_cached(
                 user=self.user,
                 password=self.password,
                 host=self.host,
                 database=self.database,
-                table_name='ods_trading_days_insight',
-                start_date=start_date,
-                end_date=end_date,
-                cols=['ymd']
+                sql="SELECT ymd FROM ods_trading_days_insight WHERE ymd >= :start_date AND ymd <= :end_date",
+                params={'start_date': start_date, 'end_date': end_date},
+                table_name='ods_trading_days_insight'
             )
 
             if trading_days_df.empty:
                 return []
 
             # 直接返回排序后的日期列表
-            trading_days = sorted(trading_days_df['ymd'].unique())
-            return [d.strftime('%Y%m%d') for d in trading_days]
+            trading_days = pd.to_datetime(trading_days_df['ymd']).drop_duplicates().sort_values()
+            return trading_days.dt.strftime('%Y%m%d').tolist()
 
         except Exception as e:
             logger.error(f"获取交易日失败：{str(e)}")
             return []
 
-    def volume_shrinkage_factor(self, start_date, end_date,  save_to_cache=True):
+    def shift_trading_day(self, date, offset):
+        """
+        按交易日平移日期：offset < 0 往前数 |offset| 个交易日，offset > 0 往后数
+        Returns:
+            str: 'YYYYMMDD'，超出交易日表范围时返回能取到的最早 / 最晚交易日
+        """
+        date_dt = pd.to_datetime(str(date))
+        span = pd.Timedelta(days=abs(offset) * 2 + 10)
+        if offset < 0:
+            trading_days = [d for d in self.get_trading_days((date_dt - span).strftime('%Y%m%d'), date_dt.strftime('%Y%m%d'))
+                            if d < date_dt.strftime('%Y%m%d')]
+            return trading_days[offset] if len(trading_days) >= -offset else (trading_days[0] if trading_days else date_dt.strftime('%Y%m%d'))
+        trading_days = [d for d in self.get_trading_days(date_dt.strftime('%Y%m%d'), (date_dt + span).strftime('%Y%m%d'))
+                        if d > date_dt.strftime('%Y%m%d')]
+        if offset == 0 or not trading_days:
+            return date_dt.strftime('%Y%m%d')
+        return trading_days[min(offset, len(trading_days)) - 1]
+
+    def get_price_panel(self):
+        """打开本地行情面板（Price_Panel.build_price_panel 生成），不存在时返回 None"""
+        if self._price_panel is None:
+            try:
+                self._price_panel = PricePanel.open(self.host, self.database)
+            except FileNotFoundError:
+                logger.info("本地行情面板不存在，K线数据改从 MySQL 读取")
+                self._price_panel = False
+        return self._price_panel or None
+
+    def get_stock_kline_data(self, stock_code, start_date, end_date):
+        """
+        获取单只股票的日K线（ymd, stock_code, open, close, high, low, volume, trading_amount）
+        面板覆盖该区间时直接从 memmap 切片，否则按 stock_code 在服务端过滤读取 ods_stock_kline_daily_ts
+        """
+        return self.get_kline_data([stock_code], start_date, end_date)
+
+    def get_kline_data(self, stock_codes, start_date, end_date):
+        """
+        一次取多只股票的日K线长表，逐只回测前先整体取一次，避免每只股票各读一遍
+        Args:
+            stock_codes: 股票代码列表
+        Returns:
+            DataFrame: 列同 get_stock_kline_data
+        """
+        panel = self.get_price_panel()
+        if panel is not None and panel.covers(start_date, end_date):
+            parts = [panel.to_long(code, start_date, end_date) for code in stock_codes]
+            parts = [part for part in parts if not part.empty]
+            return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+        return Mysql_Utils.data_from_mysql_to_dataframe(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database,
+            table_name='ods_stock_kline_daily_ts',
+            start_date=start_date,
+            end_date=end_date,
+            cols=['ymd', 'stock_code', 'open', 'close', 'high', 'low', 'volume', 'trading_amount'],
+            stock_codes=list(stock_codes)
+        )
+
+    def volume_shrinkage_factor(self, start_date, end_date,  save_to_cache=True, lookback_days=0):
         """
         计算缩量下跌因子（0-100分）
         使用预计算的均线表，固定使用60日均量作为长期基准
+        lookback_days > 0 时从 start_date 往前多取 lookback_days 个交易日参与连续天数计算，输出仍只含 start_date 之后的数据
 
         评分逻辑：
         1. 成交量条件（60分）：
@@ -446,6 +633,8 @@ class FactorLibrary:
            - 连续3天阴线得满分40分
         """
         try:
+            query_start_date = self.shift_trading_day(start_date, -lookback_days) if lookback_days else start_date
+
             # 1. 从技术指标表获取数据
             tech_df = Mysql_Utils.data_from_mysql_to_dataframe(
                 user=self.user,
@@ -453,32 +642,22 @@ class FactorLibrary:
                 host=self.host,
                 database=self.database,
                 table_name='dwd_stock_technical_indicators',
-                start_date=start_date,
+                start_date=query_start_date,
                 end_date=end_date,
                 cols=['ymd', 'stock_code', 'stock_name', 'close', 'volume',
                       'vol_ma5', 'vol_ma60', 'volume_vs_ma5']
             )
 
-            # 定义固定的列顺序（与表结构完全一致）
-            fixed_columns = [
-                'ymd', 'stock_code', 'stock_name',
-                'close', 'volume',
-                'vol_ma5', 'vol_ma60', 'volume_vs_ma5',
-                'is_shrink_today', 'consecutive_shrink_days',
-                'is_down', 'consecutive_down_days',
-                'volume_score', 'price_score', 'composite_score', 'signal_level'
-            ]
-
             if tech_df.empty:
                 logger.warning(f"技术指标数据为空: {start_date}~{end_date}")
-                return pd.DataFrame(columns=fixed_columns)
+                return pd.DataFrame(columns=VOLUME_FACTOR_COLUMNS)
 
             # 2. 获取阴线数据   关于引线 todo  最好是连阴但累计跌幅却有限的
-            down_df = self.get_down_days(start_date, end_date)
+            down_df = self.get_down_days(query_start_date, end_date)
 
             if down_df.empty:
                 logger.warning(f"阴线数据为空: {start_date}~{end_date}")
-                return pd.DataFrame(columns=fixed_columns)
+                return pd.DataFrame(columns=VOLUME_FACTOR_COLUMNS)
 
             # 3. 合并数据
             merged_df = pd.merge(
@@ -488,102 +667,12 @@ class FactorLibrary:
                 how='inner'
             )
 
-            # 4. 按股票分组计算连续指标
-            result_dfs = []
-
-            for stock, stock_df in merged_df.groupby('stock_code'):
-                stock_df = stock_df.copy()
-                stock_df = stock_df.sort_values('ymd')
-
-                # 计算连续缩量（volume_vs_ma5 < 0 表示当日成交量低于5日均量）
-                stock_df['is_shrink_today'] = stock_df['volume_vs_ma5'] < 0
-
-                # 计算连续缩量天数
-                def count_consecutive(series):
-                    """计算连续True的天数（从最新往旧统计）"""
-                    count = 0
-                    for val in series[::-1]:
-                        if val:
-                            count += 1
-                        else:
-                            break
-                    return count
-
-                # 连续缩量天数（最近5天内）
-                stock_df['consecutive_shrink_days'] = 0
-                for i in range(len(stock_df)):
-                    start_idx = max(0, i - 4)  # 最近5天
-                    window = stock_df['is_shrink_today'].iloc[start_idx:i + 1]
-                    stock_df.iloc[i, stock_df.columns.get_loc('consecutive_shrink_days')] = \
-                        count_consecutive(window.values)
-
-                # 连续阴线天数（最近5天内）
-                stock_df['consecutive_down_days'] = 0
-                for i in range(len(stock_df)):
-                    start_idx = max(0, i - 4)  # 最近5天
-                    window = stock_df['is_down'].iloc[start_idx:i + 1]
-                    stock_df.iloc[i, stock_df.columns.get_loc('consecutive_down_days')] = \
-                        count_consecutive(window.values)
-
-                result_dfs.append(stock_df)
-
-            final_df = pd.concat(result_dfs, ignore_index=True)
-
-            # 5. 计算成交量得分（0-60分）
-            def calculate_volume_score(row):
-                score = 0
-
-                # 条件1：5日均量 < 60日均量（30分）
-                if not pd.isna(row['vol_ma5']) and not pd.isna(row['vol_ma60']):
-                    if row['vol_ma5'] < row['vol_ma60'] * 0.8:  # 低于80%
-                        score += 30
-                    elif row['vol_ma5'] < row['vol_ma60']:  # 低于100%
-                        score += 20
-                    elif row['vol_ma5'] < row['vol_ma60'] * 1.2:  # 低于120%
-                        score += 10
-
-                # 条件2：连续缩量天数（30分）
-                if row['consecutive_shrink_days'] >= 3:
-                    score += 30
-                elif row['consecutive_shrink_days'] == 2:
-                    score += 20
-                elif row['consecutive_shrink_days'] == 1:
-                    score += 10
-
-                return min(score, 60)
-
-            # 6. 计算价格得分（0-40分）
-            def calculate_price_score(row):
-                if row['consecutive_down_days'] >= 3:
-                    return 40
-                elif row['consecutive_down_days'] == 2:
-                    return 30
-                elif row['consecutive_down_days'] == 1:
-                    return 20
-                else:
-                    return 0
-
-            final_df['volume_score'] = final_df.apply(calculate_volume_score, axis=1)
-            final_df['price_score'] = final_df.apply(calculate_price_score, axis=1)
-            final_df['composite_score'] = (final_df['volume_score'] + final_df['price_score']).round(2)
-
-            # 7. 添加评分等级
-            def get_score_level(score):
-                if score >= 80:
-                    return 'A'  # 强烈信号
-                elif score >= 60:
-                    return 'B'  # 明显信号
-                elif score >= 40:
-                    return 'C'  # 一般信号
-                elif score >= 20:
-                    return 'D'  # 弱信号
-                else:
-                    return 'E'  # 无信号
-
-            final_df['signal_level'] = final_df['composite_score'].apply(get_score_level)
+            # 4. 连续缩量 / 连续阴线天数与各项得分
+            final_df = self.score_volume_shrinkage(merged_df)
+            final_df = final_df[pd.to_datetime(final_df['ymd']) >= pd.to_datetime(str(start_date))]
 
             # 6. 按固定列顺序选择数据
-            result_df = final_df[fixed_columns].copy()
+            result_df = final_df[VOLUME_FACTOR_COLUMNS].copy()
             logger.info(f"缩量下跌因子计算完成：共{len(result_df)}条记录")
 
             # 7. 保存到缓存
@@ -611,9 +700,46 @@ class FactorLibrary:
             logger.error(f"计算缩量下跌因子失败：{str(e)}")
             import traceback
             logger.error(traceback.format_exc())
-            return pd.DataFrame(columns=fixed_columns)
+            return pd.DataFrame(columns=VOLUME_FACTOR_COLUMNS)
 
 
+    @staticmethod
+    def score_volume_shrinkage(merged_df):
+        """
+        缩量下跌因子的向量化打分：连续缩量 / 连续阴线天数（最近5天内）用 consecutive_true_count，各档得分用 banded_score
+        Args:
+            merged_df: 技术指标与阴线标记合并后的数据，包含 ymd, stock_code, vol_ma5, vol_ma60, volume_vs_ma5, is_down
+        Returns:
+            DataFrame: 按 stock_code, ymd 排序，新增 is_shrink_today, consecutive_shrink_days, consecutive_down_days,
+                       volume_score, price_score, composite_score, signal_level
+        """
+        # 按股票、日期排序后整表计算连续指标（最近5天内）
+        final_df = merged_df.sort_values(['stock_code', 'ymd'], kind='stable').reset_index(drop=True)
+        stock_keys = final_df['stock_code'].astype(str).to_numpy()
+
+        # 计算连续缩量（volume_vs_ma5 < 0 表示当日成交量低于5日均量）
+        final_df['is_shrink_today'] = final_df['volume_vs_ma5'] < 0
+        final_df['consecutive_shrink_days'] = consecutive_true_count(final_df['is_shrink_today'], stock_keys, cap=5)
+        final_df['consecutive_down_days'] = consecutive_true_count(final_df['is_down'], stock_keys, cap=5)
+
+        # 计算成交量得分（0-60分）：5日均量相对60日均量 30/20/10 分 + 连续缩量 30/20/10 分
+        vol_ma5 = final_df['vol_ma5'].to_numpy(dtype=np.float64, na_value=np.nan)
+        vol_ma60 = final_df['vol_ma60'].to_numpy(dtype=np.float64, na_value=np.nan)
+        shrink_days = final_df['consecutive_shrink_days'].to_numpy()
+        ma_score = banded_score(vol_ma5, [vol_ma60 * 0.8, vol_ma60, vol_ma60 * 1.2], [30, 20, 10], below=True)
+        shrink_score = banded_score(shrink_days, [3, 2, 1], [30, 20, 10])
+        final_df['volume_score'] = np.minimum(ma_score + shrink_score, 60)
+
+        # 计算价格得分（0-40分）：连续阴线 3/2/1 天得 40/30/20 分
+        down_days = final_df['consecutive_down_days'].to_numpy()
+        final_df['price_score'] = banded_score(down_days, [3, 2, 1], [40, 30, 20])
+        final_df['composite_score'] = (final_df['volume_score'] + final_df['price_score']).round(2)
+
+        # 添加评分等级：A 强烈 / B 明显 / C 一般 / D 弱 / E 无信号
+        composite = final_df['composite_score'].to_numpy()
+        final_df['signal_level'] = level_bucket(composite, [80, 60, 40, 20], ['A', 'B', 'C', 'D'], default='E')
+        return final_df
+
     def explain_volume_shrinkage(self, stock_code, date):
         """
         详细解释某只股票某天的缩量下跌因子
@@ -639,7 +765,7 @@ class FactorLibrary:
                 print(f"没有找到 {start_dt} ~ {date} 之间的数据")
                 return
 
-            df = df[df['stock_code'] == stock_code].sort_values('ymd')
+            df = df[df['stock_code'] == stock_code].sort_values('ymd').reset_index(drop=True)
             df['ymd'] = pd.to_datetime(df['ymd'])
 
             # 计算指标
@@ -648,15 +774,9 @@ class FactorLibrary:
             df['volume_ma5'] = df['volume'].rolling(5).mean()
             df['volume_decrease'] = df['volume'].diff() < 0
 
-            # 计算连续天数
-            def count_consecutive(series):
-                count = 0
-                for val in series[::-1]:
-                    if val:
-                        count += 1
-                    else:
-                        break
-                return count
+            # 计算连续天数（最近5天内），与 volume_shrinkage_factor 共用同一个计数函数
+            df['consecutive_down'] = consecutive_true_count(df['is_down'], cap=5)
+            df['consecutive_volume'] = consecutive_true_count(df['volume_decrease'], cap=5)
 
             # 获取目标日期的数据
             target_idx = df[df['ymd'] == target_date].index
@@ -665,13 +785,8 @@ class FactorLibrary:
                 return
 
             target_idx = target_idx[0]
-            start_idx = max(0, target_idx - 4)
-
-            recent_down = df.loc[start_idx:target_idx, 'is_down']
-            recent_volume = df.loc[start_idx:target_idx, 'volume_decrease']
-
-            consecutive_down = count_consecutive(recent_down.values)
-            consecutive_volume = count_consecutive(recent_volume.values)
+            consecutive_down = df.loc[target_idx, 'consecutive_down']
+            consecutive_volume = df.loc[target_idx, 'consecutive_volume']
 
             target = df.loc[target_idx]
 
@@ -811,122 +926,401 @@ class FactorLibrary:
             logger.error(f"获取阴线数据失败：{str(e)}")
             return pd.DataFrame(columns=['ymd', 'stock_code', 'is_down'])
 
-    def aggregate_factors(self, start_date, end_date, factors=None):
+    def aggregate_factors(self, start_date, end_date, factors=None, mode='ignore'):
         """
         因子汇总 - 直接写入MySQL，严格按照表结构
+        以 (ymd, stock_code) 的 MultiIndex 笛卡尔积为底表，每个因子做一次左连接，缺失得分记0；
+        按自然月分批组装并写入 dwd_factor_summary，峰值内存只和单月数据量有关
+        Args:
+            mode: 写入模式，增量重算已写过的交易日时用 'upsert' 覆盖旧行
+        Returns:
+            int: 写入的总行数
         """
-        import pandas as pd
-
         # 如果没有指定因子，用缓存中有的
         if factors is None:
             factors = list(self.cached_factors.keys())
 
         if not factors:
             logger.warning("没有指定因子，且缓存为空")
-            return
+            return 0
 
         # 获取交易日列表
         trading_days = self.get_trading_days(start_date, end_date)
         if not trading_days:
             logger.warning(f"没有交易日数据: {start_date}~{end_date}")
-            return
+            return 0
 
-        # 构建基础DataFrame：所有股票 * 所有交易日
-        base_data = []
-        for date in trading_days:
-            # 统一日期格式为 YYYY-MM-DD
-            if isinstance(date, str) and len(date) == 8 and date.isdigit():
-                date_str = f"{date[:4]}-{date[4:6]}-{date[6:8]}"
-            else:
-                date_str = str(date)
-
-            for _, row in self.stocks_df.iterrows():
-                base_data.append({
-                    'ymd': date_str,
-                    'stock_code': row['stock_code'],
-                    'stock_name': row['stock_name']
-                })
-
-        summary_df = pd.DataFrame(base_data)
-
-        # 初始化所有得分为0
-        summary_df['pb_score'] = 0
-        summary_df['zt_score'] = 0
-        summary_df['shareholder_score'] = 0
-        summary_df['volume_score'] = 0
-        summary_df['price_score'] = 0
-        summary_df['composite_score'] = 0
-        summary_df['signal_level'] = ''
-
-        # 定义因子列映射
-        factor_cols = {
-            'pb': ['pb_score'],
-            'zt': ['zt_score'],
-            'shareholder': ['shareholder_score'],
-            'volume': ['volume_score', 'price_score', 'composite_score', 'signal_level']
-        }
-
-        # 逐个因子合并更新
+        # 各因子统一为按 ymd 排序、以 (ymd, stock_code) 为索引的得分表
+        factor_frames = {}
         for factor_name in factors:
             if factor_name not in self.cached_factors:
                 logger.warning(f"因子 {factor_name} 不在缓存中，跳过")
                 continue
+            factor_frames[factor_name] = self._prepare_summary_factor(self.cached_factors[factor_name],
+                                                                       SUMMARY_FACTOR_COLUMNS[factor_name])
 
-            df = self.cached_factors[factor_name].copy()
-
-            # 统一因子数据的日期格式为 YYYY-MM-DD
-            if 'ymd' in df.columns:
-                if pd.api.types.is_datetime64_any_dtype(df['ymd']):
-                    df['ymd'] = df['ymd'].dt.strftime('%Y-%m-%d')
-                elif df['ymd'].dtype == 'object' and df['ymd'].astype(str).str.match(r'^\d{8}$').any():
-                    df['ymd'] = pd.to_datetime(df['ymd'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
-                else:
-                    df['ymd'] = df['ymd'].astype(str)
-
-            cols_to_merge = factor_cols.get(factor_name, [])
-
-            # 左连接合并
-            merged = pd.merge(
-                summary_df[['ymd', 'stock_code']],
-                df[['ymd', 'stock_code'] + cols_to_merge],
-                on=['ymd', 'stock_code'],
-                how='left'
-            )
+        stock_codes = pd.Index(self.stocks_df['stock_code'].astype(str), name='stock_code')
+        stock_names = self.stocks_df['stock_name'].to_numpy()
+        trading_days = pd.DatetimeIndex(pd.to_datetime(trading_days), name='ymd')
 
-            # 更新对应的列 - 修复版本
-            for col in cols_to_merge:
-                if col in merged.columns:
-                    # 创建合并数据的副本用于更新
-                    update_data = merged[['ymd', 'stock_code', col]].copy()
-                    update_data = update_data[update_data[col].notna()]
+        total_rows = 0
+        for month, month_days in trading_days.groupby(trading_days.to_period('M')).items():
+            month_days = pd.DatetimeIndex(month_days, name='ymd')
+            summary_df = self.build_factor_summary(month_days, stock_codes, stock_names, factor_frames)
 
-                    if not update_data.empty:
-                        # 直接使用布尔索引更新，避免索引问题
-                        for _, row in update_data.iterrows():
-                            mask = (summary_df['ymd'] == row['ymd']) & (summary_df['stock_code'] == row['stock_code'])
-                            summary_df.loc[mask, col] = row[col]
+            # 写入MySQL
+            try:
+                Mysql_Utils.data_from_dataframe_to_mysql(
+                    user=self.user,
+                    password=self.password,
+                    host=self.host,
+                    database=self.database,
+                    df=summary_df,
+                    table_name="dwd_factor_summary",
+                    merge_on=['ymd', 'stock_code'],
+                    mode=mode
+                )
+                total_rows += len(summary_df)
+                logger.info(f"因子汇总 {month} 已保存到 dwd_factor_summary，共{len(summary_df)}条")
+            except Exception as e:
+                logger.error(f"保存因子汇总 {month} 失败：{str(e)}")
+
+        logger.info(f"因子汇总完成，共{total_rows}条，包含因子: {list(factor_frames)}")
+        return total_rows
+
+    @staticmethod
+    def _prepare_summary_factor(factor_df, cols):
+        """因子结果 -> 按 ymd 排序、以 (ymd, stock_code) 为索引、只含汇总列的表；同一键重复时保留最后一条"""
+        df = factor_df[['ymd', 'stock_code'] + cols].copy()
+        df['ymd'] = pd.to_datetime(df['ymd'].astype(str))
+        df['stock_code'] = df['stock_code'].astype(str)
+        df = df.drop_duplicates(['ymd', 'stock_code'], keep='last').sort_values('ymd', kind='stable')
+        return df.set_index(['ymd', 'stock_code'])
+
+    @staticmethod
+    def build_factor_summary(trading_days, stock_codes, stock_names, factor_frames):
+        """
+        组装一段交易日的因子汇总表
+        Args:
+            trading_days:  DatetimeIndex，本批交易日
+            stock_codes:   全量股票代码
+            stock_names:   与 stock_codes 对齐的股票名称
+            factor_frames: {factor_name: _prepare_summary_factor 的结果}
+        Returns:
+            DataFrame: 列顺序与 dwd_factor_summary 一致，ymd 为 YYYY-MM-DD 字符串
+        """
+        grid = pd.MultiIndex.from_product([trading_days, stock_codes], names=['ymd', 'stock_code'])
+        summary_df = pd.DataFrame({'stock_name': np.tile(stock_names, len(trading_days))}, index=grid)
+
+        for factor_name, factor_df in factor_frames.items():
+            # 因子表已按 ymd 排序，先按日期区间切片再连接
+            ymd_values = factor_df.index.get_level_values('ymd')
+            lo = ymd_values.searchsorted(trading_days[0])
+            hi = ymd_values.searchsorted(trading_days[-1], side='right')
+            summary_df = summary_df.join(factor_df.iloc[lo:hi], how='left')
+
+        for col in SUMMARY_SCORE_COLUMNS:
+            if col not in summary_df.columns:
+                summary_df[col] = 0
+            summary_df[col] = summary_df[col].fillna(0)
+        if 'signal_level' not in summary_df.columns:
+            summary_df['signal_level'] = ''
+        summary_df['signal_level'] = summary_df['signal_level'].fillna('')
+
+        summary_df = summary_df.reset_index()
+        summary_df['ymd'] = summary_df['ymd'].dt.strftime('%Y-%m-%d')
+        return summary_df[['ymd', 'stock_code', 'stock_name'] + SUMMARY_SCORE_COLUMNS + ['signal_level']]
+
+    def compute_factors(self, start_date, end_date, factors=None, max_workers=4, save=True, mode='ignore'):
+        """
+        按因子注册表批量计算：planner 合并各因子的表读取（每张表只读一次），独立的因子并行计算，
+        结果放进共享的 FactorPanel，同时写入 cached_factors 供 aggregate_factors 使用
+        Args:
+            start_date:  开始日期
+            end_date:    结束日期
+            factors:     因子名列表，默认全部已注册因子（依赖的因子会自动加入）
+            max_workers: 并行读表 / 计算的线程数
+            save:        是否把声明了 save_table 的因子结果写库
+            mode:        写库模式，见 Mysql_Utils.data_from_dataframe_to_mysql
+        Returns:
+            FactorPanel: panel.results 为 {factor_name: DataFrame}，计算或写库失败的因子记在 panel.errors
+        """
+        specs = resolve_factors(factors)
+        max_lookback = max([spec.lookback_days for spec in specs], default=0)
+        query_start_date = (pd.to_datetime(str(start_date)) - pd.Timedelta(days=max_lookback * 2 + 10)).strftime('%Y%m%d')
+        trading_days = self.get_trading_days(query_start_date, end_date)
+
+        plan = plan_loads(specs, trading_days, start_date, end_date)
+        panel = load_panel(self.user, self.password, self.host, self.database, plan, start_date, end_date,
+                           trading_days, max_workers=max_workers)
+        run_factor_specs(specs, panel, max_workers=max_workers)
+
+        for spec in specs:
+            result_df = panel.results[spec.name]
+            self.cached_factors[spec.name] = result_df
+            if save and spec.save_table and not result_df.empty:
+                try:
+                    Mysql_Utils.data_from_dataframe_to_mysql(
+                        user=self.user,
+                        password=self.password,
+                        host=self.host,
+                        database=self.database,
+                        df=result_df,
+                        table_name=spec.save_table,
+                        merge_on=spec.merge_on,
+                        mode=mode
+                    )
+                except Exception as e:
+                    logger.error(f"保存因子 {spec.name} 到 {spec.save_table} 失败：{str(e)}")
+                    panel.errors[spec.name] = f"保存到 {spec.save_table} 失败：{str(e)}"
+        return panel
+
+    def get_factor(self, factor_name, start_date, end_date, **params):
+        """
+        带缓存地获取单个因子的结果：已缓存的交易日直接拼接，只计算缺失的交易日段
+        Args:
+            factor_name: pb / zt / shareholder / volume
+            start_date:  开始日期
+            end_date:    结束日期
+            params:      因子参数（pb: reverse；zt: lookback_days, scoring_method），未给出的取 FACTOR_DEFAULT_PARAMS
+        Returns:
+            DataFrame
+        """
+        params = {**FACTOR_DEFAULT_PARAMS[factor_name], **params}
+        compute_methods = {
+            'pb': lambda start, end: self.pb_factor_score(start, end, reverse=params['reverse'], save_to_cache=False),
+            'zt': lambda start, end: self.zt_factor_score(start, end, lookback_days=params['lookback_days'],
+                                                          scoring_method=params['scoring_method'], save_to_cache=False),
+            'shareholder': lambda start, end: self.shareholder_factor_score(start, end, save_to_cache=False),
+            'volume': lambda start, end: self.volume_shrinkage_factor(start, end, save_to_cache=False,
+                                                                      lookback_days=FACTOR_LOOKBACK_DAYS['volume']),
+        }
+        trading_days = self.get_trading_days(start_date, end_date)
+        result_df = self.factor_cache.get_range(factor_name, params, trading_days, compute_methods[factor_name])
+        self.cached_factors[factor_name] = result_df
+        return result_df
 
-        # 写入MySQL
-        try:
-            Mysql_Utils.data_from_dataframe_to_mysql(
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                database=self.database,
-                df=summary_df[['ymd', 'stock_code', 'stock_name', 'pb_score', 'zt_score',
-                               'shareholder_score', 'volume_score', 'price_score',
-                               'composite_score', 'signal_level']],
-                table_name="dwd_factor_summary",
-                merge_on=['ymd', 'stock_code']
-            )
-            logger.info(f"因子汇总已保存到 dwd_factor_summary，共{len(summary_df)}条")
-        except Exception as e:
-            logger.error(f"保存因子汇总失败：{str(e)}")
+    def get_factors(self, factors, start_date, end_date):
+        """
+        带缓存地批量获取多个因子（默认参数）：各因子缺失的交易日段相同的合并成一次 compute_factors，共用一次数据加载
+        Returns:
+            dict: {factor_name: DataFrame}
+        """
+        trading_days = self.get_trading_days(start_date, end_date)
+        keys = {name: factor_cache_key(name, FACTOR_DEFAULT_PARAMS[name]) for name in factors}
+
+        runs = {}
+        for name, key in keys.items():
+            for run in self.factor_cache.missing_runs(key, trading_days):
+                runs.setdefault(run, []).append(name)
+
+        # 刚算好的日数据直接交给 get_range 拼接，内存上限较小时即使已被淘汰也不会重算
+        computed = {name: {} for name in factors}
+        for (start_ymd, end_ymd), names in sorted(runs.items()):
+            run_days = [ymd for ymd in trading_days if start_ymd <= ymd <= end_ymd]
+            panel = self.compute_factors(start_ymd, end_ymd, factors=names, save=False)
+            for name in names:
+                computed[name].update(self.factor_cache.store(keys[name], panel.results[name], run_days))
+
+        results = {}
+        for name in factors:
+            results[name] = self.factor_cache.get_range(name, FACTOR_DEFAULT_PARAMS[name], trading_days,
+                                                        lambda start, end, name=name: self.get_factor(name, start, end),
+                                                        known_days=computed[name])
+            self.cached_factors[name] = results[name]
+        return results
+
+    def load_neutralization_exposures(self, start_date, end_date, dates, stock_codes, min_group_size=5):
+        """
+        读取 dwd_ashare_stock_base_info 中的流通市值与板块 / 市场，整理成与因子面板对齐的中性化暴露
+        板块与市场是最新快照，每只股票取区间内最后一条记录的分组，整段共用
+        Args:
+            dates:       DatetimeIndex 交易日
+            stock_codes: Index 股票代码
+        Returns:
+            tuple: (对数流通市值矩阵 [交易日 x 股票]，分组编号矩阵 [交易日 x 股票]，-1 为缺失)
+        """
+        base_df = Mysql_Utils.data_from_mysql_to_dataframe(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database,
+            table_name='dwd_ashare_stock_base_info',
+            start_date=start_date,
+            end_date=end_date,
+            cols=['ymd', 'stock_code', 'market_value', 'plate_names', 'market']
+        )
+        shape = (len(dates), len(stock_codes))
+        if base_df.empty:
+            logger.warning(f"dwd_ashare_stock_base_info 无数据：{start_date}~{end_date}，跳过中性化")
+            return np.full(shape, np.nan), np.full(shape, -1, dtype=np.int64)
+
+        market_value = pd.to_numeric(base_df['market_value'], errors='coerce')
+        base_df['log_market_value'] = np.log(market_value.where(market_value > 0))
+        log_market_value = factor_to_matrix(base_df, 'log_market_value', dates, stock_codes)
+
+        latest_df = base_df.sort_values('ymd').drop_duplicates('stock_code', keep='last')
+        labels = industry_group_labels(latest_df['plate_names'].to_numpy(), latest_df['market'].to_numpy(),
+                                       min_group_size=min_group_size)
+        group_codes, _ = pd.factorize(labels)
+        stock_groups = pd.Series(group_codes, index=latest_df['stock_code'].astype(str).to_numpy())
+        stock_groups = stock_groups.reindex(stock_codes).fillna(-1).to_numpy(np.int64)
+        return log_market_value, np.broadcast_to(stock_groups, shape)
+
+    @timing_decorator
+    def preprocess_factors(self, start_date, end_date, factors=('pb', 'zt', 'shareholder'), winsorize='mad',
+                           neutralize=True, factor_results=None):
+        """
+        因子合成前的批量预处理：按日去极值、标准化，并对流通市值和行业（板块 / 市场）做中性化
+        所有交易日、所有因子在 [交易日 x 股票] 面板上一次算完；处理后的 z 值再按日转成 0-100 的百分位得分，
+        写回各因子原来的得分列，FactorScoreTable / FactorDrivenStrategy 的阈值和权重可以直接沿用
+        Args:
+            start_date:     开始日期
+            end_date:       结束日期
+            factors:        需要处理的因子
+            winsorize:      'mad' / 'quantile' / None
+            neutralize:     是否做市值 / 行业中性化
+            factor_results: 已取好的因子结果 {factor_name: DataFrame}，默认经因子缓存获取
+        Returns:
+            dict: {factor_name: DataFrame(ymd, stock_code, 得分列, 得分列_z)}
+        """
+        factors = list(factors)
+        factor_results = factor_results or self.get_factors(factors, start_date, end_date)
+        trading_days = self.get_trading_days(start_date, end_date)
+        if not trading_days:
+            logger.warning(f"没有交易日数据: {start_date}~{end_date}")
+            return {}
 
-        logger.info(f"因子汇总完成，共{len(summary_df)}条，包含因子: {factors}")
+        dates = pd.to_datetime(pd.Index(trading_days), format='%Y%m%d')
+        stock_codes = pd.Index(sorted(set().union(*[set(factor_results[name]['stock_code'].astype(str))
+                                                    for name in factors if name in factor_results])))
 
+        log_market_value, groups = None, None
+        if neutralize:
+            log_market_value, groups = self.load_neutralization_exposures(start_date, end_date, dates, stock_codes)
 
-    def setup(self):
+        processed = {}
+        for name in factors:
+            score_col = FACTOR_SCORE_COLUMNS[name]
+            if name not in factor_results or score_col not in factor_results[name].columns:
+                logger.warning(f"因子 {name} 没有得分列 {score_col}，跳过预处理")
+                continue
+            values = factor_to_matrix(factor_results[name], score_col, dates, stock_codes)
+            z_values = preprocess_factor_matrix(values, log_market_value, groups, winsorize=winsorize,
+                                                neutralize=neutralize)
+            scores = pd.DataFrame(z_values).rank(axis=1, pct=True).to_numpy() * 100
+
+            present = np.isfinite(values)
+            day_idx, code_idx = np.nonzero(present)
+            processed[name] = pd.DataFrame({
+                'ymd': dates[day_idx].strftime('%Y%m%d'),
+                'stock_code': stock_codes[code_idx],
+                score_col: np.nan_to_num(scores[present]).round(2),
+                f'{score_col}_z': z_values[present],
+            })
+            logger.info(f"因子 {name} 预处理完成：{len(processed[name])} 条，去极值={winsorize}，中性化={neutralize}")
+        return processed
+
+    def get_factor_state(self):
+        """
+        读取各因子（以及汇总 summary）已经计算到的最新交易日
+        Returns:
+            dict: {factor_name: 'YYYYMMDD'}，状态表不存在或为空时返回 {}
+        """
+        state_df = Mysql_Utils.execute_query(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database,
+            sql="SELECT factor_name, last_ymd FROM dwd_factor_state"
+        )
+        if state_df.empty:
+            return {}
+        return dict(zip(state_df['factor_name'], pd.to_datetime(state_df['last_ymd']).dt.strftime('%Y%m%d')))
+
+    def save_factor_state(self, factor_name, last_ymd):
+        """记录因子已计算到的最新交易日"""
+        Mysql_Utils.execute_sql_statements(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database,
+            sql_statements=[f"INSERT INTO dwd_factor_state (factor_name, last_ymd) "
+                            f"VALUES ('{factor_name}', '{pd.to_datetime(str(last_ymd)).strftime('%Y-%m-%d')}') "
+                            f"ON DUPLICATE KEY UPDATE last_ymd = VALUES(last_ymd)"]
+        )
+
+    def run_incremental(self, end_date, factors=None, full_start_date='20240101'):
+        """
+        增量计算因子：只计算状态表记录之后的新交易日（回溯尾巴由各因子在注册表中声明），
+        新数据按唯一键 upsert 写入 dwd_factor_volume_shrinkage / dwd_factor_summary，日常运行的开销只和新增交易日数有关
+        状态表里没有记录的因子从 full_start_date 开始全量计算
+        因子状态只推进到本次结果完整的最后一天（见 factor_registry.factor_watermark），计算 / 写库失败或源数据未到时不推进；
+        summary 只推进到各因子状态的最小值，且要求该区间的汇总全部写入成功，缺数据的交易日下次运行会重算并覆盖；
+        任一因子失败时本次不写汇总
+        Args:
+            end_date:        计算截止日期
+            factors:         需要计算的因子，默认全部已注册因子
+            full_start_date: 首次运行时的起始日期
+        Returns:
+            dict: {factor_name: 本次计算的起始日期}，已是最新的因子不出现
+        """
+        factors = factors or [spec.name for spec in resolve_factors()]
+        state = self.get_factor_state()
+        end_date = pd.to_datetime(str(end_date)).strftime('%Y%m%d')
+
+        def next_start(name):
+            last_ymd = state.get(name)
+            return self.shift_trading_day(last_ymd, 1) if last_ymd else full_start_date
+
+        # 汇总表缺的交易日，每个因子都要覆盖到，否则汇总时该因子只能记0分
+        summary_start = next_start('summary')
+        # 起始日期相同的因子一起算，共用一次数据加载（日常运行时通常只有一组）
+        groups = {}
+        for name in factors:
+            start_date = min(next_start(name), summary_start)
+            if start_date > end_date:
+                logger.info(f"因子 {name} 已计算到 {state.get(name)}，无需增量计算")
+                continue
+            groups.setdefault(start_date, []).append(name)
+
+        computed = {}
+        for start_date, names in sorted(groups.items()):
+            logger.info(f"因子 {names} 增量计算：{start_date} ~ {end_date}")
+            panel = self.compute_factors(start_date, end_date, factors=names, mode='upsert')
+            for name in names:
+                last_ymd = factor_watermark(FACTOR_REGISTRY[name], panel)
+                if last_ymd is None:
+                    reason = panel.errors.get(name, '结果为空或源数据缺失')
+                    logger.error(f"因子 {name} 增量计算未完成（{reason}），状态保持在 {state.get(name)}")
+                    continue
+                computed[name] = start_date
+                if last_ymd > state.get(name, ''):
+                    self.save_factor_state(name, last_ymd)
+                    state[name] = last_ymd
+
+        # 有因子失败时不写汇总：汇总行会把失败因子的列记成0分并覆盖库里已有的正确值
+        failed = [name for name in factors if name not in computed]
+        if summary_start <= end_date and failed:
+            logger.error(f"因子 {failed} 增量计算未完成，跳过 {summary_start} ~ {end_date} 的汇总，"
+                         f"summary 状态保持在 {state.get('summary')}")
+        elif summary_start <= end_date and computed:
+            trading_days = self.get_trading_days(summary_start, end_date)
+            written = self.aggregate_factors(summary_start, end_date, factors=list(computed), mode='upsert')
+            factor_days = [state.get(name) for name in factors]
+            if written < len(trading_days) * len(self.stocks_df):
+                logger.error(f"因子汇总 {summary_start} ~ {end_date} 未全部写入，summary 状态保持在 {state.get('summary')}")
+            elif None not in factor_days and min(factor_days) > state.get('summary', ''):
+                self.save_factor_state('summary', min(factor_days))
+
+        return computed
+
+    def setup(self, incremental=True):
+
+        #  增量计算：只补算状态表之后的新交易日
+        if incremental:
+            self.run_incremental(end_date=pd.Timestamp.today().strftime('%Y%m%d'))
+            return
 
         #  pb 因子计算
         self.pb_factor_score(start_date='20240101', end_date='20260227')
@@ -945,6 +1339,57 @@ class FactorLibrary:
 
 
 
+######################  因子注册：声明读取的表 / 字段 / 回溯期，数据由 compute_factors 统一加载  #############################
+
+@register_factor('pb', reads=[TableRead('dwd_ashare_stock_base_info', ['pb'])])
+def compute_pb_factor(panel, start_date, end_date):
+    pb_df = panel.table('dwd_ashare_stock_base_info', ['ymd', 'stock_code', 'pb'], start_date, end_date)
+    if pb_df.empty:
+        return pd.DataFrame(columns=['ymd', 'stock_code', 'pb_score'])
+    pb_df = pb_df.assign(pb=pd.to_numeric(pb_df['pb'], errors='coerce'))
+    return FactorLibrary.score_pb_cross_section(pb_df)
+
+
+@register_factor('zt', reads=[TableRead('dwd_stock_zt_list', [], lookback_days=ZT_LOOKBACK_DAYS),
+                              TableRead('dwd_ashare_stock_base_info', [], latest_only=True)])
+def compute_zt_factor(panel, start_date, end_date):
+    target_trading_days = panel.target_trading_days
+    if not target_trading_days:
+        return pd.DataFrame(columns=['ymd', 'stock_code', 'zt_score'])
+    stock_base_df = panel.table('dwd_ashare_stock_base_info', ['stock_code'],
+                                target_trading_days[-1], target_trading_days[-1])
+    return FactorLibrary.score_zt_lookback(panel.table('dwd_stock_zt_list', ['ymd', 'stock_code']),
+                                           panel.trading_days, target_trading_days,
+                                           stock_base_df['stock_code'].astype(str).unique(),
+                                           lookback_days=ZT_LOOKBACK_DAYS)
+
+
+@register_factor('shareholder', reads=[TableRead('dwd_shareholder_num_latest', ['stock_name', 'pct_of_total_sh'])])
+def compute_shareholder_factor(panel, start_date, end_date):
+    shareholder_df = panel.table('dwd_shareholder_num_latest', start_date=start_date, end_date=end_date)
+    if shareholder_df.empty:
+        return pd.DataFrame(columns=['ymd', 'stock_code', 'stock_name', 'shareholder_score'])
+    return FactorLibrary.score_shareholder_change(shareholder_df)
+
+
+@register_factor('volume',
+                 reads=[TableRead('dwd_stock_technical_indicators',
+                                  ['stock_name', 'close', 'volume', 'vol_ma5', 'vol_ma60', 'volume_vs_ma5'],
+                                  lookback_days=FACTOR_LOOKBACK_DAYS['volume']),
+                        TableRead('ods_stock_kline_daily_ts', ['is_down'], lookback_days=FACTOR_LOOKBACK_DAYS['volume'])],
+                 save_table='dwd_factor_volume_shrinkage')
+def compute_volume_shrinkage_factor(panel, start_date, end_date):
+    tech_df = panel.table('dwd_stock_technical_indicators')
+    down_df = panel.table('ods_stock_kline_daily_ts', ['ymd', 'stock_code', 'is_down'])
+    if tech_df.empty or down_df.empty:
+        return pd.DataFrame(columns=VOLUME_FACTOR_COLUMNS)
+
+    merged_df = pd.merge(tech_df, down_df.assign(is_down=down_df['is_down'].astype(bool)),
+                         on=['ymd', 'stock_code'], how='inner')
+    final_df = FactorLibrary.score_volume_shrinkage(merged_df)
+    return final_df.loc[pd.to_datetime(final_df['ymd']) >= pd.to_datetime(str(start_date)), VOLUME_FACTOR_COLUMNS]
+
+
 if __name__ == '__main__':
     factorlib = FactorLibrary()
     factorlib.setup()
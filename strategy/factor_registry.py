@@ -0,0 +1,255 @@
+# strategy/factor_registry.py
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from CommonProperties import Mysql_Utils
+
+logger = logging.getLogger(__name__)
+
+
+class TableRead:
+    """
+    因子声明的一次表读取
+    Args:
+        table_name:    MySQL 表名
+        cols:          需要的字段（ymd / stock_code 会自动补上）
+        lookback_days: 在目标区间起点之前还需要多读的交易日数
+        latest_only:   只需要目标区间最后一个交易日的数据（例如取当日全量股票列表）
+    """
+
+    def __init__(self, table_name, cols, lookback_days=0, latest_only=False):
+        self.table_name = table_name
+        self.cols = list(cols)
+        self.lookback_days = lookback_days
+        self.latest_only = latest_only
+
+
+class FactorSpec:
+    """
+    因子声明：读哪些表、依赖哪些因子、怎么计算、结果写到哪张表
+    compute(panel, start_date, end_date) 只能从 panel 取数据，不直接访问数据库，返回含 ymd, stock_code 的 DataFrame
+    """
+
+    def __init__(self, name, compute, reads=(), depends_on=(), save_table=None, merge_on=('ymd', 'stock_code')):
+        self.name = name
+        self.compute = compute
+        self.reads = list(reads)
+        self.depends_on = list(depends_on)
+        self.save_table = save_table
+        self.merge_on = list(merge_on)
+
+    @property
+    def lookback_days(self):
+        return max([read.lookback_days for read in self.reads], default=0)
+
+
+# factor_name -> FactorSpec
+FACTOR_REGISTRY = {}
+
+
+def register_factor(name, reads=(), depends_on=(), save_table=None, merge_on=('ymd', 'stock_code')):
+    """
+    注册因子的装饰器，新增因子只需声明读取的表 / 字段，数据由 planner 统一加载，不会多出一次数据库往返
+    用法：
+        @register_factor('pb', reads=[TableRead('dwd_ashare_stock_base_info', ['pb'])])
+        def compute_pb(panel, start_date, end_date):
+            ...
+    """
+    def decorator(compute):
+        FACTOR_REGISTRY[name] = FactorSpec(name, compute, reads, depends_on, save_table, merge_on)
+        return compute
+    return decorator
+
+
+def resolve_factors(factors=None):
+    """
+    展开依赖并按依赖顺序排列因子
+    Returns:
+        list[FactorSpec]
+    """
+    names = list(factors) if factors else list(FACTOR_REGISTRY)
+    ordered, visiting = [], set()
+
+    def visit(name):
+        if name in visiting:
+            raise ValueError(f"因子依赖存在环：{name}")
+        if name not in FACTOR_REGISTRY:
+            raise KeyError(f"未注册的因子：{name}，可选：{list(FACTOR_REGISTRY)}")
+        if FACTOR_REGISTRY[name] in ordered:
+            return
+        visiting.add(name)
+        for dependency in FACTOR_REGISTRY[name].depends_on:
+            visit(dependency)
+        visiting.discard(name)
+        ordered.append(FACTOR_REGISTRY[name])
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def plan_loads(specs, trading_days, start_date, end_date):
+    """
+    合并各因子的表读取：同一张表只读一次，字段取并集，日期区间取各因子需求的并集
+    Args:
+        specs:        resolve_factors 的结果
+        trading_days: 覆盖回溯期的交易日列表（YYYYMMDD，升序）
+        start_date:   目标区间起点
+        end_date:     目标区间终点
+    Returns:
+        dict: {table_name: {'cols': [...], 'start_date': 'YYYYMMDD', 'end_date': 'YYYYMMDD'}}
+    """
+    start_ymd = pd.to_datetime(str(start_date)).strftime('%Y%m%d')
+    end_ymd = pd.to_datetime(str(end_date)).strftime('%Y%m%d')
+    start_idx = next((idx for idx, day in enumerate(trading_days) if day >= start_ymd), len(trading_days))
+    last_day = next((day for day in reversed(trading_days) if day <= end_ymd), end_ymd)
+
+    plan = {}
+    for spec in specs:
+        for read in spec.reads:
+            if read.latest_only:
+                read_start = last_day
+            else:
+                read_start = trading_days[max(0, start_idx - read.lookback_days)] if trading_days else start_ymd
+            load = plan.setdefault(read.table_name, {'cols': ['ymd', 'stock_code'], 'start_date': read_start,
+                                                     'end_date': end_ymd})
+            load['cols'] += [col for col in read.cols if col not in load['cols']]
+            load['start_date'] = min(load['start_date'], read_start)
+    return plan
+
+
+class FactorPanel:
+    """
+    一次因子计算共享的内存面板：planner 加载的原始表 + 已算好的因子结果
+    各因子从这里按需切片，互相之间只读共享
+    """
+
+    def __init__(self, start_date, end_date, trading_days, tables=None):
+        self.start_date = pd.to_datetime(str(start_date)).strftime('%Y%m%d')
+        self.end_date = pd.to_datetime(str(end_date)).strftime('%Y%m%d')
+        self.trading_days = list(trading_days)
+        self.tables = tables or {}
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def target_trading_days(self):
+        """目标区间内的交易日"""
+        return [day for day in self.trading_days if self.start_date <= day <= self.end_date]
+
+    def table(self, table_name, cols=None, start_date=None, end_date=None):
+        """
+        取已加载的表，可按字段 / 日期区间切片
+        Returns:
+            df: 切片结果，表未加载或为空时返回空 DataFrame
+        """
+        df = self.tables.get(table_name)
+        if df is None or df.empty:
+            return pd.DataFrame(columns=cols or [])
+
+        if start_date or end_date:
+            ymd = pd.to_datetime(df['ymd'])
+            mask = pd.Series(True, index=df.index)
+            if start_date:
+                mask &= ymd >= pd.to_datetime(str(start_date))
+            if end_date:
+                mask &= ymd <= pd.to_datetime(str(end_date))
+            df = df[mask]
+        return df[cols] if cols else df
+
+
+def load_panel(user, password, host, database, plan, start_date, end_date, trading_days, max_workers=4):
+    """按计划并行读取各表（每张表一次）并装入 FactorPanel"""
+    panel = FactorPanel(start_date, end_date, trading_days)
+    if not plan:
+        return panel
+
+    def load(table_name):
+        load_spec = plan[table_name]
+        return Mysql_Utils.data_from_mysql_to_dataframe(user=user,
+                                                        password=password,
+                                                        host=host,
+                                                        database=database,
+                                                        table_name=table_name,
+                                                        start_date=load_spec['start_date'],
+                                                        end_date=load_spec['end_date'],
+                                                        cols=load_spec['cols'])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for table_name, df in zip(plan, executor.map(load, plan)):
+            panel.tables[table_name] = df
+            logger.info(f"因子数据加载：{table_name} {plan[table_name]['start_date']}~{plan[table_name]['end_date']}，"
+                        f"{len(df)} 行")
+    return panel
+
+
+def run_factor_specs(specs, panel, max_workers=4):
+    """
+    按依赖关系并行计算因子：依赖都算完的因子立即提交，结果写入 panel.results
+    单个因子失败只记日志和 panel.errors，该因子结果为空表，依赖它的因子照常计算
+    """
+    pending = {spec.name: spec for spec in specs}
+    running = {}
+
+    def compute(spec):
+        return spec.compute(panel, panel.start_date, panel.end_date)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [spec for spec in pending.values()
+                     if all(dependency in panel.results for dependency in spec.depends_on)]
+            for spec in ready:
+                running[executor.submit(compute, spec)] = pending.pop(spec.name)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                spec = running.pop(future)
+                try:
+                    panel.results[spec.name] = future.result()
+                    logger.info(f"因子 {spec.name} 计算完成：共{len(panel.results[spec.name])}条记录")
+                except Exception as e:
+                    logger.error(f"计算因子 {spec.name} 失败：{str(e)}")
+                    panel.errors[spec.name] = str(e)
+                    panel.results[spec.name] = pd.DataFrame(columns=['ymd', 'stock_code'])
+    return panel.results
+
+
+def source_last_day(spec, panel):
+    """
+    因子声明读取的各张表在目标区间内都有数据的最后一个交易日
+    Returns:
+        str: YYYYMMDD，任一张表在目标区间内没有数据时返回 None
+    """
+    start_dt, end_dt = pd.to_datetime(panel.start_date), pd.to_datetime(panel.end_date)
+    last_days = []
+    for read in spec.reads:
+        df = panel.tables.get(read.table_name)
+        if df is None or df.empty:
+            return None
+        ymd = pd.to_datetime(df['ymd'])
+        ymd = ymd[(ymd >= start_dt) & (ymd <= end_dt)]
+        if ymd.empty:
+            return None
+        last_days.append(ymd.max())
+    return min(last_days).strftime('%Y%m%d') if last_days else panel.end_date
+
+
+def factor_watermark(spec, panel):
+    """
+    因子本次结果可以认定为完整的最后一个交易日，用于推进增量状态
+    取结果的最大 ymd、源表数据的最后一天、所依赖因子的水位三者的最小值；
+    计算或写库失败、结果为空、源表在区间内没有数据时返回 None（zt 这类按交易日补 0 分的因子结果总是满的，只能以源表为准）
+    Returns:
+        str: YYYYMMDD 或 None
+    """
+    result_df = panel.results.get(spec.name)
+    if spec.name in panel.errors or result_df is None or result_df.empty:
+        return None
+
+    last_days = [pd.to_datetime(result_df['ymd'].astype(str)).max().strftime('%Y%m%d'), source_last_day(spec, panel)]
+    last_days += [factor_watermark(FACTOR_REGISTRY[dependency], panel) for dependency in spec.depends_on]
+    if any(day is None for day in last_days):
+        return None
+    return min(last_days)
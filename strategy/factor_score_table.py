@@ -0,0 +1,162 @@
+# strategy/factor_score_table.py
+import logging
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 因子名 -> 因子结果中的得分列
+FACTOR_SCORE_COLUMNS = {
+    'pb': 'pb_score',
+    'zt': 'zt_score',
+    'shareholder': 'shareholder_score',
+    'volume': 'composite_score',
+}
+
+
+def _to_date(value):
+    """date / datetime / Timestamp / 'YYYYMMDD' / 'YYYY-MM-DD' -> datetime.date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.to_datetime(str(value)).date()
+
+
+def _clean_code(stock_code):
+    """'600000.SH' -> '600000'，与因子表中的代码格式一致"""
+    stock_code = str(stock_code)
+    return stock_code.split('.')[0] if '.' in stock_code else stock_code
+
+
+class FactorScoreTable:
+    """
+    回测窗口内预先算好的因子得分表：[因子 x 交易日 x 股票] 的 float64 稠密矩阵 + 日期 / 代码 -> 下标的字典
+    单点查询是两次字典查找 + 一次数组取值，回测 next() 中不再触发任何数据库读取；没有数据的位置得分为 0
+    covers() 按构建时请求的 [start_date, end_date] 判断，窗口内没有因子数据的交易日同样按 0 分查表，不会触发重新加载
+    用法：
+        table = FactorScoreTable.build(factor_lib, '20250101', '20250630')
+        table.lookup(date(2025, 3, 3), '600000', 'pb')
+        table.get_batch(dates, codes)
+    """
+
+    def __init__(self, factor_results, factors=None, start_date=None, end_date=None):
+        """
+        Args:
+            factor_results: {factor_name: DataFrame(ymd, stock_code, 得分列)}
+            factors:        需要装入的因子，默认 factor_results 中有得分列的全部因子
+            start_date:     请求的窗口起点，默认取数据中的第一个交易日
+            end_date:       请求的窗口终点，默认取数据中的最后一个交易日
+        """
+        factors = [name for name in (factors or factor_results)
+                   if name in factor_results and FACTOR_SCORE_COLUMNS.get(name) in factor_results[name].columns]
+
+        frames = []
+        for name in factors:
+            df = factor_results[name]
+            frames.append(pd.DataFrame({'ymd': pd.to_datetime(df['ymd'].astype(str)),
+                                        'stock_code': df['stock_code'].astype(str).map(_clean_code),
+                                        'factor': name,
+                                        'score': pd.to_numeric(df[FACTOR_SCORE_COLUMNS[name]], errors='coerce')}))
+        long_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['ymd', 'stock_code', 'factor', 'score'])
+
+        self.factors = pd.Index(factors)
+        self.dates = pd.DatetimeIndex(long_df['ymd'].unique()).sort_values()
+        self.stock_codes = pd.Index(long_df['stock_code'].unique()).sort_values()
+
+        self.values = np.zeros((len(self.factors), len(self.dates), len(self.stock_codes)), dtype=np.float64)
+        self.values[self.factors.get_indexer(long_df['factor']),
+                    self.dates.get_indexer(long_df['ymd']),
+                    self.stock_codes.get_indexer(long_df['stock_code'])] = long_df['score'].fillna(0.0).to_numpy(np.float64)
+        self._set_window(start_date, end_date)
+        self._build_positions()
+
+    def _set_window(self, start_date, end_date):
+        """记录得分表负责的日期窗口，未给出时退回数据中的首尾交易日"""
+        self.start_date = _to_date(start_date) if start_date else (self.dates[0].date() if len(self.dates) else None)
+        self.end_date = _to_date(end_date) if end_date else (self.dates[-1].date() if len(self.dates) else None)
+
+    def _build_positions(self):
+        self._factor_pos = {name: idx for idx, name in enumerate(self.factors)}
+        self._date_pos = {day: idx for idx, day in enumerate(self.dates.date)}
+        self._code_pos = {code: idx for idx, code in enumerate(self.stock_codes)}
+
+    @classmethod
+    def from_arrays(cls, values, factors, dates, stock_codes, start_date=None, end_date=None):
+        """
+        由现成的 [因子 x 交易日 x 股票] 矩阵直接构造（不拷贝），用于子进程挂载共享内存中的得分表
+        """
+        table = cls.__new__(cls)
+        table.values = values
+        table.factors = pd.Index(factors)
+        table.dates = pd.DatetimeIndex(dates)
+        table.stock_codes = pd.Index(stock_codes)
+        table._set_window(start_date, end_date)
+        table._build_positions()
+        return table
+
+    @classmethod
+    def build(cls, factor_lib, start_date, end_date, factors=('pb', 'zt', 'shareholder'), preprocess=False):
+        """
+        取 [start_date, end_date] 全市场的因子得分：经因子缓存，已算过的交易日不再重算，缺失段走因子注册表（每张表只读一次，不写库）
+        preprocess=True 时先经 FactorLibrary.preprocess_factors 去极值、标准化并做市值 / 行业中性化，装入中性化后的百分位得分
+        """
+        if preprocess:
+            factor_results = factor_lib.preprocess_factors(start_date, end_date, factors)
+        else:
+            factor_results = factor_lib.get_factors(list(factors), start_date, end_date)
+        table = cls(factor_results, factors, start_date=start_date, end_date=end_date)
+        logger.info(f"因子得分表加载完成：{start_date}~{end_date}，{len(table.factors)} 个因子 x "
+                    f"{len(table.dates)} 个交易日 x {len(table.stock_codes)} 只股票")
+        return table
+
+    def covers(self, start_date, end_date=None):
+        """判断 [start_date, end_date] 是否落在得分表的请求窗口内（与窗口内有没有因子数据无关）"""
+        if self.start_date is None or self.end_date is None:
+            return False
+        end_date = end_date or start_date
+        return self.start_date <= _to_date(start_date) and self.end_date >= _to_date(end_date)
+
+    def lookup(self, date_value, stock_code, factor):
+        """
+        单点查询 (日期, 股票, 因子) 的得分，O(1)
+        Returns:
+            float: 0-100 的得分，表中没有时为 0.0
+        """
+        factor_idx = self._factor_pos.get(factor)
+        date_idx = self._date_pos.get(_to_date(date_value))
+        code_idx = self._code_pos.get(_clean_code(stock_code))
+        if factor_idx is None or date_idx is None or code_idx is None:
+            return 0.0
+        return float(self.values[factor_idx, date_idx, code_idx])
+
+    def get_batch(self, dates, codes, factors=None):
+        """
+        批量取 dates x codes 的因子得分
+        Args:
+            dates:   日期列表
+            codes:   股票代码列表
+            factors: 因子列表，默认全部
+        Returns:
+            DataFrame: index 为 (ymd, stock_code)，每个因子一列，缺失为 0
+        """
+        factors = list(factors) if factors else list(self.factors)
+        day_list = [_to_date(day) for day in dates]
+        code_list = [str(code) for code in codes]
+
+        date_idx = np.array([self._date_pos.get(day, -1) for day in day_list], dtype=np.int64)
+        code_idx = np.array([self._code_pos.get(_clean_code(code), -1) for code in code_list], dtype=np.int64)
+        valid = (date_idx[:, None] >= 0) & (code_idx[None, :] >= 0)
+
+        result = {}
+        for name in factors:
+            scores = np.zeros((len(day_list), len(code_list)), dtype=np.float64)
+            if name in self._factor_pos:
+                block = self.values[self._factor_pos[name]][np.ix_(np.maximum(date_idx, 0), np.maximum(code_idx, 0))]
+                scores = np.where(valid, block, 0.0).astype(np.float64)
+            result[name] = scores.ravel()
+
+        index = pd.MultiIndex.from_product([pd.to_datetime(day_list), code_list], names=['ymd', 'stock_code'])
+        return pd.DataFrame(result, index=index)
@@ -0,0 +1,76 @@
+# strategy/scoring_kernels.py
+# 因子打分用的向量化内核：输入输出都是 ndarray，整列一次算完，替代逐行 apply 的标量闭包
+# 各内核的结果与 factor_library 旧版标量函数逐值一致（含 round 到 2 位小数、NaN 记 0 分等细节）
+import numpy as np
+
+
+def _as_float(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def sigmoid_score(values, steepness=0.15, reverse=True, scale=100, decimals=2, fill=0.0):
+    """
+    sigmoid 平滑打分：score = scale * sigmoid(steepness * x)，reverse 时取 1 - sigmoid（x 越小分越高）
+    Args:
+        values:    原始值（如股东人数变化百分比）
+        steepness: 曲线陡峭程度
+        reverse:   True 时 x 越小得分越高
+        scale:     满分
+        decimals:  保留小数位
+        fill:      缺失值的得分
+    Returns:
+        ndarray[float64]
+    """
+    values = _as_float(values)
+    sigmoid = 1 / (1 + np.exp(-values * steepness))
+    scores = np.round(scale * ((1 - sigmoid) if reverse else sigmoid), decimals)
+    return np.where(np.isnan(values), fill, scores)
+
+
+def capped_linear_score(values, per_unit, cap=100, decimals=2):
+    """
+    线性打分：score = min(x * per_unit, cap)，例如每次涨停得 100 / lookback_days 分
+    """
+    return np.round(np.minimum(_as_float(values) * per_unit, cap), decimals)
+
+
+def log2_score(values, max_value, cap=100, decimals=2):
+    """
+    对数打分：score = min(round(log2(x + 1) * cap / log2(max_value + 1)), cap)，x 越大边际得分越低，x = max_value 时满分
+    max_value <= 0 时每单位按 20 分计，与旧版一致
+    """
+    factor = cap / np.log2(max_value + 1) if max_value > 0 else 20
+    return np.minimum(np.round(np.log2(_as_float(values) + 1) * factor, decimals), cap)
+
+
+def binary_score(values, score=100):
+    """x > 0 得满分，否则 0 分"""
+    return np.where(_as_float(values) > 0, float(score), 0.0)
+
+
+def banded_score(values, thresholds, scores, default=0, below=False):
+    """
+    分档打分：按顺序找到第一个满足的档位
+        below=False：values >= thresholds[i] 得 scores[i]，thresholds 从高到低给出
+        below=True： values <  thresholds[i] 得 scores[i]，thresholds 从低到高给出
+    thresholds 的每一项可以是标量，也可以是与 values 等长的数组（例如 vol_ma60 * 0.8）；NaN 不满足任何档位，得 default
+    Returns:
+        ndarray
+    """
+    values = _as_float(values)
+    conditions = [values < threshold if below else values >= threshold for threshold in thresholds]
+    return np.select(conditions, list(scores), default=default)
+
+
+def level_bucket(values, thresholds, labels, default=''):
+    """
+    分级：values >= thresholds[i] 归入 labels[i]（thresholds 为从高到低的标量），都不满足或 NaN 时为 default
+    例如 level_bucket(score, [80, 60, 40, 20], ['A', 'B', 'C', 'D'], default='E')
+    先数出每个值越过了几个阈值得到档位下标，再一次查表取标签，避免 np.select 在字符串数组上逐档复制
+    """
+    values = _as_float(values)
+    position = np.zeros(values.shape, dtype=np.intp)
+    for threshold in thresholds:
+        np.add(position, values >= threshold, out=position)
+    lookup = np.asarray([default] + list(labels)[::-1])
+    return lookup.take(position)
@@ -2,7 +2,7 @@
 import pandas as pd
 import logging
 from CommonProperties.Base_utils import timing_decorator
-from factor_library import FactorLibrary
+from strategy.factor_library import FactorLibrary
 
 logger = logging.getLogger(__name__)
 
@@ -44,91 +44,47 @@ class StrategyEngine:
             logger.error("没有找到交易日数据")
             return pd.DataFrame(columns=['ymd', 'stock_code', 'stock_name'])
 
-        all_selected = []
-
-        # 2. 按每个交易日处理
-        for i, current_date in enumerate(trading_days):
-            logger.debug(f"处理交易日 {i + 1}/{len(trading_days)}: {current_date}")
+        # 2. 整个区间的因子一次取出，经因子缓存，重复调用 / 区间重叠时只计算新增的交易日
+        factors = self.factor_lib.get_factors(['pb', 'shareholder'], start_date, end_date)
+        factors['zt'] = self.factor_lib.get_factor('zt', start_date, end_date, lookback_days=zt_window)
+
+        def signal_frame(factor_df, score_col, signal_col, condition):
+            if factor_df.empty:
+                return pd.DataFrame(columns=['ymd', 'stock_code', signal_col])
+            signal_df = pd.DataFrame({'ymd': pd.to_datetime(factor_df['ymd'].astype(str)).dt.strftime('%Y%m%d'),
+                                      'stock_code': factor_df['stock_code'].astype(str)})
+            signal_df[signal_col] = condition(factor_df[score_col].to_numpy())
+            return signal_df
+
+        # 3. 得分 -> 信号：PB 处于当日最低 pb_quantile 分位、回溯窗口内有涨停、股东人数减少
+        pb_df = signal_frame(factors['pb'], 'pb_score', 'pb_signal', lambda score: score >= (1 - pb_quantile) * 100)
+        if pb_df.empty:
+            logger.warning(f"{start_date} ~ {end_date}: PB因子数据为空")
+            return pd.DataFrame(columns=['ymd', 'stock_code', 'stock_name', 'factor_count'])
+        zt_df = signal_frame(factors['zt'], 'zt_score', 'zt_signal', lambda score: score > 0)
+        shareholder_df = signal_frame(factors['shareholder'], 'shareholder_score', 'shareholder_signal',
+                                      lambda score: score > 50)
+
+        # 4. 合并因子数据（左连接，以PB数据为基准）
+        merged = (pb_df.merge(zt_df, on=['ymd', 'stock_code'], how='left')
+                  .merge(shareholder_df, on=['ymd', 'stock_code'], how='left'))
+
+        # 5. 处理缺失值
+        merged['zt_signal'] = merged['zt_signal'].fillna(False).astype(bool)
+        merged['shareholder_signal'] = merged['shareholder_signal'].fillna(False).astype(bool)
+
+        # 6. 计算因子得分
+        merged['factor_count'] = (
+                merged['pb_signal'].astype(int) +
+                merged['zt_signal'].astype(int) +
+                merged['shareholder_signal'].astype(int)
+        )
 
-            try:
-                # 3. 获取当日的因子数据
-                # 3.1 PB因子
-                pb_df_day = self.factor_lib.pb_factor(
-                    start_date=current_date,
-                    end_date=current_date,
-                    pb_percentile=pb_quantile
-                )
-
-                if pb_df_day.empty:
-                    logger.warning(f"{current_date}: PB因子数据为空")
-                    continue
-
-                # 3.2 涨停因子
-                zt_df_day = self.factor_lib.zt_factor(
-                    start_date=current_date,
-                    end_date=current_date,
-                    lookback_days=zt_window
-                )
-
-                # 3.3 筹码因子
-                shareholder_df_day = self.factor_lib.shareholder_factor(
-                    start_date=current_date,
-                    end_date=current_date
-                )
-
-                # 4. 合并因子数据（左连接，以PB数据为基准）
-                merged = pb_df_day[['stock_code', 'pb_signal']].copy()
-
-                # 4.1 合并涨停因子
-                if not zt_df_day.empty:
-                    merged = merged.merge(
-                        zt_df_day[['stock_code', 'zt_signal']],
-                        on='stock_code',
-                        how='left'
-                    )
-                else:
-                    merged['zt_signal'] = False
-
-                # 4.2 合并筹码因子
-                if not shareholder_df_day.empty:
-                    merged = merged.merge(
-                        shareholder_df_day[['stock_code', 'shareholder_signal']],
-                        on='stock_code',
-                        how='left'
-                    )
-                else:
-                    merged['shareholder_signal'] = False
-
-                # 5. 处理缺失值
-                merged['zt_signal'] = merged['zt_signal'].fillna(False)
-                merged['shareholder_signal'] = merged['shareholder_signal'].fillna(False)
-
-                # 6. 计算因子得分
-                merged['factor_count'] = (
-                        merged['pb_signal'].astype(int) +
-                        merged['zt_signal'].astype(int) +
-                        merged['shareholder_signal'].astype(int)
-                )
-
-                # 7. 筛选股票
-                selected_day = merged[merged['factor_count'] >= min_factor_count].copy()
-
-                if not selected_day.empty:
-                    # 添加日期信息
-                    selected_day['ymd'] = current_date
-
-                    # 添加股票名称（从PB数据获取）
-                    if 'stock_name' in pb_df_day.columns:
-                        stock_names = pb_df_day.set_index('stock_code')['stock_name'].to_dict()
-                        selected_day['stock_name'] = selected_day['stock_code'].map(stock_names)
-
-                    all_selected.append(selected_day[['ymd', 'stock_code', 'stock_name', 'factor_count']])
-
-                    logger.debug(f"{current_date}: 选中 {len(selected_day)} 只股票")
-
-            except Exception as e:
-                logger.error(f"处理交易日 {current_date} 失败: {str(e)}")
-                continue
+        # 7. 筛选股票，添加股票名称
+        selected = merged[merged['factor_count'] >= min_factor_count].copy()
+        stock_names = self.factor_lib.stocks_df.assign(stock_code=self.factor_lib.stocks_df['stock_code'].astype(str))
+        selected['stock_name'] = selected['stock_code'].map(stock_names.set_index('stock_code')['stock_name'])
+        all_selected = [selected[['ymd', 'stock_code', 'stock_name', 'factor_count']]] if not selected.empty else []
 
         # 8. 合并所有交易日结果
         if all_selected: